@@ -0,0 +1,121 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from broadcast import BroadcastServer
+from clock import PlaybackClock
+from playback import MediaInfo
+from timeline import LyricTimeline
+
+# Load test of broadcast.py: a display loop switches lines of a fast synthetic sheet on its own timers while a
+# second process holds hundreds of Server-Sent Events connections. Reports how late the display loop's line
+# switches were and how long line events took to reach the clients, for a growing number of clients.
+# usage: python benchmarks/bench_broadcast.py [seconds]
+
+CLIENT_COUNTS = (0, 100, 300, 600)
+LINE_GAP_MS = (150, 400)
+# the player reports its position this often, each report moves the clock's anchor
+SAMPLE_INTERVAL = 1.0
+
+def make_timeline(seconds, rng):
+    lines = []
+    ms = 0
+    while ms < (seconds + 5) * 1000:
+        lines.append((ms, f"line {len(lines)} " + "la " * rng.randint(2, 8), ()))
+        ms += rng.randint(*LINE_GAP_MS)
+    return LyricTimeline(lines)
+
+def run_clients(port, count, seconds, connected, results):
+    async def client(latencies, ready):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b"GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        await reader.readuntil(b'\r\n\r\n')
+        ready()
+        kind = None
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            if line.startswith(b'event: '):
+                kind = line[7:].strip()
+            elif line.startswith(b'data: ') and kind == b'line':
+                latencies.append(time.time() * 1000 - json.loads(line[6:])['time'])
+
+    async def main():
+        latencies = []
+        remaining = [count]
+
+        def ready():
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                connected.set()
+        tasks = [asyncio.ensure_future(client(latencies, ready)) for _ in range(count)]
+        await asyncio.sleep(seconds + 2)
+        for task in tasks:
+            task.cancel()
+        results.put(latencies)
+    asyncio.run(main())
+
+async def display(server, timeline, seconds):
+    # what LyricPipeline.display_lyrics does around the broadcaster: show the sheet, then wake at each line
+    # boundary and hand over the clock, which only crosses threads when a position report moved it
+    clock = PlaybackClock()
+    clock.reset(0.0, playing=True)
+    server.show_track(MediaInfo("Load Test", "Bench", "", duration=seconds), timeline, ('#1a1a1a', '#ffffff', '#8d8d8d'), clock)
+    lateness = []
+    next_sample = clock.monotonic() + SAMPLE_INTERVAL
+    while clock.now()[0] < seconds:
+        position_ms = int(clock.now()[0] * 1000)
+        until_next = timeline.ms_until_next(position_ms)
+        due = time.monotonic() + until_next / 1000
+        await asyncio.sleep(until_next / 1000)
+        lateness.append((time.monotonic() - due) * 1000)
+        if time.monotonic() >= next_sample:
+            now = time.monotonic()
+            clock.add_sample(clock.position_at(now), now)
+            next_sample = now + SAMPLE_INTERVAL
+        server.update_clock(clock)
+    return lateness
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    timeline = make_timeline(seconds, random.Random(24))
+    context = multiprocessing.get_context('spawn')
+    print(f"{seconds:.0f} s of lines every {LINE_GAP_MS[0]}-{LINE_GAP_MS[1]} ms, {os.cpu_count()} cpu")
+    for count in CLIENT_COUNTS:
+        server = BroadcastServer(port=0)
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                server.start()
+            finally:
+                sys.stdout = stdout
+        results = context.Queue()
+        connected = context.Event()
+        clients = None
+        if count:
+            clients = context.Process(target=run_clients, args=(server.port, count, seconds, connected, results))
+            clients.start()
+            connected.wait(30)
+        lateness = asyncio.run(display(server, timeline, seconds))
+        latencies = results.get() if clients else []
+        if clients:
+            clients.join()
+        server.stop()
+        lateness.sort()
+        line = (f"{count:4d} clients: line switch late p50 {statistics.median(lateness):5.2f} ms, "
+                f"p99 {lateness[int(len(lateness) * 0.99)]:5.2f} ms")
+        if latencies:
+            latencies.sort()
+            line += (f"; delivery p50 {statistics.median(latencies):5.1f} ms, p99 {latencies[int(len(latencies) * 0.99)]:5.1f} ms, "
+                     f"{len(latencies)} line events received, {server.dropped} dropped")
+        print(line)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import asyncio
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import playback
+from clock import PlaybackClock
+
+# Replays synthetic jittery position traces through PlaybackClock and compares it with extrapolating the
+# last reported sample, then times the first synced line with and without the old pause/play baseline.
+# usage: python benchmarks/bench_clock.py [traces]
+
+STEP = 0.05
+
+def synthetic_trace(rng, length=240.0):
+    # yields (true time, event) where event is ('sample', position, sampled_at, playing) or ('probe', true position, playing)
+    rate = 1.0 + rng.uniform(-0.004, 0.004)
+    jitter = rng.choice((0.01, 0.04, 0.1))
+    position = rng.uniform(0, 30)
+    playing = True
+    next_sample = 0.0
+    events = []
+    t = 0.0
+    seeks = 0
+    while t < length:
+        if t >= next_sample:
+            # the player reports a position, stamped a little late or early
+            reported = position + rng.gauss(0, jitter / 2)
+            events.append((t, ('sample', reported, t + rng.gauss(0, jitter), playing)))
+            next_sample = t + rng.uniform(0.5, 6.0)
+        roll = rng.random()
+        if roll < 0.0015:
+            position = rng.uniform(0, 200)
+            seeks += 1
+            next_sample = t
+        elif roll < 0.0025:
+            playing = not playing
+            next_sample = t
+        events.append((t, ('probe', position, playing)))
+        if playing:
+            position += STEP * rate
+        t += STEP
+    return events, seeks
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def run_trace(events):
+    clock = PlaybackClock()
+    naive = playback.PlaybackState()
+    clock_errors = []
+    naive_errors = []
+    covered = 0
+    detected = 0
+    for t, event in events:
+        if event[0] == 'sample':
+            _, reported, sampled_at, playing = event
+            detected += clock.add_sample(reported, sampled_at, playing)
+            naive.position = reported
+            naive.position_updated = sampled_at
+            naive.status = playback.PLAYING if playing else playback.PAUSED
+        else:
+            _, position, playing = event
+            estimate, bound = clock.now(t)
+            clock_errors.append(abs(estimate - position))
+            naive_errors.append(abs(naive.position_now(t) - position))
+            covered += abs(estimate - position) <= bound
+    return clock_errors, naive_errors, covered, detected
+
+async def first_line_latency(pause_baseline):
+    # time from the track change to the first line boundary being computed, mirroring display_lyrics
+    source = playback.FakeMediaSource()
+    engine = playback.PlaybackEngine(source)
+    await engine.start()
+    source.set_track('player', 'Song', 'Artist', duration=200.0, position=12.0)
+    await engine.wait_for_change(1)
+    start = time.perf_counter()
+    if pause_baseline:
+        source.set_status('player', playback.PAUSED)
+        await asyncio.sleep(0.5)
+        source.set_status('player', playback.PLAYING)
+        await engine.wait_for_change(1)
+    engine.clock.now()
+    return time.perf_counter() - start
+
+def main():
+    traces = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = random.Random(42)
+    clock_errors = []
+    naive_errors = []
+    covered = 0
+    seeks = 0
+    detected = 0
+    for _ in range(traces):
+        events, trace_seeks = synthetic_trace(rng)
+        errors, naive, trace_covered, trace_detected = run_trace(events)
+        clock_errors += errors
+        naive_errors += naive
+        covered += trace_covered
+        seeks += trace_seeks
+        detected += trace_detected
+    print(f"{traces} traces, {len(clock_errors)} probes")
+    for name, errors in (('last sample', naive_errors), ('PlaybackClock', clock_errors)):
+        mean = sum(errors) / len(errors)
+        rms = math.sqrt(sum(e * e for e in errors) / len(errors))
+        print(f"{name:14} mean {mean * 1000:6.1f} ms  rms {rms * 1000:6.1f} ms  p95 {percentile(errors, 0.95) * 1000:6.1f} ms  p99 {percentile(errors, 0.99) * 1000:7.1f} ms")
+    print(f"inside bound   {covered / len(clock_errors):6.1%}")
+    print(f"seeks          {detected} detected of {seeks}")
+    old = asyncio.run(first_line_latency(True))
+    new = asyncio.run(first_line_latency(False))
+    print(f"first synced line  pause/play {old * 1000:6.1f} ms  clock {new * 1000:6.1f} ms  saved {(old - new) * 1000:6.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lrclibclient
+import ranking
+from lrclibstub import StubServer, make_record
+from replay import SYNTHETIC_WORDS, synthetic_lyrics
+
+# A listening session against the local lrclib stub with skips, replays and two players flipping between the
+# same song, one of them decorating the title. Every track change starts ranking.find_lyrics and cancels the
+# search of the track left behind, as the pipeline does. Counts the requests reaching the stub and the time
+# from a track change to its match, with the plain client and with CoalescingClient in front of it.
+# usage: python benchmarks/bench_coalesce.py [changes]
+
+LATENCY = 0.15
+# how long a skipped track stays on before the next change
+SKIP_AFTER = 0.05
+
+def make_catalogue(count, rng):
+    tracks = []
+    for number in range(count):
+        title = f"{' '.join(rng.choice(SYNTHETIC_WORDS) for _ in range(2)).title()} {number}"
+        artist = f"Artist {number}"
+        tracks.append((title, artist, rng.randint(150, 300)))
+    records = [make_record(number, title, artist, '', duration, synthetic_lyrics(title, artist, duration))
+               for number, (title, artist, duration) in enumerate(tracks)]
+    return tracks, records
+
+def make_session(tracks, changes, rng):
+    # (tracks shown together, whether the listener stays on them)
+    session = []
+    recent = []
+    while len(session) < changes:
+        track = rng.choice(recent[-5:]) if recent and rng.random() < 0.3 else rng.choice(tracks)
+        recent.append(track)
+        kind = rng.random()
+        if kind < 0.3:
+            # skipped, something else, then back to it
+            other = rng.choice(tracks)
+            session += [([track], False), ([other], False), ([track], True)]
+        elif kind < 0.5:
+            # a second player shows the same song with the remaster suffix it uses
+            title, artist, duration = track
+            session.append(([track, (f"{title} - Remastered 2011", artist, duration)], True))
+        else:
+            session.append(([track], True))
+    return session
+
+async def play(client, session):
+    latencies = []
+    searches = []
+    for shown, stays in session:
+        for search in searches:
+            search.cancel()
+        started = time.perf_counter()
+        searches = [asyncio.ensure_future(ranking.find_lyrics(client, title, artist, '', duration))
+                    for title, artist, duration in shown]
+        if not stays:
+            await asyncio.sleep(SKIP_AFTER)
+            continue
+        for search in searches:
+            await search
+            latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+async def run(server, session, coalesce):
+    client = lrclibclient.LrcLibClient(user_agent="bench", base_url=server.base_url)
+    if coalesce:
+        client = lrclibclient.CoalescingClient(client)
+    requests = server.requests
+    latencies = await play(client, session)
+    client.close()
+    return server.requests - requests, latencies, client
+
+def main():
+    changes = int(sys.argv[1]) if len(sys.argv) > 1 else 80
+    rng = random.Random(22)
+    tracks, records = make_catalogue(60, rng)
+    session = make_session(tracks, changes, rng)
+    server = StubServer(records, latency=LATENCY).start()
+    print(f"{len(session)} track changes, {LATENCY * 1000:.0f} ms stub latency")
+    for name, coalesce in (('plain client', False), ('coalescing', True)):
+        requests, latencies, client = asyncio.run(run(server, session, coalesce))
+        latencies.sort()
+        line = (f"{name:13s} {requests:4d} requests, match after median {statistics.median(latencies):5.0f} ms, "
+                f"p95 {latencies[int(len(latencies) * 0.95)]:5.0f} ms")
+        if coalesce:
+            line += f"; {client.hits} hits, {client.misses} misses, {client.coalesced} coalesced"
+        print(line)
+    server.stop()
+
+if __name__ == '__main__':
+    main()
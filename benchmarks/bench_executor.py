@@ -0,0 +1,96 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cv2
+import lrcparser
+import lyricstore
+from bench_lrcparser import synthetic_sheet
+from executor import LoopWatchdog, WorkExecutor, inline
+from palettecache import PaletteCache
+from run import synthetic_cover
+from timeline import LyricTimeline
+import random
+
+# Loop lag while the pipeline's blocking work (palette of a new cover, lyric store reads and writes, a slow
+# synchronous provider) runs on the loop versus through WorkExecutor. A 4 ms ticker stands in for the overlay
+# and the lyric clock; its lateness is what a line switch would suffer. Also checks that cancel(group) drops queued
+# jobs of a skipped track.
+# usage: python benchmarks/bench_executor.py [tracks]
+
+TICK = 0.004
+PROVIDER_DELAY = 0.05
+
+def slow_provider(sheet):
+    # syncedlyrics and friends, a blocking HTTP round-trip
+    time.sleep(PROVIDER_DELAY)
+    return sheet
+
+async def ticker(lags, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + TICK
+        await asyncio.sleep(TICK)
+        lags.append(max(loop.time() - expected, 0.0) * 1000)
+
+async def track_changes(executor, covers, sheets, directory):
+    store = lyricstore.LyricStore(os.path.join(directory, f"lyrics-{id(executor)}.db"))
+    palettes = PaletteCache(os.path.join(directory, f"palettes-{id(executor)}.db"))
+    for number, (cover, sheet) in enumerate(zip(covers, sheets)):
+        key = f"track {number}"
+        await executor.io(store.get, key, group=key)
+        raw = await executor.io(slow_provider, sheet, group=key)
+        timeline = LyricTimeline(lrcparser.parse_lrc(raw))
+        await executor.io(store.put, key, raw, timeline, group=key)
+        await palettes.get_async(cover, executor, key)
+        await asyncio.sleep(0.02)
+    store.close()
+    palettes.close()
+
+async def measure(executor, covers, sheets, directory):
+    lags = []
+    stop = asyncio.Event()
+    watchdog = LoopWatchdog()
+    watchdog.start()
+    tick = asyncio.ensure_future(ticker(lags, stop))
+    start = time.perf_counter()
+    await track_changes(executor, covers, sheets, directory)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick
+    watchdog.stop()
+    lags.sort()
+    return lags[len(lags) // 2], lags[int(len(lags) * 0.99)], lags[-1], watchdog.stalls, elapsed
+
+async def cancellation(executor):
+    # a skipped track leaves jobs queued behind a busy pool, cancel() should keep them from ever running
+    ran = []
+    blockers = [asyncio.ensure_future(executor.io(time.sleep, 0.1, group='current')) for _ in range(4)]
+    await asyncio.sleep(0.01)
+    queued = [asyncio.ensure_future(executor.io(ran.append, number, group='skipped')) for number in range(8)]
+    await asyncio.sleep(0.01)
+    cancelled = executor.cancel('skipped')
+    await asyncio.gather(*blockers, *queued, return_exceptions=True)
+    return cancelled, len(ran)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    rng = random.Random(4)
+    covers = [cv2.imencode('.jpg', synthetic_cover(1280, seed))[1].tobytes() for seed in range(count)]
+    sheets = [synthetic_sheet(rng) for _ in range(count)]
+    directory = tempfile.mkdtemp()
+    print(f"{count} track changes, 1280 px covers, {PROVIDER_DELAY * 1000:.0f} ms blocking provider")
+    executor = WorkExecutor()
+    executor.warm_up(int)
+    for label, runner in (('on the loop', inline), ('executor', executor)):
+        p50, p99, worst, stalls, elapsed = asyncio.run(measure(runner, covers, sheets, directory))
+        print(f"{label:12} tick lag p50 {p50:6.2f}  p99 {p99:7.2f}  max {worst:7.2f} ms  {stalls:3} stalls  {elapsed:5.2f} s")
+    cancelled, ran = asyncio.run(cancellation(executor))
+    print(f"cancel       {cancelled} queued jobs cancelled, {ran} of them ran")
+    executor.shutdown()
+
+if __name__ == '__main__':
+    main()
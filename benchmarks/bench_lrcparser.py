@@ -0,0 +1,91 @@
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lrcparser
+
+# Compares lrcparser against the strptime based parse_lyric_file that working.py used before.
+# usage: python benchmarks/bench_lrcparser.py [directory with .lrc files]
+
+TARGET_SPEEDUP = 20
+
+def convert_to_timedelta(time_string):
+    clean_time_string = time_string.strip("[]")
+    time_obj = datetime.strptime(clean_time_string, "%M:%S.%f")
+    return timedelta(minutes=time_obj.minute, seconds=time_obj.second, milliseconds=time_obj.microsecond / 1000)
+
+def parse_lyric_file(file_content):
+    pattern = re.compile(r"\[(\d{2}:\d{2}\.\d{2})\] (.+)")
+    lyrics = []
+    for line in file_content.split("\n"):
+        match = pattern.match(line)
+        if match:
+            time_string, text = match.groups()
+            time_delta = convert_to_timedelta(time_string)
+            lyrics.append((time_delta, text))
+    return lyrics
+
+WORDS = "love night heart baby dance fire never away tonight feel light rain dream home time world".split()
+
+def stamp(ms, digits=2):
+    fraction = f"{ms % 1000:03d}"[:digits]
+    return f"{ms // 60000:02d}:{ms // 1000 % 60:02d}.{fraction}"
+
+def synthetic_sheet(rng):
+    # mostly lrclib style sheets, some with the extended syntax the old parser dropped
+    ms = rng.randint(0, 15000)
+    lines = []
+    extended = rng.random() < 0.1
+    if extended:
+        lines.append(f"[ar:Artist {rng.randint(0, 999)}]")
+        lines.append(f"[offset:{rng.randint(-300, 300)}]")
+    for _ in range(rng.randint(30, 90)):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 9))).capitalize()
+        if extended and rng.random() < 0.2:
+            lines.append(f"[{stamp(ms, 3)}][{stamp(ms + 60000)}]{text}")
+        elif extended and rng.random() < 0.1:
+            lines.append(f"[{stamp(ms)}]")
+        else:
+            lines.append(f"[{stamp(ms)}] {text}")
+        ms += rng.randint(1500, 6000)
+    return "\n".join(lines) + "\n"
+
+def load_corpus(directory):
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.lrc'):
+            with open(os.path.join(directory, name), 'r', encoding='utf-8') as file:
+                corpus.append(file.read())
+    return corpus
+
+def best_time(function, corpus, repeats=3):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for sheet in corpus:
+            function(sheet)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main():
+    if len(sys.argv) > 1:
+        corpus = load_corpus(sys.argv[1])
+    else:
+        rng = random.Random(1234)
+        corpus = [synthetic_sheet(rng) for _ in range(3000)]
+    lines = sum(sheet.count("\n") for sheet in corpus)
+    old = best_time(parse_lyric_file, corpus)
+    new = best_time(lrcparser.parse_lrc, corpus)
+    print(f"{len(corpus)} files, {lines} lines")
+    print(f"parse_lyric_file  {old * 1000:8.1f} ms  {old / lines * 1e6:6.2f} us/line")
+    print(f"lrcparser         {new * 1000:8.1f} ms  {new / lines * 1e6:6.2f} us/line")
+    print(f"speedup           {old / new:8.1f}x (target {TARGET_SPEEDUP}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import asyncio
+import contextlib
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lrclibclient
+import lyricstore
+import prefetch
+from lrclibstub import StubServer, make_record
+from replay import SYNTHETIC_WORDS, synthetic_lyrics
+
+# Prefetches a synthetic playlist export from the local lrclib stub, which answers after LATENCY and fails
+# ERROR_RATE of the requests with a 503. Compares one worker with many under the same rate limit, then
+# interrupts a run halfway and resumes it from its checkpoint.
+# usage: python benchmarks/bench_prefetch.py [tracks]
+
+LATENCY = 0.05
+ERROR_RATE = 0.05
+RATE = 100
+WORKERS = 16
+# share of playlist tracks lrclib has
+KNOWN = 0.9
+
+def make_playlist(count, rng):
+    tracks = []
+    records = []
+    for number in range(count):
+        title = f"{' '.join(rng.choice(SYNTHETIC_WORDS) for _ in range(2)).title()} {number}"
+        artist = f"Artist {rng.randint(0, count // 10)}"
+        duration = rng.randint(150, 300)
+        tracks.append((title, artist, f"Album {number // 12}", duration))
+        if rng.random() < KNOWN:
+            records.append(make_record(number, title, artist, f"Album {number // 12}", duration,
+                                       synthetic_lyrics(title, artist, duration)))
+    return tracks, records
+
+def write_csv(path, tracks):
+    # Exportify's column names
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Track Name', 'Artist Name(s)', 'Album Name', 'Duration (ms)'])
+        for title, artist, album, duration in tracks:
+            writer.writerow([title, artist, album, duration * 1000])
+
+async def run(server, playlist, directory, name, workers, timeout=None):
+    store = lyricstore.LyricStore(os.path.join(directory, f"{name}.db"))
+    checkpoint = prefetch.Checkpoint(os.path.join(directory, f"{name}.jsonl"))
+    api = lrclibclient.LrcLibClient(user_agent="bench", base_url=server.base_url, max_connections=workers)
+    tracks = await prefetch.load_tracks(playlist, None)
+    requests = server.requests
+    start = time.perf_counter()
+    job = asyncio.ensure_future(prefetch.prefetch(tracks, store, checkpoint, api, rate=RATE, workers=workers,
+                                                  report_interval=3600))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            progress = await asyncio.wait_for(job, timeout)
+    except asyncio.TimeoutError:
+        progress = None
+    elapsed = time.perf_counter() - start
+    stored = len(store)
+    checkpoint.close()
+    api.close()
+    store.close()
+    return progress, elapsed, server.requests - requests, stored
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    rng = random.Random(21)
+    tracks, records = make_playlist(count, rng)
+    server = StubServer(records, latency=LATENCY, error_rate=ERROR_RATE).start()
+    with tempfile.TemporaryDirectory() as directory:
+        playlist = os.path.join(directory, 'playlist.csv')
+        write_csv(playlist, tracks)
+        print(f"{count} tracks, {len(records)} on the stub, {LATENCY * 1000:.0f} ms latency, {ERROR_RATE:.0%} 503s, "
+              f"limit {RATE} requests/s")
+        for name, workers in (('sequential', 1), ('parallel', WORKERS)):
+            progress, elapsed, requests, stored = asyncio.run(run(server, playlist, directory, name, workers))
+            print(f"{workers:2d} workers: {progress.rate():6.1f} tracks/s, {progress.found} found, {progress.missing} missing, "
+                  f"{progress.failed} failed, {requests} requests ({requests / elapsed:.0f}/s), {progress.retries} retries")
+
+        _, _, first_requests, first_stored = asyncio.run(run(server, playlist, directory, 'resumed', WORKERS, timeout=1.0))
+        progress, _, requests, stored = asyncio.run(run(server, playlist, directory, 'resumed', WORKERS))
+        print(f"interrupted after 1 s with {first_stored} tracks stored, {first_requests} requests; the resumed run "
+              f"skipped {progress.skipped} tracks and made {requests} more requests, {stored} stored in total")
+    server.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import providers
+from playback import MediaInfo
+from replay import synthetic_lyrics
+
+# Local fake providers behind the old sequential fallback (lrclib, then syncedlyrics trying its providers one
+# after another and taking whatever comes back) and behind providers.ProviderRace. Musixmatch, which
+# syncedlyrics asks first, hangs until its deadline for the first half of the run and then recovers, NetEase
+# sometimes has the sheet of another cut and Megalobiz sometimes only plain text. Times are scaled down by
+# SCALE so the run takes seconds.
+# usage: python benchmarks/bench_providers.py [tracks]
+
+SCALE = 0.1
+DEADLINE = providers.DEADLINE * SCALE
+FALLBACK_DELAY = providers.FALLBACK_DELAY * SCALE
+COOLDOWN = providers.COOLDOWN * SCALE
+
+# name -> (latency seconds, share of tracks it has, share of those that are another cut, share that are plain)
+FAKES = {
+    'lrclib': (0.25, 0.6, 0.0, 0.0),
+    'Musixmatch': (0.6, 0.8, 0.0, 0.0),
+    'NetEase': (0.4, 0.7, 0.15, 0.0),
+    'Megalobiz': (1.5, 0.5, 0.0, 0.3),
+}
+
+def roll(*parts):
+    # deterministic per track and provider, so both strategies see the same catalogue
+    return int.from_bytes(hashlib.blake2b('|'.join(map(str, parts)).encode(), digest_size=4).digest(), 'big') / 2 ** 32
+
+class FakeProvider:
+    def __init__(self, name):
+        self.name = name
+        self.latency, self.has, self.other_cut, self.plain = FAKES[name]
+        self.down = False
+        self.calls = 0
+
+    async def search(self, media_info):
+        self.calls += 1
+        if self.down:
+            await asyncio.sleep(3600)
+        await asyncio.sleep(self.latency * SCALE * (0.5 + roll(media_info.title, self.name, 'latency')))
+        if roll(media_info.title, self.name) >= self.has:
+            return None
+        kind = roll(media_info.title, self.name, 'kind')
+        if kind < self.other_cut:
+            return synthetic_lyrics(media_info.title, media_info.artist, media_info.duration * 2)
+        if kind < self.other_cut + self.plain:
+            return "just\nplain\nlines\n"
+        return synthetic_lyrics(media_info.title, media_info.artist, media_info.duration)
+
+async def sequential(fakes, media_info):
+    # the old path: lrclib, then syncedlyrics walking its providers, the first non empty answer is taken
+    for fake in fakes:
+        try:
+            lyrics = await asyncio.wait_for(fake.search(media_info), DEADLINE)
+        except asyncio.TimeoutError:
+            continue
+        if lyrics:
+            return fake.name, lyrics
+    raise Exception('No lyrics found in both methods')
+
+def make_race(fakes):
+    race = []
+    for fake in fakes:
+        provider = providers.Provider(fake.name, fake.search, DEADLINE, 0.0 if fake.name == 'lrclib' else FALLBACK_DELAY)
+        provider.breaker = providers.CircuitBreaker(cooldown=COOLDOWN)
+        race.append(provider)
+    return providers.ProviderRace(race)
+
+async def run(strategy, count):
+    fakes = [FakeProvider(name) for name in FAKES]
+    musixmatch = fakes[1]
+    race = make_race(fakes) if strategy == 'race' else None
+    times = []
+    wrong = 0
+    outage_calls = 0
+    for number in range(count):
+        # Musixmatch is down for the first half
+        musixmatch.down = number < count // 2
+        calls = musixmatch.calls
+        media_info = MediaInfo(f"Track {number}", "Artist", "", duration=180 + number % 60)
+        start = time.perf_counter()
+        try:
+            if race:
+                _, lyrics, _ = await race.fetch(media_info)
+            else:
+                _, lyrics = await sequential(fakes, media_info)
+        except Exception:
+            lyrics = None
+        elapsed = time.perf_counter() - start
+        if musixmatch.down:
+            outage_calls += musixmatch.calls - calls
+        if lyrics:
+            times.append(elapsed / SCALE)
+            wrong += providers.check_lyrics(lyrics, media_info.duration) is not None
+    return times, wrong, outage_calls, sum(fake.calls for fake in fakes), race
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 80
+    print(f"{count} tracks, Musixmatch down for the first {count // 2}, times at full scale")
+    for strategy in ('sequential', 'race'):
+        times, wrong, outage_calls, calls, race = asyncio.run(run(strategy, count))
+        times.sort()
+        print(f"{strategy:10s} lyrics for {len(times)}/{count}, {wrong} unusable, "
+              f"time to lyrics median {statistics.median(times) * 1000:5.0f} ms p95 {times[int(len(times) * 0.95)] * 1000:5.0f} ms, "
+              f"{calls} provider calls, {outage_calls} to Musixmatch while down")
+        if race:
+            print(race.report())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import ranking
+from lrclibclient import SearchResult
+from lrclibstub import make_record, matches
+
+# Compares the ranking engine with the old first-level-wins cascade on a labelled fixture: tracks as a player
+# reports them, a catalogue holding the right record next to covers, karaoke cuts, instrumentals, unsynced
+# copies and same-titled songs, and the id that should be picked (None when the catalogue lacks the song).
+# usage: python benchmarks/bench_ranking.py [cases] [seed]
+
+SYLLABLES = "la mo ri ta ne ko su vi da pe lu go ra mi no ka be zo".split()
+SYNCED = "[00:01.00] la\n"
+
+def word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+def name(rng, words):
+    return " ".join(word(rng) for _ in range(words))
+
+def legacy_choose(results, duration):
+    # the duration/instrumental/synced filter get_lyrics_from_api used before, without the printing
+    durations = np.array([result.duration for result in results])
+    instrumentals = np.array([result.instrumental for result in results])
+    synced_lyrics_available = np.array([result.synced_lyrics is not None for result in results])
+    differences = np.abs(durations - duration)
+    valid_indices = np.where(differences < 10)[0]
+    if len(valid_indices) == 0:
+        return None
+    min_difference = np.min(differences[valid_indices])
+    closest_indices = valid_indices[differences[valid_indices] == min_difference]
+    filtered_indices = closest_indices[~instrumentals[closest_indices]]
+    final_indices = filtered_indices[synced_lyrics_available[filtered_indices]]
+    if len(final_indices) == 0:
+        final_indices = filtered_indices
+    if len(final_indices) == 0:
+        final_indices = closest_indices
+    return results[final_indices[0]]
+
+def legacy_levels(title, artist, album):
+    return [
+        [dict(track_name=title, artist_name=artist, album_name=album)],
+        [dict(track_name=title, artist_name=artist)],
+        [dict(track_name=title, artist_name=artist.replace(" e ", " ")),
+         dict(track_name=title, artist_name=artist.split(",")[0]),
+         dict(track_name=title.split("(")[0], artist_name=artist.split(",")[0])],
+        [dict(track_name=title)],
+    ]
+
+# the first-level-wins cascade lrclibclient ran before ranking.py, kept here as the baseline
+
+async def search_cascade(client, levels, deadline=None):
+    # levels is a priority ordered list of query lists (keyword dicts for search_lyrics). Every query starts at once,
+    # the results of a level are the concatenation of its queries and the first non empty level wins as soon as
+    # all levels above it have come back empty. Queries that can no longer win are cancelled.
+    tasks = [[asyncio.ensure_future(client.search_lyrics(**query)) for query in level] for level in levels]
+    try:
+        return await asyncio.wait_for(first_level_with_results(tasks), deadline)
+    finally:
+        for level in tasks:
+            for task in level:
+                task.cancel()
+
+async def first_level_with_results(tasks):
+    for level in tasks:
+        results = []
+        for outcome in await asyncio.gather(*level, return_exceptions=True):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            if isinstance(outcome, Exception):
+                print("lyrics search failed:", outcome)
+                continue
+            results += outcome
+        if results:
+            return results
+    return []
+
+class CatalogueClient:
+    # answers search_lyrics like lrclibstub does, counting the calls
+    def __init__(self, records):
+        self.records = records
+        self.calls = 0
+
+    async def search_lyrics(self, track_name=None, artist_name=None, album_name=None, query=None):
+        self.calls += 1
+        params = {key: value for key, value in (('track_name', track_name), ('artist_name', artist_name),
+                                                ('album_name', album_name), ('q', query)) if value}
+        return [SearchResult(record) for record in self.records if matches(record, params)][:20]
+
+def make_case(rng, kind, next_id):
+    # returns (player title, artist, album, duration, catalogue records, expected id)
+    title = name(rng, rng.randint(1, 3))
+    artist = name(rng, rng.randint(1, 2))
+    album = name(rng, rng.randint(1, 2))
+    duration = round(rng.uniform(150, 300))
+    records = []
+
+    def add(track, by, length, synced=True, instrumental=False, on_album=album):
+        record = make_record(next_id(), track, by, on_album, duration=length, synced_lyrics=SYNCED if synced else None,
+                             instrumental=instrumental)
+        records.append(record)
+        return record['id']
+
+    # noise every case has: covers and karaoke cuts of the same title
+    for _ in range(rng.randint(1, 4)):
+        add(title, name(rng, 2), duration + rng.randint(-3, 3), on_album=name(rng, 1))
+    add(f"{title} (Karaoke Version)", "Karaoke Hits", duration, on_album="Karaoke")
+
+    player_title, player_artist, player_album = title, artist, album
+    if kind == 'exact':
+        expected = add(title, artist, duration + rng.randint(-1, 1))
+    elif kind == 'remaster':
+        player_title = f"{title} - Remastered {rng.randint(1995, 2022)}"
+        expected = add(title, artist, duration + rng.randint(-1, 1))
+    elif kind == 'featuring':
+        guest = name(rng, 1)
+        player_title = f"{title} (feat. {guest})"
+        expected = add(title, f"{artist} feat. {guest}", duration + rng.randint(-1, 1))
+    elif kind == 'artist_format':
+        other = name(rng, 1)
+        player_artist = f"{artist}, {other}"
+        expected = add(title, f"{artist} & {other}", duration + rng.randint(-2, 2))
+    elif kind == 'article':
+        player_artist = f"The {artist}"
+        expected = add(title, artist, duration + rng.randint(-2, 2))
+    elif kind == 'versions':
+        # the right artist has an instrumental and an unsynced copy next to the synced record
+        add(title, artist, duration, instrumental=True, synced=False)
+        add(title, artist, duration, synced=False)
+        expected = add(title, artist, duration + rng.choice((-2, 2)))
+    elif kind == 'duration_off':
+        # a rip or a release with a longer intro: the right song 7-9 s off and no album to go by
+        player_album = ''
+        expected = add(title, artist, duration + rng.choice((-1, 1)) * rng.randint(7, 9))
+    elif kind == 'missing':
+        # only other songs that share the title
+        expected = None
+    else:
+        raise ValueError(kind)
+    return player_title, player_artist, player_album, duration, records, expected
+
+KINDS = ('exact', 'exact', 'remaster', 'featuring', 'artist_format', 'article', 'versions', 'duration_off', 'missing')
+# ranking.py's thresholds come from its score weights and bench_trackid.py's name variants, not from these
+# cases; any seed is a fair evaluation
+SEED = 3
+
+def fixture(count, seed=SEED):
+    rng = random.Random(seed)
+    counter = iter(range(1, 10 ** 9))
+    return [make_case(rng, KINDS[number % len(KINDS)], lambda: next(counter)) for number in range(count)]
+
+async def run_legacy(case):
+    title, artist, album, duration, records, expected = case
+    client = CatalogueClient(records)
+    results = await search_cascade(client, legacy_levels(title, artist, album))
+    chosen = legacy_choose(results, duration) if results else None
+    if chosen is not None and chosen.synced_lyrics is None:
+        chosen = None
+    return (chosen.id if chosen else None), client.calls
+
+async def run_ranking(case):
+    title, artist, album, duration, records, expected = case
+    client = CatalogueClient(records)
+    match = await ranking.find_lyrics(client, title, artist, album, duration)
+    return (match.result.id if match else None), client.calls
+
+def evaluate(cases, run):
+    correct = 0
+    calls = 0
+    by_kind = {}
+    start = time.perf_counter()
+    for number, case in enumerate(cases):
+        chosen, case_calls = asyncio.run(run(case))
+        right = chosen == case[5]
+        correct += right
+        calls += case_calls
+        kind = KINDS[number % len(KINDS)]
+        hits, total = by_kind.get(kind, (0, 0))
+        by_kind[kind] = (hits + right, total + 1)
+    return correct / len(cases), calls / len(cases), by_kind, time.perf_counter() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else SEED
+    cases = fixture(count, seed)
+    print(f"{count} labelled cases, seed {seed}")
+    for label, run in (('old cascade', run_legacy), ('ranking', run_ranking)):
+        accuracy, calls, by_kind, elapsed = evaluate(cases, run)
+        kinds = "  ".join(f"{kind} {hits}/{total}" for kind, (hits, total) in by_kind.items())
+        print(f"{label:12} accuracy {accuracy:6.1%}  {calls:4.2f} searches per track  {elapsed * 1000 / count:6.2f} ms per track")
+        print(f"{'':12} {kinds}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import asyncio
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lyricstore
+import playback
+from palettecache import PaletteCache
+from pipeline import LyricPipeline
+from replay import synthetic_lyrics
+from sessions import SessionManager
+
+# Three fake players change tracks in the background while the displayed session is switched between them.
+# Measures the time from a switch to the new track's first text on the overlay, following only the current
+# session (PlaybackEngine, lyrics fetched after the switch) versus SessionManager (prepared while in the background).
+# usage: python benchmarks/bench_sessions.py [switches]
+
+SESSIONS = ('spotify', 'browser', 'vlc')
+FETCH_DELAY = 0.3
+# background track changes happen this long before the switch to that session
+LEAD = 0.5
+SETTLE = 0.3
+
+class Display:
+    def __init__(self):
+        self.shown = []
+
+    def update_text(self, text, ucolor1='gray10', ucolor2='white'):
+        if text:
+            self.shown.append((time.perf_counter(), text))
+
+async def fetch_lyrics(media_info):
+    # a provider round-trip
+    await asyncio.sleep(FETCH_DELAY)
+    return synthetic_lyrics(media_info.title, media_info.artist, media_info.duration), None
+
+async def scenario(multi, switches, seed=8):
+    rng = random.Random(seed)
+    source = playback.FakeMediaSource()
+    engine = SessionManager(source) if multi else playback.PlaybackEngine(source)
+    display = Display()
+    get_media_info = engine.get_media_info if multi else follow_current(source)
+    pipeline = LyricPipeline(engine, display, lyricstore.LyricStore(':memory:'), PaletteCache(), get_media_info, fetch_lyrics)
+    if multi:
+        engine.on_track = pipeline.track_changed
+    for number, session_id in enumerate(SESSIONS):
+        source.set_track(session_id, f"Song {number}", f"Artist {session_id}", duration=200, position=0.0)
+    runner = asyncio.ensure_future(pipeline.run())
+    await asyncio.sleep(SETTLE + FETCH_DELAY)
+    latencies = []
+    current = SESSIONS[0]
+    for number in range(switches):
+        target = rng.choice([session_id for session_id in SESSIONS if session_id != current])
+        title = f"Song {len(SESSIONS) + number}"
+        # the player we are about to show moves on to a new track in the background
+        source.set_track(target, title, f"Artist {target}", duration=200, position=rng.uniform(0, 100))
+        await asyncio.sleep(LEAD)
+        switched = time.perf_counter()
+        source.set_current(target)
+        current = target
+        while not any(text.startswith(title) and at >= switched for at, text in display.shown):
+            await asyncio.sleep(0.001)
+        latencies.append((next(at for at, text in display.shown if text.startswith(title) and at >= switched) - switched) * 1000)
+        await asyncio.sleep(SETTLE)
+    runner.cancel()
+    return latencies
+
+def follow_current(source):
+    # what the single-session winmedia.get_media_info read before SessionManager: the current session only
+    async def get_media_info():
+        session = source.sessions[source.current_id]
+        return playback.MediaInfo(session['title'], session['artist'], session['album_title'], session['position'],
+                                  session['duration'], session['status'])
+    return get_media_info
+
+def main():
+    switches = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    print(f"{switches} session switches, {FETCH_DELAY * 1000:.0f} ms lyrics fetch")
+    for label, multi in (('current only', False), ('all sessions', True)):
+        with contextlib.redirect_stdout(io.StringIO()):
+            latencies = asyncio.run(scenario(multi, switches))
+        print(f"{label:13} switch to first text  median {statistics.median(latencies):7.1f} ms  max {max(latencies):7.1f} ms")
+
+if __name__ == '__main__':
+    main()
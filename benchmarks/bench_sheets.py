@@ -0,0 +1,84 @@
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lrcparser
+import lyricstore
+import trackid
+from bench_lrcparser import synthetic_sheet
+from timeline import LyricTimeline, SheetCache
+
+# Memory of a compiled sheet against the old list of (timedelta, str) tuples, then thousands of tracks through a
+# SheetCache with a small budget: memory has to stay under it while recently played tracks still hit. Last, a
+# replayed track from the cache against reading and decoding it from the store.
+# usage: python benchmarks/bench_sheets.py [tracks]
+
+BUDGET = 1024 * 1024
+# a replay picks one of the last REPLAY_WINDOW tracks
+REPLAY_WINDOW = 40
+REPLAY_SHARE = 0.3
+
+def traced_size(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return size
+
+def old_sheet(lines):
+    return [(timedelta(milliseconds=line[0]), line[1]) for line in lines]
+
+def main():
+    tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rng = random.Random(20)
+    parsed = [lrcparser.parse_lrc(synthetic_sheet(rng)) for _ in range(200)]
+    lines = sum(len(sheet) for sheet in parsed)
+    # fresh copies of the texts, so both layouts pay for their strings
+    old = traced_size(lambda: [old_sheet([(ms, text.encode().decode(), words) for ms, text, words in sheet]) for sheet in parsed])
+    new = traced_size(lambda: [LyricTimeline([(ms, text.encode().decode(), words) for ms, text, words in sheet]) for sheet in parsed])
+    print(f"{len(parsed)} sheets, {lines} lines: tuples {old / lines:.0f} bytes a line, compact {new / lines:.0f} bytes a line")
+
+    cache = SheetCache(BUDGET)
+    recent = []
+    peak = 0
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for number in range(tracks):
+        if recent and rng.random() < REPLAY_SHARE:
+            key = rng.choice(recent[-REPLAY_WINDOW:])
+        else:
+            key = trackid.track_key(f"Title {number}", "Artist", 200)
+            recent.append(key)
+        if cache.get(key) is None:
+            cache.put(key, LyricTimeline(parsed[number % len(parsed)]))
+        peak = max(peak, cache.bytes)
+    held = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    print(f"{tracks} tracks through a {BUDGET // 1024} KB cache: {len(cache)} sheets kept, peak {peak // 1024} KB "
+          f"budgeted, {held // 1024} KB traced, hit rate {cache.hits / (cache.hits + cache.misses):.0%}")
+
+    store = lyricstore.LyricStore(':memory:')
+    key = trackid.track_key("Replayed", "Artist", 200)
+    timeline = LyricTimeline(parsed[0])
+    store.put(key, "lyrics", timeline)
+    cache.put(key, timeline)
+    rounds = 2000
+    timings = {}
+    for name, lookup in (('store', lambda: store.get(key)), ('cache', lambda: cache.get(key))):
+        samples = []
+        for _ in range(rounds):
+            begin = time.perf_counter()
+            lookup()
+            samples.append(time.perf_counter() - begin)
+        timings[name] = statistics.median(samples) * 1e6
+    print(f"replayed track: store read {timings['store']:.1f} us, sheet cache {timings['cache']:.2f} us")
+
+if __name__ == '__main__':
+    main()
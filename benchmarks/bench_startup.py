@@ -0,0 +1,49 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Imports what working.py loads before the overlay shows, in fresh interpreters, and reports the import time,
+# which heavy libraries came along and the peak memory. winrt, pyglet and async_tkinter_loop are left out so it
+# runs anywhere; python working.py --profile-startup gives the full picture on Windows.
+# usage: python benchmarks/bench_startup.py [runs]
+
+STARTUP_MODULES = ('tkinter', 'lyricdisplay', 'karaoke', 'lyricstore', 'palettecache', 'lrclibclient', 'offlinedb',
+                   'metrics', 'ranking', 'playback', 'plugins', 'executor', 'pipeline')
+HEAVY = ('numpy', 'cv2', 'PIL', 'sklearn', 'scipy', 'syncedlyrics', 'pyglet')
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+except ImportError:
+    peak = None
+# a lazy module is in sys.modules before its code has run
+loaded = [name for name in {heavy!r} if name in sys.modules and type(sys.modules[name]).__name__ != '_LazyModule']
+print(json.dumps({{'ms': elapsed * 1000, 'peak_mb': peak, 'loaded': loaded}}))
+'''
+
+def probe():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', PROBE.format(modules=STARTUP_MODULES, heavy=HEAVY)], cwd=root,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    results = [probe() for _ in range(runs)]
+    times = sorted(result['ms'] for result in results)
+    print(f"startup imports over {runs} fresh interpreters: median {statistics.median(times):.0f} ms, "
+          f"min {times[0]:.0f} ms, max {times[-1]:.0f} ms")
+    if results[0]['peak_mb'] is not None:
+        print(f"peak memory {statistics.median(result['peak_mb'] for result in results):.0f} MB")
+    print("heavy libraries loaded:", ", ".join(results[0]['loaded']) or "none")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import trackid
+
+# Cache hit rate of trackid.track_key against the old raw string key on title, artist and duration variants as
+# Windows players, stores and YouTube report them. Within a group every variant after the first should find
+# the first one's entry; the distinct pairs are different recordings that must keep their own keys. A miss on
+# track_key is retried with trackid.neighbour_key, as the lyrics store lookups do.
+# usage: python benchmarks/bench_trackid.py
+
+VARIANTS = [
+    [("Bohemian Rhapsody", "Queen", 354.3), ("Bohemian Rhapsody - Remastered 2011", "Queen", 354.9),
+     ("Bohemian Rhapsody (Remastered 2011)", "Queen", 354.0), ("Bohemian Rhapsody", "Queen - Topic", 354.0)],
+    [("Despacito (feat. Daddy Yankee)", "Luis Fonsi", 229.4), ("Despacito", "Luis Fonsi, Daddy Yankee", 229.0),
+     ("Despacito", "Luis Fonsi & Daddy Yankee", 229.4)],
+    [("Señorita", "Shawn Mendes, Camila Cabello", 190.8), ("Senorita", "Shawn Mendes & Camila Cabello", 191.0),
+     ("SEÑORITA", "Shawn Mendes", 190.9)],
+    [("Don't Stop Me Now - Remastered 2011", "Queen", 209.4), ("Don’t Stop Me Now", "Queen", 209.0),
+     ("Don't Stop Me Now (2011 Remaster)", "Queen", 209.5)],
+    [("Crazy in Love (feat. Jay-Z)", "Beyoncé", 236.1), ("Crazy In Love", "Beyonce feat. JAY-Z", 236.0),
+     ("Crazy in Love ft. Jay-Z", "Beyoncé", 236.4)],
+    [("Águas de Março", "Elis Regina e Tom Jobim", 212.3), ("Aguas De Marco", "Elis Regina, Tom Jobim", 212.0),
+     ("Águas de Março", "Elis Regina & Tom Jobim", 212.3)],
+    [("Hotel California - 2013 Remaster", "Eagles", 391.4), ("Hotel California (Remastered)", "Eagles", 391.0),
+     ("Hotel California", "Eagles", 391.4)],
+    [("Blinding Lights", "The Weeknd", 200.0), ("Blinding Lights", "The Weeknd - Topic", 200.0),
+     ("Blinding  Lights", "The Weeknd", 200.04)],
+    [("Mi Gente (feat. Beyoncé)", "J Balvin, Willy William", 209.7), ("Mi Gente", "J Balvin & Willy William", 209.9),
+     ("Mi Gente", "J Balvin x Willy William", 210.0)],
+    [("Shape of You", "Ed Sheeran", 233.7), ("Shape Of You", "Ed Sheeran", 234.0),
+     ("Shape of You", "Ed Sheeran - Topic", 233.7)],
+    [("Uptown Funk (feat. Bruno Mars)", "Mark Ronson", 269.6), ("Uptown Funk", "Mark Ronson ft. Bruno Mars", 270.0),
+     ("Uptown Funk!", "Mark Ronson, Bruno Mars", 269.8)],
+    [("Sweet Child O' Mine", "Guns N' Roses", 356.1), ("Sweet Child O Mine", "Guns N Roses", 356.0),
+     ("Sweet Child o' Mine - Remastered", "Guns N’ Roses", 356.4)],
+    [("Take On Me", "a-ha", 225.3), ("Take on Me - 2015 Remaster", "a-ha", 225.3), ("Take On Me", "A-HA", 225.0)],
+    [("rockstar (feat. 21 Savage)", "Post Malone", 218.1), ("rockstar", "Post Malone, 21 Savage", 218.1),
+     ("Rockstar (feat. 21 Savage)", "Post Malone; 21 Savage", 218.0)],
+    [("夜に駆ける", "YOASOBI", 261.1), ("夜に駆ける", "Yoasobi", 261.0)],
+    [("Lose Yourself - From \"8 Mile\" Soundtrack", "Eminem", 326.5), ("Lose Yourself", "Eminem", 326.5),
+     ("Lose Yourself (From 8 Mile)", "Eminem", 326.4)],
+    [("bad guy", "Billie Eilish", 194.1), ("Bad Guy", "Billie Eilish", 194.0), ("bad guy", "Billie Eilish - Topic", 194.1)],
+    [("Stay (with Justin Bieber)", "The Kid LAROI", 141.8), ("STAY", "The Kid LAROI, Justin Bieber", 141.8),
+     ("Stay", "The Kid LAROI & Justin Bieber", 141.8)],
+    [("Dancing Queen", "ABBA", 230.4), ("Dancing Queen - Remastered 2001", "ABBA", 230.9)],
+    [("Livin' la Vida Loca", "Ricky Martin", 243.1), ("Livin’ La Vida Loca", "Ricky Martin", 243.0),
+     ("Livin' la Vida Loca - Spanglish Version", "Ricky Martin", 243.1)],
+    [("Stand by Me", "Ben E. King", 180.1), ("Stand By Me", "Ben E. King", 180.0)],
+    [("Hips Don't Lie (feat. Wyclef Jean)", "Shakira", 218.1), ("Hips Don't Lie", "Shakira, Wyclef Jean", 218.1),
+     ("Hips Don’t Lie", "Shakira ft. Wyclef Jean", 218.0)],
+    [("Perfect Duet (with Beyoncé)", "Ed Sheeran", 259.4), ("Perfect Duet", "Ed Sheeran & Beyoncé", 259.4),
+     ("Perfect Duet (Ed Sheeran & Beyoncé)", "Ed Sheeran", 259.0)],
+    [("Mr. Brightside", "The Killers", 222.1), ("Mr Brightside", "The Killers", 222.0)],
+]
+
+DISTINCT = [
+    (("Hotel California", "Eagles", 391.4), ("Hotel California - Live On MTV, 1994", "Eagles", 427.0)),
+    (("Dancing Queen", "ABBA", 230.4), ("Dancing Queen", "Glee Cast", 230.0)),
+    (("Stay", "Rihanna", 240.7), ("Stay (with Justin Bieber)", "The Kid LAROI", 141.8)),
+    (("Hello", "Adele", 295.5), ("Hello", "Lionel Richie", 246.0)),
+    (("Smooth Criminal", "Michael Jackson", 257.0), ("Smooth Criminal", "Alien Ant Farm", 209.0)),
+    (("Yesterday - Remastered 2009", "The Beatles", 125.5), ("Yesterday - Live", "The Beatles", 160.0)),
+    (("Layla", "Derek & The Dominos", 424.0), ("Layla - Acoustic; Live at MTV Unplugged", "Eric Clapton", 287.0)),
+    (("Stand by Me", "Ben E. King", 180.1), ("Stand by Me", "Oasis", 356.0)),
+    (("Crazy", "Gnarls Barkley", 178.0), ("Crazy in Love", "Beyoncé", 236.1)),
+    (("Hurt", "Nine Inch Nails", 373.0), ("Hurt", "Johnny Cash", 218.0)),
+]
+
+WHITESPACE = re.compile(r'\s+')
+
+def legacy_key(title, artist, duration):
+    # the key lyricstore used before, raw strings folded only by case and spacing
+    def normalize(text):
+        return WHITESPACE.sub(' ', (text or '').casefold()).strip()
+    return f"{normalize(title)}\x1f{normalize(artist)}\x1f{int(round(duration)) // 2}"
+
+def hit_rate(key, neighbour=None):
+    def finds(track, seen):
+        near = neighbour(*track) if neighbour else None
+        return key(*track) in seen or near in seen
+
+    hits = lookups = 0
+    for group in VARIANTS:
+        seen = {key(*group[0])}
+        for variant in group[1:]:
+            lookups += 1
+            hits += finds(variant, seen)
+            seen.add(key(*variant))
+    merged = [pair for pair in DISTINCT if finds(pair[1], {key(*pair[0])})]
+    return hits, lookups, merged
+
+def main():
+    for name, key, neighbour in (('raw key', legacy_key, None), ('track_key', trackid.track_key, None),
+                                 ('+ neighbour', trackid.track_key, trackid.neighbour_key)):
+        hits, lookups, merged = hit_rate(key, neighbour)
+        print(f"{name:11s} {hits}/{lookups} repeat lookups hit ({hits / lookups:.0%}), "
+              f"{len(merged)}/{len(DISTINCT)} distinct recordings merged")
+        for first, second in merged:
+            print("    merged:", first, second)
+        if key is trackid.track_key and not neighbour:
+            for group in VARIANTS:
+                keys = {key(*variant) for variant in group}
+                if len(keys) > 1:
+                    print("    split:", sorted(keys))
+
+    tracks = [variant for group in VARIANTS for variant in group]
+    rounds = 200
+    for name, clear in (('cold', True), ('warm', False)):
+        elapsed = 0.0
+        for _ in range(rounds):
+            if clear:
+                for function in (trackid.fold, trackid.title_key, trackid.artist_key):
+                    function.cache_clear()
+            start = time.perf_counter()
+            for track in tracks:
+                trackid.track_key(*track)
+            elapsed += time.perf_counter() - start
+        print(f"track_key {name}: {elapsed / rounds / len(tracks) * 1e6:.2f} us")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import colors
+import lrcparser
+import metrics
+import offlinedb
+import ranking
+from bench_lrcparser import synthetic_sheet
+from lrclibclient import SearchResult
+from lrclibstub import make_record
+from timeline import LyricTimeline
+
+# Benchmarks the paths that run on every tick or track change against fixed synthetic fixtures and writes the
+# per-operation timings as JSON. With --compare the run fails when a median got slower than the baseline by
+# more than --threshold.
+# usage: python benchmarks/run.py [--output results.json] [--compare baseline.json] [--filter palette]
+
+ROUNDS = 7
+THRESHOLD = 0.2
+COVER_SIZES = (64, 300, 640, 1280)
+
+CASES = {}
+
+def case(name):
+    # registers setup(), which returns (run, ops) or (run, ops, cleanup): run() does ops operations, cleanup()
+    # releases what setup made once the case is measured
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+class Skip(Exception):
+    pass
+
+@case('parse_lrc')
+def parse_lrc_case():
+    rng = random.Random(1234)
+    corpus = [synthetic_sheet(rng) for _ in range(300)]
+    lines = sum(sheet.count("\n") for sheet in corpus)
+
+    def run():
+        for sheet in corpus:
+            lrcparser.parse_lrc(sheet)
+    return run, lines
+
+def bench_timeline():
+    return LyricTimeline(lrcparser.parse_lrc(synthetic_sheet(random.Random(99))))
+
+@case('timeline_index_at')
+def timeline_index_case():
+    timeline = bench_timeline()
+    rng = random.Random(5)
+    end = timeline.times[-1] + 5000
+    positions = [rng.randint(0, end) for _ in range(20000)]
+
+    def run():
+        index_at = timeline.index_at
+        ms_until_next = timeline.ms_until_next
+        for position in positions:
+            index_at(position)
+            ms_until_next(position)
+    return run, len(positions)
+
+@case('timeline_from_bytes')
+def timeline_blob_case():
+    blob = bench_timeline().to_bytes()
+
+    def run():
+        for _ in range(1000):
+            LyricTimeline.from_bytes(blob)
+    return run, 1000
+
+@case('rank_results')
+def rank_case():
+    rng = random.Random(7)
+    result_sets = []
+    for set_number in range(200):
+        target = rng.uniform(120, 300)
+        results = [SearchResult(make_record(i, f"Song {set_number}", f"Artist {i % 5}", duration=round(target + rng.uniform(-20, 20)),
+                                            synced_lyrics=None if rng.random() < 0.2 else "[00:01.00] la",
+                                            instrumental=rng.random() < 0.05))
+                   for i in range(rng.randint(5, 40))]
+        results.append(SearchResult(make_record(99, f"Song {set_number}", "Artist", duration=round(target), synced_lyrics="[00:01.00] la")))
+        result_sets.append((results, f"Song {set_number}", target))
+
+    def run():
+        for results, title, target in result_sets:
+            ranking.score_candidates(results, title, "Artist", '', target)
+    return run, len(result_sets)
+
+def synthetic_cover(size, seed):
+    # a few flat regions, a gradient and sensor noise, roughly like album art
+    rng = np.random.default_rng(seed)
+    image = np.empty((size, size, 3), np.uint8)
+    image[:] = rng.integers(0, 256, 3)
+    for _ in range(6):
+        x, y = rng.integers(0, size, 2)
+        w, h = rng.integers(size // 8, size // 2, 2)
+        image[y:y + h, x:x + w] = rng.integers(0, 256, 3)
+    image = image.astype(np.int16) + np.linspace(0, 40, size, dtype=np.int16)[None, :, None]
+    image += rng.integers(-12, 13, image.shape, dtype=np.int16)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+def palette_case(size):
+    def setup():
+        covers = [synthetic_cover(size, seed) for seed in range(8)]
+
+        def run():
+            for cover in covers:
+                colors.get_contrasting_colors(cover, 10)
+        return run, len(covers)
+    return setup
+
+for size in COVER_SIZES:
+    case(f'palette_{size}')(palette_case(size))
+
+@case('render_update_text')
+def render_case():
+    from tkinter import Tk, TclError
+    from lyricdisplay import LyricDisplay
+    try:
+        root = Tk()
+    except TclError as e:
+        raise Skip(f"no display ({e})")
+    root.withdraw()
+    display = LyricDisplay(root, text="Initial Text")
+    timeline = bench_timeline()
+    pairs = [f"{timeline.text(i)}\n{timeline.text(i + 1)}" for i in range(len(timeline) - 1)]
+
+    def run():
+        for text in pairs:
+            display.update_text(text, '#1a1a1a', '#ffffff')
+            root.update_idletasks()
+    return run, len(pairs)
+
+def synthetic_names(rng, count):
+    # Zipf distributed made-up words, so common words are common like in real catalogue titles
+    vocabulary = ["".join(rng.choice("aeioubcdfghklmnprstvy") for _ in range(rng.randint(2, 9))) for _ in range(20000)]
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    return [" ".join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(1, 4))).title() for _ in range(count)]
+
+@case('offline_search')
+def offline_search_case():
+    rng = random.Random(11)
+    names = synthetic_names(rng, 60000)
+    artists = synthetic_names(rng, 5000)
+    records = [make_record(i, names[i], rng.choice(artists), rng.choice(names), duration=round(rng.uniform(90, 400)),
+                           synced_lyrics="[00:01.00] la") for i in range(len(names))]
+    directory = tempfile.TemporaryDirectory()
+    index = offlinedb.OfflineIndex(os.path.join(directory.name, 'lrclib.db'))
+    index.import_records(records)
+    queries = []
+    for record in rng.sample(records, 100):
+        title, artist = record['trackName'], record['artistName']
+        # the levels get_lyrics_from_api asks for
+        queries += [dict(track_name=title, artist_name=artist, album_name=record['albumName']),
+                    dict(track_name=title, artist_name=artist), dict(track_name=title)]
+
+    def run():
+        for query in queries:
+            index.search(**query)
+
+    def cleanup():
+        # the index holds the file open, Windows will not remove it before
+        index.close()
+        directory.cleanup()
+    return run, len(queries), cleanup
+
+def span_case(enabled):
+    def setup():
+        registry = metrics.Metrics()
+        registry.enabled = enabled
+
+        def run():
+            for _ in range(10000):
+                with registry.span('bench'):
+                    pass
+        return run, 10000
+    return setup
+
+case('metrics_span_disabled')(span_case(False))
+case('metrics_span_enabled')(span_case(True))
+
+def start_xvfb():
+    # the render case needs an X server, start a private one when there is none
+    if os.environ.get('DISPLAY') or sys.platform == 'win32' or not shutil.which('Xvfb'):
+        return None
+    process = subprocess.Popen(['Xvfb', ':97', '-screen', '0', '1280x720x24'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ['DISPLAY'] = ':97'
+    time.sleep(0.5)
+    return process
+
+def measure(setup, rounds):
+    run, ops, *cleanup = setup()
+    try:
+        run()
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - start) / ops * 1e6)
+    finally:
+        for release in cleanup:
+            release()
+    return {'unit': 'us/op', 'median': round(statistics.median(timings), 4), 'min': round(min(timings), 4),
+            'rounds': rounds, 'ops': ops}
+
+def run_suite(names, rounds):
+    results = {}
+    skipped = {}
+    for name in names:
+        try:
+            results[name] = measure(CASES[name], rounds)
+        except Skip as e:
+            skipped[name] = str(e)
+            print(f"{name:22} skipped: {e}")
+            continue
+        result = results[name]
+        print(f"{name:22} {result['median']:12.3f} us/op  (min {result['min']:.3f}, {result['ops']} ops x {rounds})")
+    return {'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'numpy': np.__version__,
+                     'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results, 'skipped': skipped}
+
+def compare(current, baseline, threshold):
+    # returns the names whose median regressed past the threshold
+    regressions = []
+    for name, result in sorted(current['results'].items()):
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        ratio = result['median'] / before['median']
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:22} {before['median']:12.3f} -> {result['median']:12.3f} us/op  {ratio:6.2f}x{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the winlyrics benchmark suite')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON from an earlier run')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='allowed slowdown of a median, 0.2 is 20%%')
+    parser.add_argument('--filter', default='', help='only run cases whose name contains this')
+    parser.add_argument('--rounds', type=int, default=ROUNDS)
+    args = parser.parse_args()
+
+    names = [name for name in CASES if args.filter in name]
+    xvfb = start_xvfb() if 'render_update_text' in names else None
+    try:
+        current = run_suite(names, args.rounds)
+    finally:
+        if xvfb:
+            xvfb.terminate()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(current, file, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        print(f"compared with {args.compare}, threshold {args.threshold:.0%}")
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print("regressed:", ", ".join(regressions))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+import asyncio
+import json
+import threading
+import time
+
+# Publishes the lyrics on screen to browsers over Server-Sent Events, for OBS browser sources and phones.
+# GET /events streams a snapshot on connect (track, every line with its start time, the position, colours),
+# then small events: line (the current line changed), clock (play, pause or seek), track (a new sheet) and
+# clear. GET /snapshot returns the snapshot as JSON and GET / a bare page showing the current and next line.
+#
+# The server runs its own event loop on a thread. The display loop only hands it the sheet on a track change
+# and the clock's anchor when that moves, each a call_soon_threadsafe; line changes are timed on the server
+# loop with one timer for everyone, and every event is encoded once and written to each client without
+# waiting, a client that falls MAX_BUFFERED behind is dropped (EventSource reconnects and gets a snapshot).
+# Nothing here runs per client on a timer, idle connections only wait for their socket to close.
+
+BROADCAST_PORT = 8975
+MAX_BUFFERED = 256 * 1024
+KEEPALIVE = 15
+# clock updates that keep the predicted position within this are not sent, clients extrapolate on their own
+CLOCK_TOLERANCE = 0.25
+# a connection has this long to send its request line and headers
+REQUEST_TIMEOUT = 5
+# start() gives up on the server thread after this
+STARTUP_TIMEOUT = 5
+
+PAGE = '''<!doctype html>
+<meta charset="utf-8">
+<title>winlyrics</title>
+<style>
+body { margin: 0; font: bold 42px sans-serif; text-align: center; background: transparent; }
+#current { padding: 8px; } #next { padding: 8px; font-size: 30px; opacity: 0.7; }
+</style>
+<div id="current"></div><div id="next"></div>
+<script>
+let lines = [];
+const source = new EventSource('/events');
+function show(index, colors) {
+  document.getElementById('current').textContent = index >= 0 && lines[index] ? lines[index][1] : '';
+  document.getElementById('next').textContent = lines[index + 1] ? lines[index + 1][1] : '';
+  if (colors) { document.body.style.color = colors[1]; document.body.style.textShadow = '0 0 6px ' + colors[0]; }
+}
+function sheet(event) { const data = JSON.parse(event.data); lines = data.lines || []; show(data.index, data.colors); }
+source.addEventListener('snapshot', sheet);
+source.addEventListener('track', sheet);
+source.addEventListener('line', event => show(JSON.parse(event.data).index));
+source.addEventListener('clear', () => { lines = []; show(-1); });
+</script>
+'''
+
+class BroadcastServer:
+    def __init__(self, host='127.0.0.1', port=BROADCAST_PORT, monotonic=time.monotonic):
+        self.host = host
+        self.port = port
+        self.monotonic = monotonic
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.error = None
+        self.clients = set()
+        self.sent = 0
+        self.dropped = 0
+        # the rest is only touched on the server loop
+        self.track = None
+        self.timeline = None
+        self.colors = None
+        self.clock = None
+        self.index = -1
+        self.timer = None
+        # what the display loop last handed over, to skip unchanged clock anchors without a thread hop
+        self._published_clock = None
+
+    def start(self):
+        # raises when the server could not listen, the port taken for one
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self.serve, args=(ready,), name='winlyrics-broadcast', daemon=True)
+        self.thread.start()
+        if not ready.wait(STARTUP_TIMEOUT):
+            raise TimeoutError(f"lyrics broadcast did not start within {STARTUP_TIMEOUT} s")
+        if self.error is not None:
+            raise self.error
+        print(f"lyrics broadcast on http://{self.host}:{self.port}/")
+        return self
+
+    def serve(self, ready):
+        loop = asyncio.new_event_loop()
+        try:
+            self.server = loop.run_until_complete(asyncio.start_server(self.handle, self.host, self.port))
+            self.port = self.server.sockets[0].getsockname()[1]
+            loop.call_later(KEEPALIVE, self.keepalive)
+            self.loop = loop
+        except Exception as e:
+            self.error = e
+            loop.close()
+            return
+        finally:
+            ready.set()
+        loop.run_forever()
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.shutdown)
+            self.thread.join()
+
+    def shutdown(self):
+        for writer in self.clients:
+            writer.close()
+        self.clients.clear()
+        self.server.close()
+        self.loop.stop()
+
+    # called from the display loop
+
+    def show_track(self, media_info, timeline, palette, clock):
+        # timeline is None for a track without lyrics
+        track = {'title': media_info.title, 'artist': media_info.artist, 'album': media_info.album_title,
+                 'duration': media_info.duration}
+        self._published_clock = clock_state(clock)
+        self.loop.call_soon_threadsafe(self.set_track, track, timeline, palette, self._published_clock)
+
+    def update_clock(self, clock):
+        state = clock_state(clock)
+        if state != self._published_clock:
+            self._published_clock = state
+            self.loop.call_soon_threadsafe(self.set_clock, state)
+
+    def clear(self):
+        self._published_clock = None
+        self.loop.call_soon_threadsafe(self.set_track, None, None, None, None)
+
+    # server loop
+
+    def set_track(self, track, timeline, palette, clock):
+        self.track = track
+        self.timeline = timeline
+        self.colors = list(palette) if palette else None
+        self.clock = clock
+        self.index = self.current_index() if timeline else -1
+        if track is None:
+            self.publish('clear', {'time': wall_ms()})
+        else:
+            self.publish('track', self.snapshot())
+        self.schedule()
+
+    def set_clock(self, clock):
+        old = self.clock
+        self.clock = clock
+        if old is None or old[3] != clock[3] or abs(position_at(old, clock[0]) - clock[1]) > CLOCK_TOLERANCE:
+            self.publish('clock', self.clock_event())
+        self.schedule()
+
+    def position_ms(self):
+        if self.clock is None:
+            return 0
+        return int(position_at(self.clock, self.monotonic()) * 1000)
+
+    def current_index(self):
+        return self.timeline.index_at(self.position_ms())
+
+    def schedule(self):
+        # one timer for the next line boundary, whatever the number of clients
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.timeline is None or self.clock is None:
+            return
+        index = self.current_index()
+        if index != self.index:
+            self.index = index
+            self.publish('line', self.line_event())
+        if not self.clock[3]:
+            return
+        until_next = self.timeline.ms_until_next(self.position_ms())
+        if until_next is not None:
+            # a millisecond late rather than early, index_at has to see the new line
+            self.timer = self.loop.call_later((until_next + 1) / 1000 / self.clock[2], self.schedule)
+
+    def snapshot(self):
+        timeline = self.timeline
+        snapshot = {'time': wall_ms(), 'track': self.track, 'colors': self.colors, 'index': self.index}
+        if self.clock is not None:
+            snapshot.update(self.clock_event())
+        if timeline is not None:
+            snapshot['lines'] = [(timeline.times[index], timeline.text(index)) for index in range(len(timeline))]
+        return snapshot
+
+    def clock_event(self):
+        return {'time': wall_ms(), 'position_ms': self.position_ms(), 'playing': self.clock[3], 'rate': self.clock[2]}
+
+    def line_event(self):
+        timeline = self.timeline
+        index = self.index
+        return {'time': wall_ms(), 'index': index, 'position_ms': self.position_ms(),
+                'text': timeline.text(index) if index >= 0 else '',
+                'next': timeline.text(index + 1) if index + 1 < len(timeline) else ''}
+
+    def publish(self, kind, payload):
+        self.fan_out(f"event: {kind}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n".encode('utf-8'))
+
+    def fan_out(self, data):
+        for writer in list(self.clients):
+            if writer.transport.get_write_buffer_size() > MAX_BUFFERED:
+                self.clients.discard(writer)
+                self.dropped += 1
+                writer.close()
+                continue
+            writer.write(data)
+        self.sent += 1
+
+    def keepalive(self):
+        # comment lines keep proxies and idle phone browsers from closing the stream
+        self.fan_out(b": keepalive\n\n")
+        self.loop.call_later(KEEPALIVE, self.keepalive)
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), REQUEST_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        parts = request.split(b'\r\n', 1)[0].split()
+        path = parts[1].decode('latin-1').split('?')[0] if len(parts) > 1 else '/'
+        if path == '/events':
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                         b"Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n")
+            writer.write(f"event: snapshot\ndata: {json.dumps(self.snapshot(), separators=(',', ':'))}\n\n".encode('utf-8'))
+            self.clients.add(writer)
+            try:
+                # nothing is expected from the client, this returns when it goes away
+                while await reader.read(1024):
+                    pass
+            except ConnectionError:
+                pass
+            finally:
+                self.clients.discard(writer)
+                writer.close()
+            return
+        if path == '/snapshot':
+            self.respond(writer, '200 OK', 'application/json', json.dumps(self.snapshot()).encode('utf-8'))
+        elif path == '/':
+            self.respond(writer, '200 OK', 'text/html; charset=utf-8', PAGE.encode('utf-8'))
+        else:
+            self.respond(writer, '404 Not Found', 'text/plain', b'not found')
+
+    def respond(self, writer, status, content_type, body):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                     f"Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+        writer.close()
+
+def clock_state(clock):
+    # (anchor time, anchor position, rate, playing), all a listener needs to follow the position
+    return clock.anchor_time, clock.anchor_position, clock.rate, clock.playing
+
+def position_at(state, at):
+    anchor_time, anchor_position, rate, playing = state
+    if not playing:
+        return anchor_position
+    return anchor_position + (at - anchor_time) * rate
+
+def wall_ms():
+    return int(time.time() * 1000)
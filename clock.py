@@ -0,0 +1,111 @@
+import math
+import time
+from collections import deque
+
+# Estimates the player's position from the sparse (position, sampled_at) pairs the session reports, so the
+# lyrics can be synced without pausing the player to get a fresh baseline.
+
+SAMPLE_WINDOW = 12
+# a sample further than this from the prediction is a seek and starts a new fit
+SEEK_THRESHOLD = 1.0
+# players never run more than this far off the monotonic clock
+MAX_DRIFT = 0.05
+# seconds of samples needed before the fitted drift is trusted as much as the nominal rate of 1.0
+RATE_PRIOR = 10.0
+# floor on the error bound, reported timestamps are not more precise than this
+SAMPLE_JITTER = 0.05
+
+class PlaybackClock:
+    def __init__(self, window=SAMPLE_WINDOW, seek_threshold=SEEK_THRESHOLD, monotonic=time.monotonic):
+        self.monotonic = monotonic
+        self.samples = deque(maxlen=window)
+        self.seek_threshold = seek_threshold
+        self.playing = False
+        self.anchor_time = monotonic()
+        self.anchor_position = 0.0
+        self.rate = 1.0
+        self.rate_error = MAX_DRIFT
+        self.residual = SAMPLE_JITTER
+        self.seeks = 0
+        self.anchored = False
+
+    def reset(self, position=0.0, at=None, playing=False):
+        self.samples.clear()
+        self.anchor_time = self.monotonic() if at is None else at
+        self.anchor_position = position
+        self.playing = playing
+        self.rate = 1.0
+        self.rate_error = MAX_DRIFT
+        self.residual = SAMPLE_JITTER
+        self.anchored = False
+
+    def position_at(self, at):
+        if not self.playing:
+            return self.anchor_position
+        return self.anchor_position + (at - self.anchor_time) * self.rate
+
+    def now(self, at=None):
+        # returns (position, error bound) in seconds
+        if at is None:
+            at = self.monotonic()
+        error = self.residual
+        if self.playing:
+            error += abs(at - self.anchor_time) * self.rate_error
+        return self.position_at(at), error
+
+    def set_playing(self, playing, at=None):
+        if playing == self.playing:
+            return
+        if at is None:
+            at = self.monotonic()
+        # keep the position continuous, samples from before the change do not describe the new rate
+        self.anchor_position = self.position_at(at)
+        self.anchor_time = at
+        self.samples.clear()
+        self.playing = playing
+
+    def add_sample(self, position, sampled_at, playing=True):
+        # returns True when the sample was treated as a seek
+        if self.samples and sampled_at == self.samples[-1][0]:
+            return False
+        seek = False
+        if playing != self.playing:
+            self.samples.clear()
+            self.playing = playing
+        elif self.anchored and abs(position - self.position_at(sampled_at)) > self.seek_threshold:
+            seek = True
+            self.seeks += 1
+            self.samples.clear()
+        self.anchored = True
+        self.samples.append((sampled_at, position))
+        self.fit()
+        return seek
+
+    def fit(self):
+        last_time, last_position = self.samples[-1]
+        if not self.playing or len(self.samples) < 2:
+            self.anchor_time = last_time
+            self.anchor_position = last_position
+            self.rate = 1.0
+            self.rate_error = MAX_DRIFT if self.playing else 0.0
+            self.residual = SAMPLE_JITTER
+            return
+        # least squares of the drift (position minus elapsed time) over time, relative to the newest sample,
+        # with the drift slope pulled towards zero until the samples span enough time
+        times = [sampled_at - last_time for sampled_at, _ in self.samples]
+        drifts = [position - t for t, (_, position) in zip(times, self.samples)]
+        count = len(times)
+        mean_time = sum(times) / count
+        mean_drift = sum(drifts) / count
+        spread = sum((t - mean_time) ** 2 for t in times)
+        covariance = sum((t - mean_time) * (d - mean_drift) for t, d in zip(times, drifts))
+        slope = covariance / (spread + RATE_PRIOR ** 2)
+        slope = min(max(slope, -MAX_DRIFT), MAX_DRIFT)
+        intercept = mean_drift - slope * mean_time
+        squares = sum((d - intercept - slope * t) ** 2 for t, d in zip(times, drifts))
+        rms = math.sqrt(squares / count)
+        self.anchor_time = last_time
+        self.anchor_position = intercept
+        self.rate = 1.0 + slope
+        self.residual = max(rms, SAMPLE_JITTER)
+        self.rate_error = min(MAX_DRIFT, self.residual / math.sqrt(spread + RATE_PRIOR ** 2) + abs(slope) / 2)
@@ -1,72 +1,76 @@
-import cv2
-import numpy as np
-from sklearn.cluster import KMeans
-from scipy.spatial import distance
+from functools import lru_cache
+from lazyimport import lazy_module
 
-def rgb_to_hex(color):
-    return "#{:02x}{:02x}{:02x}".format(color[0], color[1], color[2])
-
-def get_contrasting_colors(image, num_colors=5):
-    def get_dominant_colors(image, num_colors=5):
-        # Load image
-        
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-        # Reshape image to be a list of pixels
-        pixels = image_rgb.reshape(-1, 3)
-
-        # Fit KMeans clustering
-        kmeans = KMeans(n_clusters=num_colors)
-        kmeans.fit(pixels)
+# the overlay only needs the hex helpers at startup, numpy loads with the first cover
+np = lazy_module('numpy')
 
-        # Get the dominant colors
-        colors = kmeans.cluster_centers_.astype(int)
-        counts = np.bincount(kmeans.labels_)
-        return colors, counts
+# Longest side the cover is shrunk to before quantizing, keeps the cost flat whatever the thumbnail size
+MAX_SIDE = 64
+# Histogram quantizer: 4 bits per channel, only the most populated bins are considered as palette colours
+CHANNEL_SHIFT = 4
+CANDIDATE_BINS = 64
+# Palette colours closer than this (RGB distance) are treated as the same colour
+MIN_COLOR_DISTANCE = 24
 
-    def convert_to_hsv(colors):
-        # Convert RGB colors to HSV
-        colors_rgb = np.array(colors, dtype=np.uint8)
-        colors_rgb = colors_rgb.reshape(-1, 1, 3)  # Reshape to 1x1x3 for conversion
-        colors_hsv = cv2.cvtColor(colors_rgb, cv2.COLOR_RGB2HSV)
-        return colors_hsv.reshape(-1, 3)
+def rgb_to_hex(color):
+    return "#{:02x}{:02x}{:02x}".format(color[0], color[1], color[2])
 
-    def find_most_saturated_color(colors):
-        colors_hsv = convert_to_hsv(colors)
-        saturations = colors_hsv[:, 1]  # Saturation is the second channel in HSV
-        return colors[np.argmax(saturations)]
+def get_dominant_colors(image, num_colors=5):
+    # image is a BGR array as returned by cv2
+    # cheap strided decimation first, then area averaging for the last factor of two
+    step = max(image.shape[:2]) // (2 * MAX_SIDE)
+    if step > 1:
+        image = np.ascontiguousarray(image[::step, ::step])
+    height, width = image.shape[:2]
+    scale = MAX_SIDE / max(height, width)
+    if scale < 1:
+        import cv2
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    pixels = image.reshape(-1, 3)[:, ::-1].astype(np.int64)
 
-    def find_highest_contrast_color(base_color, colors):
-        max_distance = 0
-        contrast_color = None
+    bits = 8 - CHANNEL_SHIFT
+    quantized = pixels >> CHANNEL_SHIFT
+    bins = (quantized[:, 0] << (2 * bits)) | (quantized[:, 1] << bits) | quantized[:, 2]
+    size = 1 << (3 * bits)
+    counts = np.bincount(bins, minlength=size)
+    sums = np.stack([np.bincount(bins, weights=pixels[:, channel], minlength=size) for channel in range(3)], axis=1)
 
-        # Calculate the Euclidean distance between the base color and each other color
-        for color in colors:
-            dist = distance.euclidean(base_color, color)
-            if dist > max_distance:
-                max_distance = dist
-                contrast_color = color
+    # most populated bins first, ties broken by bin index so the result is deterministic
+    candidates = np.nonzero(counts)[0]
+    order = np.lexsort((candidates, -counts[candidates]))[:CANDIDATE_BINS]
+    candidates = candidates[order]
+    means = sums[candidates] / counts[candidates, None]
 
-        return contrast_color, max_distance
+    chosen = []
+    for i in range(len(candidates)):
+        if chosen and np.min(np.linalg.norm(means[chosen] - means[i], axis=1)) < MIN_COLOR_DISTANCE:
+            continue
+        chosen.append(i)
+        if len(chosen) == num_colors:
+            break
+    return np.rint(means[chosen]).astype(int), counts[candidates[chosen]]
 
-    # Load image and find dominant colors
+def get_contrasting_colors(image, num_colors=5):
     colors, counts = get_dominant_colors(image, num_colors)
-    best_contrast_pair = tuple
-    maxcontrast = 0
-    for color in colors:
-        color2, contrast = find_highest_contrast_color(color, colors)
-        if contrast > maxcontrast:
-            best_contrast_pair = (color, color2)
-            maxcontrast = contrast
-            break
-    return(rgb_to_hex(best_contrast_pair[0]),rgb_to_hex(best_contrast_pair[1]))
+    if len(colors) < 2:
+        # flat cover, pair it with black or white
+        base = colors[0]
+        other = np.zeros(3, dtype=int) if base.sum() > 382 else np.full(3, 255)
+        return rgb_to_hex(base), rgb_to_hex(other)
 
-    # Convert colors to hex strings
-    most_saturated_color_hex = rgb_to_hex(most_saturated_color)
-    contrast_color_hex = rgb_to_hex(contrast_color)
+    # contrast between every pair of palette colours in one pass
+    distances = np.linalg.norm(colors[:, None, :] - colors[None, :, :], axis=2)
+    first, second = np.unravel_index(np.argmax(distances), distances.shape)
+    # the more common colour becomes the background
+    if counts[second] > counts[first]:
+        first, second = second, first
+    return rgb_to_hex(colors[first]), rgb_to_hex(colors[second])
 
-    return (most_saturated_color_hex, contrast_color_hex)
+def palette_from_image(image, num_colors):
+    color1, color2 = get_contrasting_colors(image, num_colors)
+    return color1, color2, halfway_tone(color1, color2)
 
+@lru_cache(maxsize=1024)
 def halfway_tone(color, color2):
     # Helper function to convert hex to RGB
     def hex_to_rgb(hex_color):
@@ -87,4 +91,10 @@ def halfway_tone(color, color2):
     # Convert halfway RGB back to hex
     halfway_hex = rgb_to_hex(halfway_rgb)
     
-    return halfway_hex
\ No newline at end of file
+    return halfway_hex
+
+def blend_tone(color, color2, amount):
+    # colour amount of the way from color to color2, used for animated transitions
+    rgb1 = tuple(int(color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
+    rgb2 = tuple(int(color2.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
+    return rgb_to_hex(tuple(round(c1 + (c2 - c1) * amount) for c1, c2 in zip(rgb1, rgb2)))
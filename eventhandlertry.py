@@ -1,29 +1,80 @@
-from winrt.windows.media.control import GlobalSystemMediaTransportControlsSessionManager as MediaManager, GlobalSystemMediaTransportControlsSessionPlaybackStatus as SessionPlaybackStatus
+import asyncio
+from winrt.windows.media.control import GlobalSystemMediaTransportControlsSessionManager as MediaManager
+import playback
 
 class MediaEventHandler:
+    # WinRT raises these events on its own threads, update_callback(kind, session_id) is run on the asyncio loop.
+    # Sessions are named by playback.session_keys, the app id plus an ordinal for a second tab of one browser,
+    # and each handler carries that id: the wrapper objects WinRT hands out are not guaranteed to compare equal
+    # from one get_sessions() call to the next, so nothing here looks a session up by its wrapper.
     def __init__(self, update_callback):
         self.update_callback = update_callback
+        # session id -> session
+        self.sessions = {}
+        # session id -> (session, registration tokens of its handlers)
+        self.subscribed = {}
 
     async def initialize(self):
+        self.loop = asyncio.get_running_loop()
         self.media_manager = await MediaManager.request_async()
         self.media_manager.add_current_session_changed(self.media_manager_current_session_changed)
-        await self.subscribe_to_session_events(self.media_manager.get_current_session())
+        self.media_manager.add_sessions_changed(self.media_manager_sessions_changed)
+        self.resubscribe()
 
-    async def media_manager_current_session_changed(self, sender, args):
-        current_session = sender.get_current_session()
-        await self.subscribe_to_session_events(current_session)
+    def notify(self, kind, session_id):
+        self.loop.call_soon_threadsafe(self.update_callback, kind, session_id)
 
-    async def subscribe_to_session_events(self, session):
-        if session:
-            session.add_playback_info_changed(self.session_playback_info_changed)
-            session.add_media_properties_changed(self.session_media_properties_changed)
-            session.add_timeline_properties_changed(self.session_timeline_properties_changed)
+    def media_manager_current_session_changed(self, sender, args):
+        self.notify(playback.SESSION_EVENT, self.current_session_id())
 
-    async def session_playback_info_changed(self, sender, args):
-        await self.update_callback()
+    def media_manager_sessions_changed(self, sender, args):
+        # a player opened or closed, every session is subscribed again under its current id
+        self.resubscribe()
+        self.notify(playback.SESSION_EVENT, None)
+        # an id may now stand for another session (the first of two tabs closed), have it read again
+        for session_id in self.sessions:
+            for kind in (playback.PLAYBACK_EVENT, playback.MEDIA_EVENT, playback.TIMELINE_EVENT):
+                self.notify(kind, session_id)
 
-    async def session_media_properties_changed(self, sender, args):
-        await self.update_callback()
+    def resubscribe(self):
+        # rare (players opening and closing), so all handlers are dropped by token and added again rather than
+        # working out which wrapper is which
+        for session_id in list(self.subscribed):
+            self.unsubscribe_from_session_events(session_id)
+        sessions = list(self.media_manager.get_sessions())
+        session_ids = playback.session_keys([session.source_app_user_model_id for session in sessions])
+        self.sessions = dict(zip(session_ids, sessions))
+        for session_id, session in self.sessions.items():
+            self.subscribe_to_session_events(session_id, session)
 
-    async def session_timeline_properties_changed(self, sender, args):
-        await self.update_callback()
+    def current_session_id(self):
+        session = self.media_manager.get_current_session()
+        if not session:
+            return None
+        app_id = session.source_app_user_model_id
+        candidates = [session_id for session_id in self.sessions if session_id.split('#')[0] == app_id]
+        if len(candidates) > 1:
+            # several tabs of one app, this is the one place a wrapper comparison is tried
+            for session_id in candidates:
+                if self.sessions[session_id] == session:
+                    return session_id
+        return candidates[0] if candidates else None
+
+    def subscribe_to_session_events(self, session_id, session):
+        def forward(kind):
+            return lambda sender, args: self.notify(kind, session_id)
+        self.subscribed[session_id] = (session, (
+            session.add_playback_info_changed(forward(playback.PLAYBACK_EVENT)),
+            session.add_media_properties_changed(forward(playback.MEDIA_EVENT)),
+            session.add_timeline_properties_changed(forward(playback.TIMELINE_EVENT)),
+        ))
+
+    def unsubscribe_from_session_events(self, session_id):
+        session, (playback_token, media_token, timeline_token) = self.subscribed.pop(session_id)
+        try:
+            session.remove_playback_info_changed(playback_token)
+            session.remove_media_properties_changed(media_token)
+            session.remove_timeline_properties_changed(timeline_token)
+        except OSError:
+            # the player is gone and took its session with it
+            pass
@@ -0,0 +1,230 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+
+# Blocking work (SQLite, files, syncedlyrics, cover quantizing) runs here instead of on the event loop the Tk
+# overlay and the lyric clock share. io() goes to a thread pool, cpu() to a process pool. Each pool has a bounded
+# number of jobs in flight, further callers wait for a slot instead of piling up behind a slow provider. Jobs are
+# tagged with a group (the track key) and cancel(group) drops the ones still waiting for a slot or queued in a
+# pool on a track change; a job already running finishes in its worker and its result is thrown away.
+
+IO_WORKERS = 4
+CPU_WORKERS = 1
+IO_QUEUE = 16
+CPU_QUEUE = 4
+# one frame at 60 Hz, a longer stall is visible as a late line or a frozen fade
+STALL_BUDGET = 0.016
+
+class WorkExecutor:
+    def __init__(self, io_workers=IO_WORKERS, cpu_workers=CPU_WORKERS, io_queue=IO_QUEUE, cpu_queue=CPU_QUEUE):
+        # cpu_workers=0 runs cpu() jobs on the thread pool, for platforms where spawning processes is unwanted
+        self.io_pool = ThreadPoolExecutor(io_workers, thread_name_prefix='winlyrics-io')
+        self.cpu_pool = ProcessPoolExecutor(cpu_workers) if cpu_workers else None
+        # free slots and the callers waiting for one, only touched on the loop thread
+        self.free = {'io': io_queue, 'cpu': cpu_queue}
+        self.waiting = {'io': deque(), 'cpu': deque()}
+        self.groups = {}
+        self.submitted = 0
+        self.cancelled = 0
+
+    async def io(self, func, *args, group=None):
+        return await self.run('io', self.io_pool, func, args, group)
+
+    async def cpu(self, func, *args, group=None):
+        if self.cpu_pool is None:
+            return await self.run('cpu', self.io_pool, func, args, group)
+        try:
+            return await self.run('cpu', self.cpu_pool, func, args, group)
+        except BrokenProcessPool as e:
+            # a worker died (out of memory, killed), keep going on threads rather than failing every palette
+            print("process pool broken, falling back to threads:", e)
+            self.cpu_pool = None
+            return await self.run('cpu', self.io_pool, func, args, group)
+
+    async def run(self, kind, pool, func, args, group):
+        # the caller joins its group before it waits for a slot, so cancel(group) reaches it there too; the group
+        # maps each waiting future to the pool's job, None while the caller has no slot yet
+        members = self.groups.setdefault(group, {})
+        waiter = None
+        try:
+            await self.acquire(kind, members)
+            loop = asyncio.get_running_loop()
+            try:
+                job = pool.submit(func, *args)
+            except BaseException:
+                self.release(kind)
+                raise
+            self.submitted += 1
+            # the slot is held until the worker is done, not until the caller stops waiting
+            job.add_done_callback(lambda _: self.release_from_worker(loop, kind))
+            waiter = asyncio.wrap_future(job)
+            members[waiter] = job
+            return await waiter
+        finally:
+            members.pop(waiter, None)
+            if not members and self.groups.get(group) is members:
+                del self.groups[group]
+
+    async def acquire(self, kind, members):
+        if self.free[kind] > 0:
+            self.free[kind] -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiting[kind].append(waiter)
+        members[waiter] = None
+        try:
+            await waiter
+        except BaseException:
+            if waiter in self.waiting[kind]:
+                self.waiting[kind].remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                # handed a slot just as we were cancelled, pass it on
+                self.release(kind)
+            raise
+        finally:
+            members.pop(waiter, None)
+
+    def release(self, kind):
+        # hands the slot straight to the next waiting caller, if any
+        waiting = self.waiting[kind]
+        while waiting:
+            waiter = waiting.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.free[kind] += 1
+
+    def release_from_worker(self, loop, kind):
+        try:
+            loop.call_soon_threadsafe(self.release, kind)
+        except RuntimeError:
+            # the loop is closed, nobody is waiting for the slot anymore
+            pass
+
+    def cancel(self, group):
+        # cancels every job of the group: callers still waiting for a slot and jobs queued in the pool never
+        # start, their callers get CancelledError
+        members = self.groups.pop(group, {})
+        for waiter, job in members.items():
+            # the pool's job directly, a worker could pick it up before the loop runs the waiter's callbacks
+            if job is not None:
+                job.cancel()
+            if waiter.cancel():
+                self.cancelled += 1
+        return len(members)
+
+    def pending(self, group=None):
+        if group is None:
+            return sum(len(members) for members in self.groups.values())
+        return len(self.groups.get(group, ()))
+
+    def warm_up(self, func, *args):
+        # starts the worker processes now instead of on the first track change
+        if self.cpu_pool is not None:
+            self.cpu_pool.submit(func, *args)
+
+    def shutdown(self):
+        self.io_pool.shutdown(wait=False, cancel_futures=True)
+        if self.cpu_pool is not None:
+            # joined, its management thread otherwise races interpreter exit for the pipes ("Bad file descriptor")
+            self.cpu_pool.shutdown(wait=True, cancel_futures=True)
+
+class InlineExecutor:
+    # same interface, runs the call on the loop thread, for the replay harness whose virtual clock can not wait
+    # on real threads and for tools that have no loop to protect
+    submitted = 0
+    cancelled = 0
+
+    async def io(self, func, *args, group=None):
+        return func(*args)
+
+    async def cpu(self, func, *args, group=None):
+        return func(*args)
+
+    def cancel(self, group):
+        return 0
+
+    def pending(self, group=None):
+        return 0
+
+    def warm_up(self, func, *args):
+        pass
+
+    def shutdown(self):
+        pass
+
+inline = InlineExecutor()
+
+def describe_stack(frame, depth=3):
+    # the innermost frames, plus the innermost one from this project when those are all library code
+    here = os.path.dirname(os.path.abspath(__file__))
+    stack = traceback.extract_stack(frame)
+    if stack and stack[-1].name == 'select' and os.path.basename(stack[-1].filename) == 'selectors.py':
+        # the loop was idle and woke up late, nothing on it was blocking
+        return "select, a worker thread held the GIL or the wakeup was late"
+    shown = stack[-depth:]
+    own = [entry for entry in stack if os.path.dirname(os.path.abspath(entry.filename)) == here]
+    if own and own[-1] not in shown:
+        shown = [own[-1]] + shown
+    return " <- ".join(f"{os.path.basename(entry.filename)}:{entry.lineno} {entry.name}" for entry in reversed(shown))
+
+class LoopWatchdog:
+    # A heartbeat callback on the loop stamps the time every interval; a thread checks the stamp and, once the loop
+    # has been silent for longer than the budget, samples the loop thread's stack. The stack at that moment is
+    # the call holding the loop, it is printed with the stall length when the loop comes back. Every beat also
+    # records how late it came as loop_lag_ms; report=False keeps that and the stall count but samples and prints
+    # nothing.
+    def __init__(self, budget=STALL_BUDGET, interval=None, report=True):
+        self.budget = budget
+        self.interval = interval or budget / 2
+        self.report = report
+        self.loop = None
+        self.loop_thread = None
+        self.beat = time.monotonic()
+        self.culprit = None
+        self.stalls = 0
+        self.running = False
+
+    def start(self, loop=None):
+        self.loop = loop or asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.running = True
+        self.beat = time.monotonic()
+        self.loop.call_soon(self.heartbeat)
+        if self.report:
+            threading.Thread(target=self.watch, name='winlyrics-watchdog', daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def heartbeat(self):
+        now = time.monotonic()
+        late = now - self.beat - self.interval
+        metrics.observe('loop_lag_ms', max(late, 0.0) * 1000)
+        if late > self.budget:
+            # a sample taken during an earlier stall does not describe this one
+            sampled_beat, culprit = self.culprit or (None, None)
+            self.stalls += 1
+            metrics.observe('loop_stall_ms', late * 1000)
+            if self.report:
+                print(f"event loop stalled {late * 1000:.0f} ms in {culprit if sampled_beat == self.beat else 'unknown'}")
+        self.culprit = None
+        self.beat = now
+        if self.running:
+            self.loop.call_later(self.interval, self.heartbeat)
+
+    def watch(self):
+        while self.running:
+            time.sleep(self.interval)
+            beat = self.beat
+            if self.culprit is None and time.monotonic() - beat - self.interval > self.budget:
+                frame = sys._current_frames().get(self.loop_thread)
+                if frame is not None:
+                    self.culprit = (beat, describe_stack(frame))
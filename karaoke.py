@@ -0,0 +1,179 @@
+import time
+from tkinter import *
+import colors
+import metrics
+from lyricdisplay import LyricDisplay
+
+# Sweep speed for lines without enhanced word stamps, a long gap before the next line ends the sweep early
+SWEEP_MS_PER_CHAR = 60
+MIN_SWEEP_MS = 600
+LAST_LINE_MS = 4000
+TRANSITION_MS = 180
+
+def line_progress(timeline, index, position_ms):
+    # fraction of line index that has been sung at position_ms
+    start = timeline.times[index]
+    end = timeline.times[index + 1] if index + 1 < len(timeline) else start + LAST_LINE_MS
+    words = timeline.words.get(index)
+    if words:
+        total = sum(len(chunk) for _, chunk in words)
+        if total == 0:
+            return 1.0
+        done = 0.0
+        for i, (ms, chunk) in enumerate(words):
+            if position_ms < ms:
+                break
+            chunk_end = words[i + 1][0] if i + 1 < len(words) else end
+            if position_ms >= chunk_end:
+                done += len(chunk)
+            else:
+                done += len(chunk) * (position_ms - ms) / max(chunk_end - ms, 1)
+                break
+        return min(done / total, 1.0)
+    sweep = min(end - start, max(MIN_SWEEP_MS, len(timeline.text(index)) * SWEEP_MS_PER_CHAR))
+    return min(max((position_ms - start) / max(sweep, 1), 0.0), 1.0)
+
+class FrameScheduler:
+    # Calls callback(now) at a target frame rate through root.after. When the loop was busy the missed frames
+    # are skipped and counted instead of being replayed back to back.
+    def __init__(self, root, callback, fps=30):
+        self.root = root
+        self.callback = callback
+        self.interval = 1 / fps
+        self.frames = 0
+        self.dropped = 0
+        self.busy_time = 0.0
+        self.deadline = None
+        self.after_id = None
+
+    @property
+    def running(self):
+        return self.after_id is not None
+
+    def start(self):
+        if self.running:
+            return
+        self.deadline = time.monotonic()
+        self.after_id = self.root.after(0, self.tick)
+
+    def stop(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def tick(self):
+        now = time.monotonic()
+        self.callback(now)
+        self.frames += 1
+        finished = time.monotonic()
+        self.busy_time += finished - now
+        self.deadline += self.interval
+        if finished > self.deadline:
+            missed = int((finished - self.deadline) / self.interval) + 1
+            self.dropped += missed
+            self.deadline += missed * self.interval
+        self.after_id = self.root.after(max(1, int((self.deadline - finished) * 1000)), self.tick)
+
+    def stats(self):
+        return {'frames': self.frames, 'dropped': self.dropped, 'busy_seconds': round(self.busy_time, 3)}
+
+class KaraokeDisplay(LyricDisplay):
+    # The current line is drawn as a sung prefix and an unsung suffix, the split moves with the progress and
+    # the canvas is only touched when the split moves by a character or during a line transition.
+    def __init__(self, root, text, color1='gray10', color2='white'):
+        super().__init__(root, text, color1, color2)
+        self.unsung_line = self.canvas.create_text(0, 0, font=self.font, anchor=W, state=HIDDEN)
+        self.items_created += 1
+        self.current = ''
+        self.split = None
+        self.line_left = 0
+        self.line_y = 0
+        self.transition_start = None
+
+    def update_text(self, text, ucolor1='gray10', ucolor2='white'):
+        if hasattr(self, 'unsung_line'):
+            self.canvas.itemconfigure(self.unsung_line, state=HIDDEN)
+            self.transition_start = None
+        super().update_text(text, ucolor1, ucolor2)
+
+    def set_lines(self, current, upcoming, color1, color2, now):
+        super().update_text(f"{current}\n{upcoming}", color1, color2)
+        center_x, center_y = self.text_center
+        self.current = current
+        self.split = None
+        self.line_left = center_x - self.measure((current,))[0] // 2
+        self.line_y = center_y - 12
+        self.canvas.itemconfigure(self.first_line, anchor=W, text='')
+        self.canvas.itemconfigure(self.unsung_line, text=current, fill=colors.halfway_tone(self.color1, self.color2), state=NORMAL)
+        self.transition_start = now
+
+    def set_progress(self, progress, now):
+        split = round(len(self.current) * progress)
+        moved = self.transition_start is not None
+        if moved:
+            # slide the new line up from where it was shown as the upcoming line
+            amount = min((now - self.transition_start) * 1000 / TRANSITION_MS, 1.0)
+            eased = 1 - (1 - amount) ** 3
+            offset = (1 - eased) * 24
+            self.canvas.itemconfigure(self.second_line, fill=colors.blend_tone(self.color1, colors.halfway_tone(self.color1, self.color2), eased))
+            if amount >= 1.0:
+                self.transition_start = None
+        else:
+            offset = 0
+        if split == self.split and not moved:
+            return
+        self.split = split
+        prefix = self.current[:split]
+        self.canvas.itemconfigure(self.first_line, text=prefix)
+        self.canvas.itemconfigure(self.unsung_line, text=self.current[split:])
+        self.canvas.coords(self.first_line, self.line_left, self.line_y + offset)
+        self.canvas.coords(self.unsung_line, self.line_left + (self.measure((prefix,))[0] if prefix else 0), self.line_y + offset)
+
+class KaraokePlayer:
+    # Drives a KaraokeDisplay from a timeline and a position function (ms) on a FrameScheduler
+    def __init__(self, display, fps=30):
+        self.display = display
+        self.scheduler = FrameScheduler(display.root, self.frame, fps)
+        self.timeline = None
+        self.position_ms = None
+        self.index = -1
+        # scheduler (frames, dropped, busy seconds) when the last track's were recorded
+        self.recorded = (0, 0, 0.0)
+
+    def play(self, timeline, position_ms, color1, color2):
+        self.timeline = timeline
+        self.position_ms = position_ms
+        self.color1 = color1
+        self.color2 = color2
+        self.index = -1
+
+    def set_running(self, running):
+        if running:
+            self.scheduler.start()
+        else:
+            self.scheduler.stop()
+
+    def stop(self):
+        self.scheduler.stop()
+        self.record_frames()
+
+    def record_frames(self):
+        # frames drawn and dropped during the track that ended, and the mean time one took; kept only with --metrics
+        scheduler = self.scheduler
+        frames, dropped, busy_time = self.recorded
+        self.recorded = (scheduler.frames, scheduler.dropped, scheduler.busy_time)
+        if scheduler.frames > frames:
+            metrics.count('karaoke_frames', scheduler.frames - frames)
+            metrics.count('karaoke_dropped_frames', scheduler.dropped - dropped)
+            metrics.observe('karaoke_frame_ms', (scheduler.busy_time - busy_time) / (scheduler.frames - frames) * 1000)
+
+    def frame(self, now):
+        timeline = self.timeline
+        position = self.position_ms()
+        index = timeline.index_at(position)
+        if index < 0 or index >= len(timeline) - 1:
+            return
+        if index != self.index:
+            self.index = index
+            self.display.set_lines(timeline.text(index), timeline.text(index + 1), self.color1, self.color2, now)
+        self.display.set_progress(line_progress(timeline, index, position), now)
@@ -0,0 +1,96 @@
+import importlib.util
+import sys
+import time
+
+# Startup helpers. lazy_module() hands out a module whose code only runs on the first attribute access, so numpy
+# and cv2 stay unloaded until a cover is quantized or candidates are ranked. ImportProfiler times every module
+# executed after install(), including the lazy ones when they finally load, for working.py --profile-startup.
+
+def lazy_module(name):
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+class TimedLoader:
+    def __init__(self, loader, profiler):
+        self.loader = loader
+        self.profiler = profiler
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.profiler.enter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.profiler.leave(module.__name__)
+
+    def __getattr__(self, name):
+        # get_data, is_package, get_resource_reader and the rest go to the real loader
+        return getattr(self.loader, name)
+
+class ImportProfiler:
+    # meta path finder that wraps the loader other finders return; self time leaves out nested imports
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.modules = {}
+        self.stack = []
+        # time in imports that were not nested in another timed import
+        self.outermost = 0.0
+        # set once startup is reported, later imports (the lazy ones) are printed as they happen
+        self.announce = False
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+        return self
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = TimedLoader(spec.loader, self)
+        return spec
+
+    def enter(self):
+        # [started, time spent in nested imports]
+        self.stack.append([time.perf_counter(), 0.0])
+
+    def leave(self, name):
+        started, nested = self.stack.pop()
+        total = time.perf_counter() - started
+        if self.stack:
+            self.stack[-1][1] += total
+        else:
+            self.outermost += total
+            if self.announce:
+                print(f"imported {name} in {total * 1000:.0f} ms")
+        self.modules[name] = (total, total - nested, started - self.start)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def report(self, limit=20):
+        print(f"{len(self.modules)} modules imported, {self.outermost * 1000:.0f} ms importing")
+        print(f"{'self ms':>9} {'total ms':>9} {'at ms':>8}  module")
+        for name, (total, own, at) in sorted(self.modules.items(), key=lambda item: -item[1][1])[:limit]:
+            print(f"{own * 1000:9.1f} {total * 1000:9.1f} {at * 1000:8.0f}  {name}")
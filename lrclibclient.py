@@ -0,0 +1,218 @@
+import asyncio
+import gzip
+import json
+import ssl
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode, urlsplit
+from trackid import normalize
+import metrics
+
+# Async lrclib client on plain asyncio streams. Connections are HTTP/1.1 keep-alive and pooled per host,
+# so the staged searches for one track reuse a handful of sockets instead of a handshake per query.
+
+# how long a search answer is reused, lrclib gains lyrics slowly enough that a skipped and replayed track can
+# take the earlier answer
+RESPONSE_TTL = 600
+RESPONSE_ENTRIES = 512
+
+class HTTPError(Exception):
+    def __init__(self, status, url):
+        super().__init__(f"HTTP {status} for {url}")
+        self.status = status
+        self.url = url
+
+class ConnectionPool:
+    def __init__(self, max_per_host=6, idle_timeout=30):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.idle = {}
+        self.limits = {}
+        self.ssl_context = ssl.create_default_context()
+
+    async def request(self, url, headers):
+        parts = urlsplit(url)
+        secure = parts.scheme == 'https'
+        key = (parts.hostname, parts.port or (443 if secure else 80), secure)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        head = f"GET {target} HTTP/1.1\r\nHost: {parts.netloc}\r\nAccept-Encoding: gzip\r\nConnection: keep-alive\r\n"
+        head += ''.join(f"{name}: {value}\r\n" for name, value in headers.items())
+        head = (head + "\r\n").encode('latin-1')
+        limit = self.limits.setdefault(key, asyncio.Semaphore(self.max_per_host))
+        async with limit:
+            while True:
+                connection = self.take_idle(key)
+                reused = connection is not None
+                if connection is None:
+                    connection = await asyncio.open_connection(key[0], key[1], ssl=self.ssl_context if secure else None)
+                reader, writer = connection
+                try:
+                    writer.write(head)
+                    await writer.drain()
+                    status, response_headers, body = await self.read_response(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused:
+                        # the server dropped an idle keep-alive connection, retry on a fresh one
+                        continue
+                    raise
+                except BaseException:
+                    # cancelled or timed out mid response, the connection is in an unknown state
+                    writer.close()
+                    raise
+                break
+        if response_headers.get('connection', '').lower() == 'close':
+            writer.close()
+        else:
+            self.idle.setdefault(key, []).append((reader, writer, time.monotonic()))
+        if response_headers.get('content-encoding') == 'gzip':
+            body = gzip.decompress(body)
+        if status >= 400:
+            raise HTTPError(status, url)
+        return body
+
+    def take_idle(self, key):
+        connections = self.idle.get(key)
+        now = time.monotonic()
+        while connections:
+            reader, writer, last_used = connections.pop()
+            if now - last_used < self.idle_timeout and not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        return None
+
+    async def read_response(self, reader):
+        status_line = await reader.readuntil(b'\r\n')
+        status = int(status_line.split(None, 2)[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    while await reader.readuntil(b'\r\n') != b'\r\n':
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            headers['connection'] = 'close'
+        return status, headers, body
+
+    def close(self):
+        for connections in self.idle.values():
+            for _, writer, _ in connections:
+                writer.close()
+        self.idle.clear()
+
+class SearchResult:
+    __slots__ = ('id', 'track_name', 'artist_name', 'album_name', 'duration', 'instrumental', 'plain_lyrics', 'synced_lyrics')
+
+    def __init__(self, data):
+        self.id = data.get('id')
+        self.track_name = data.get('trackName')
+        self.artist_name = data.get('artistName')
+        self.album_name = data.get('albumName')
+        self.duration = data.get('duration') or 0
+        self.instrumental = bool(data.get('instrumental'))
+        self.plain_lyrics = data.get('plainLyrics')
+        self.synced_lyrics = data.get('syncedLyrics')
+
+class LrcLibClient:
+    def __init__(self, user_agent, base_url='https://lrclib.net', request_timeout=5.0, max_connections=6):
+        self.base_url = base_url.rstrip('/')
+        self.headers = {'User-Agent': user_agent, 'Lrclib-Client': user_agent}
+        self.request_timeout = request_timeout
+        self.pool = ConnectionPool(max_per_host=max_connections)
+
+    async def get_json(self, path, params=None):
+        url = self.base_url + path
+        if params:
+            url += '?' + urlencode(params)
+        body = await asyncio.wait_for(self.pool.request(url, self.headers), self.request_timeout)
+        return json.loads(body)
+
+    async def search_lyrics(self, track_name=None, artist_name=None, album_name=None, query=None):
+        params = {name: value for name, value in (('track_name', track_name), ('artist_name', artist_name),
+                                                 ('album_name', album_name), ('q', query)) if value}
+        return [SearchResult(item) for item in await self.get_json('/api/search', params)]
+
+    async def get_lyrics_by_id(self, lrclib_id):
+        return SearchResult(await self.get_json(f'/api/get/{lrclib_id}'))
+
+    def close(self):
+        self.pool.close()
+
+class CoalescingClient:
+    # In front of LrcLibClient: identical requests that are in flight share one call and answers are kept for
+    # ttl seconds, both keyed by the normalized request, so case and spacing differences still match. Errors
+    # are not kept. A caller that stops waiting (track skipped, query outranked) leaves the call running, it is
+    # already on the wire and its answer is what a replay of the skipped track asks for. Callers get the same
+    # result objects and must not change them.
+    def __init__(self, client, ttl=RESPONSE_TTL, max_entries=RESPONSE_ENTRIES, monotonic=time.monotonic):
+        self.client = client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.monotonic = monotonic
+        # key -> (expires, result), least recently used first
+        self.responses = OrderedDict()
+        # key -> task of the shared call
+        self.in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def search_lyrics(self, track_name=None, artist_name=None, album_name=None, query=None):
+        key = ('search', normalize(track_name), normalize(artist_name), normalize(album_name), normalize(query))
+        return await self.request(key, self.client.search_lyrics, track_name, artist_name, album_name, query)
+
+    async def get_lyrics_by_id(self, lrclib_id):
+        return await self.request(('get', str(lrclib_id)), self.client.get_lyrics_by_id, lrclib_id)
+
+    async def request(self, key, call, *args):
+        response = self.responses.get(key)
+        if response is not None:
+            if response[0] > self.monotonic():
+                self.responses.move_to_end(key)
+                self.hits += 1
+                metrics.count('lrclib_response_hits')
+                return response[1]
+            del self.responses[key]
+        task = self.in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            metrics.count('lrclib_response_misses')
+            task = self.in_flight[key] = asyncio.ensure_future(self.fetch(key, call, args))
+            # nobody may be waiting by the time it fails
+            task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        else:
+            self.coalesced += 1
+            metrics.count('lrclib_coalesced')
+        return await asyncio.shield(task)
+
+    async def fetch(self, key, call, args):
+        try:
+            result = await call(*args)
+        finally:
+            del self.in_flight[key]
+        self.responses[key] = (self.monotonic() + self.ttl, result)
+        while len(self.responses) > self.max_entries:
+            self.responses.popitem(last=False)
+        return result
+
+    def close(self):
+        for task in self.in_flight.values():
+            task.cancel()
+        self.client.close()
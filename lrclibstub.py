@@ -0,0 +1,105 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Local stand-in for the lrclib API (/api/search and /api/get/<id>) serving records from memory or a JSON file,
+# with an artificial latency, so the client, the staged search and the prefetcher can be exercised without the network.
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        params = {name: values[0] for name, values in parse_qs(parts.query).items()}
+        with server.stats_lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and server.rng.random() < server.error_rate:
+            self.send_json(503, {'code': 503, 'name': 'ServiceUnavailable', 'message': 'Injected failure'})
+        elif parts.path == '/api/search':
+            self.send_json(200, [record for record in server.records if matches(record, params)])
+        elif parts.path.startswith('/api/get/'):
+            record = server.by_id.get(parts.path[len('/api/get/'):])
+            if record is None:
+                self.send_json(404, {'code': 404, 'name': 'TrackNotFound', 'message': 'Failed to find specified track'})
+            else:
+                self.send_json(200, record)
+        else:
+            self.send_json(404, {'code': 404, 'name': 'NotFound', 'message': 'Not found'})
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def matches(record, params):
+    for param, field in (('track_name', 'trackName'), ('artist_name', 'artistName'), ('album_name', 'albumName')):
+        if param in params and params[param].casefold() not in (record.get(field) or '').casefold():
+            return False
+    if 'q' in params:
+        haystack = ' '.join(record.get(field) or '' for field in ('trackName', 'artistName', 'albumName')).casefold()
+        return all(word in haystack for word in params['q'].casefold().split())
+    return True
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, records, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0):
+        # error_rate is the share of requests answered with a 503, for exercising retries
+        super().__init__((host, port), StubHandler)
+        self.records = records
+        self.by_id = {str(record['id']): record for record in records}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(0)
+        self.requests = 0
+        self.stats_lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # clients hang up on queries they no longer need, that is not worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def make_record(record_id, track_name, artist_name, album_name='', duration=200.0, synced_lyrics=None, instrumental=False):
+    return {'id': record_id, 'trackName': track_name, 'artistName': artist_name, 'albumName': album_name,
+            'duration': duration, 'instrumental': instrumental,
+            'plainLyrics': None if synced_lyrics is None else '', 'syncedLyrics': synced_lyrics}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve lrclib style records from a JSON file')
+    parser.add_argument('records', help='JSON file holding a list of lrclib track records')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failing with a 503')
+    args = parser.parse_args()
+    with open(args.records, 'r', encoding='utf-8') as file:
+        server = StubServer(json.load(file), port=args.port, latency=args.latency, error_rate=args.error_rate)
+    print('serving on', server.base_url)
+    server.serve_forever()
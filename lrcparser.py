@@ -0,0 +1,128 @@
+import re
+from itertools import repeat
+from operator import add, itemgetter
+
+# Parses LRC lyric sheets into sorted (ms, text, words) tuples, ms being the integer start time in milliseconds
+# and words either None or a tuple of (ms, text) chunks from enhanced <mm:ss.xx> word tags.
+
+TIME_TAG = re.compile(r'\[(\d+):(\d+)(?:[.:](\d+))?\]')
+META_TAG = re.compile(r'\[([A-Za-z#]+):([^\]]*)\]')
+WORD_TAG = re.compile(r'<(\d+):(\d+)(?:[.:](\d+))?>')
+# the stamps after the first one of a line, some sheets put spaces between them
+NEXT_TIME_TAG = re.compile(r'[ \t]*\[(\d+):(\d+)(?:[.:](\d+))?\]')
+
+# Sheets where every line is "[mm:ss.xx] text" (what lrclib serves) are parsed with a few C level passes:
+# "[mm:ss." and "xx] " are looked up in two small tables instead of going through a regex and int() per line
+SIMPLE_HEADS = {f'[{minutes:02d}:{seconds:02d}.': (minutes * 60 + seconds) * 1000 for minutes in range(100) for seconds in range(60)}
+SIMPLE_TAILS = {f'{fraction:02d}]{space}': fraction * 10 for fraction in range(100) for space in ('', ' ')}
+simple_head = itemgetter(slice(0, 7))
+simple_tail = itemgetter(slice(7, 11))
+simple_text = itemgetter(slice(11, None))
+
+# .5 is 500 ms, .05 is 50 ms, .005 is 5 ms
+FRACTION_MS = {None: 0, '': 0}
+for digits in (1, 2, 3):
+    for value in range(10 ** digits):
+        FRACTION_MS[f'{value:0{digits}d}'] = value * 10 ** (3 - digits)
+
+def stamp_to_ms(minutes, seconds, fraction=None):
+    ms = FRACTION_MS.get(fraction)
+    if ms is None:
+        ms = int(fraction[:3])
+    return (int(minutes) * 60 + int(seconds)) * 1000 + ms
+
+def split_words(text):
+    parts = WORD_TAG.split(text)
+    words = []
+    for i in range(1, len(parts), 4):
+        words.append((stamp_to_ms(parts[i], parts[i + 1], parts[i + 2]), parts[i + 3]))
+    return ''.join(parts[0::4]).strip(), tuple(words)
+
+def parse_simple_sheet(text):
+    # returns None when the sheet needs the general parser, "] [" being a line with several stamps
+    if '<' in text or '\r' in text or '\t' in text or ']  ' in text or '] [' in text or ' \n' in text or text.endswith(' '):
+        return None
+    lines = text.split('\n')
+    if not lines[-1]:
+        lines.pop()
+    heads = list(map(SIMPLE_HEADS.get, map(simple_head, lines)))
+    tails = list(map(SIMPLE_TAILS.get, map(simple_tail, lines)))
+    if None in heads or None in tails:
+        return None
+    times = list(map(add, heads, tails))
+    entries = list(zip(times, map(simple_text, lines), repeat(None)))
+    if times != sorted(times):
+        entries.sort(key=itemgetter(0))
+    return entries
+
+def parse_lrc(text):
+    entries = parse_simple_sheet(text)
+    if entries is None:
+        entries = parse_lrc_lines(text.splitlines())
+    return entries
+
+def parse_lrc_lines(lines):
+    # works on any iterable of lines, e.g. an open file, without reading it into one string. The entries still
+    # come back as one list, sorted once the last line is read
+    offset = 0
+    entries = []
+    append = entries.append
+    heads = SIMPLE_HEADS
+    tails = SIMPLE_TAILS
+    for line in lines:
+        # the plain "[mm:ss.xx] text" lines of an extended sheet still go through the tables
+        head = heads.get(line[:7])
+        if head is not None:
+            tail = tails.get(line[7:11])
+            if tail is not None and '<' not in line:
+                text = line[11:].strip()
+                if not text.startswith('['):
+                    append((head + tail, text, None))
+                    continue
+        match = TIME_TAG.match(line)
+        if match is None:
+            line = line.strip()
+            if not line.startswith('['):
+                continue
+            match = TIME_TAG.match(line)
+            if match is None:
+                meta = META_TAG.fullmatch(line)
+                if meta and meta.group(1).lower() == 'offset':
+                    try:
+                        offset = int(meta.group(2).strip())
+                    except ValueError:
+                        pass
+                continue
+        ms = stamp_to_ms(*match.groups())
+        end = match.end()
+        text = line[end:].strip()
+        words = None
+        if text.startswith('['):
+            # a line can carry several stamps, e.g. [00:12.00][01:30.00]chorus or [00:12.00] [01:30.00] chorus
+            stamps = [ms]
+            match = NEXT_TIME_TAG.match(line, end)
+            while match:
+                stamps.append(stamp_to_ms(*match.groups()))
+                end = match.end()
+                match = NEXT_TIME_TAG.match(line, end)
+            text = line[end:].strip()
+            if '<' in text and WORD_TAG.search(text):
+                text, words = split_words(text)
+            first = stamps[0]
+            for ms in stamps:
+                # word stamps are written against the first line stamp, each repeat sings them that much later
+                if words and ms != first:
+                    shift = ms - first
+                    append((ms, text, tuple((word_ms + shift, word) for word_ms, word in words)))
+                else:
+                    append((ms, text, words))
+            continue
+        if '<' in text and WORD_TAG.search(text):
+            text, words = split_words(text)
+        append((ms, text, words))
+    if offset:
+        # a positive offset makes the lyrics show up sooner
+        entries = [(max(ms - offset, 0), text, words if words is None else tuple((max(word_ms - offset, 0), word) for word_ms, word in words))
+                   for ms, text, words in entries]
+    entries.sort(key=itemgetter(0))
+    return entries
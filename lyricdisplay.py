@@ -0,0 +1,132 @@
+from collections import OrderedDict
+from tkinter import *
+from tkinter import font as tkfont
+import colors
+
+MEASURE_CACHE_SIZE = 1024
+
+def round_rectangle_points(x1, y1, x2, y2, radius=25):
+    return [
+        x1 + radius, y1,
+        x1 + radius, y1,
+        x2 - radius, y1,
+        x2 - radius, y1,
+        x2, y1,
+        x2, y1 + radius,
+        x2, y1 + radius,
+        x2, y2 - radius,
+        x2, y2 - radius,
+        x2, y2,
+        x2 - radius, y2,
+        x2 - radius, y2,
+        x1 + radius, y2,
+        x1 + radius, y2,
+        x1, y2,
+        x1, y2 - radius,
+        x1, y2 - radius,
+        x1, y1 + radius,
+        x1, y1 + radius,
+        x1, y1
+    ]
+
+def round_rectangle(canvas, x1, y1, x2, y2, radius=25, **kwargs):
+    return canvas.create_polygon(round_rectangle_points(x1, y1, x2, y2, radius), **kwargs, smooth=True)
+
+class LyricDisplay:
+    # Retained renderer: the background and both text lines are created once and only reconfigured afterwards
+    def __init__(self, root, text, color1='gray10', color2='white'):
+        self.root = root
+        self.canvas = Canvas(self.root, bg='magenta', highlightthickness=0)
+        self.canvas.pack(fill=BOTH, expand=True)
+        self.color1 = color1
+        self.color2 = color2
+        self.font = ('ProximaNova', 15)
+        self.measure_font = tkfont.Font(root=root, font=self.font)
+        self.line_height = self.measure_font.metrics('linespace')
+        self.measurements = OrderedDict()
+        self.padding = 10
+        self.window_x = (root.winfo_screenwidth() // 2) - 150  # Initial x position
+        self.window_y = root.winfo_screenheight() - 100  # Initial y position
+        self.window_size = None
+        self.text_center = (0, 0)
+        # instrumentation, items_created stays at 3 however long the session runs
+        self.redraws = 0
+        self.geometry_changes = 0
+        self.items_created = 0
+        self.background = round_rectangle(self.canvas, 0, 0, 1, 1, radius=20, state=HIDDEN)
+        self.first_line = self.canvas.create_text(0, 0, font=self.font, anchor=CENTER, state=HIDDEN)
+        self.second_line = self.canvas.create_text(0, 0, font=self.font, anchor=CENTER, state=HIDDEN)
+        self.items_created += 3
+        self.update_text(text)
+
+        # Bind the mouse events for dragging
+        self.canvas.bind("<Button-1>", self.start_move)
+        self.canvas.bind("<B1-Motion>", self.do_move)
+        # Bind double-click event to center the window
+        self.canvas.bind("<Double-Button-1>", self.center_window)
+
+    def start_move(self, event):
+        self._drag_data = {'x': event.x, 'y': event.y}
+
+    def do_move(self, event):
+        deltax = event.x - self._drag_data['x']
+        deltay = event.y - self._drag_data['y']
+        self.window_x = self.root.winfo_x() + deltax
+        self.window_y = self.root.winfo_y() + deltay
+        self.root.geometry(f"+{self.window_x}+{self.window_y}")
+
+    def center_window(self, event):
+        screen_width = self.root.winfo_screenwidth()
+        screen_height = self.root.winfo_screenheight()
+        window_width = self.root.winfo_width()
+        window_height = self.root.winfo_height()
+        self.window_x = (screen_width // 2) - (window_width // 2)
+        self.window_y = screen_height - window_height - 30
+        self.root.geometry(f"+{self.window_x}+{self.window_y}")
+
+    def measure(self, lines):
+        key = (lines, self.font)
+        size = self.measurements.get(key)
+        if size is None:
+            size = (max(self.measure_font.measure(line) for line in lines), self.line_height * len(lines))
+            self.measurements[key] = size
+            if len(self.measurements) > MEASURE_CACHE_SIZE:
+                self.measurements.popitem(last=False)
+        else:
+            self.measurements.move_to_end(key)
+        return size
+
+    def update_text(self, text, ucolor1='gray10', ucolor2='white'):
+        self.color1 = ucolor1
+        self.color2 = ucolor2
+        self.redraws += 1
+        if len(text) == 0:
+            for item in (self.background, self.first_line, self.second_line):
+                self.canvas.itemconfigure(item, state=HIDDEN)
+            return
+        lines = tuple(text.split("\n")[:2])
+        width, height = self.measure(lines)
+        x1 = self.padding
+        y1 = self.padding
+        x2 = width + 2 * self.padding
+        y2 = height + 2 * self.padding
+        center_x = (x1 + x2) // 2
+        center_y = (y1 + y2) // 2
+        self.text_center = (center_x, center_y)
+        self.canvas.coords(self.background, *round_rectangle_points(x1, y1, x2, y2, radius=20))
+        self.canvas.itemconfigure(self.background, fill=self.color1, outline=self.color1, state=NORMAL)
+        if len(lines) == 2:
+            self.canvas.coords(self.first_line, center_x, center_y - 12)
+            self.canvas.itemconfigure(self.first_line, text=lines[0], fill=self.color2, anchor=CENTER, state=NORMAL)
+            self.canvas.coords(self.second_line, center_x, center_y + 12)
+            self.canvas.itemconfigure(self.second_line, text=lines[1], fill=colors.halfway_tone(self.color1, self.color2), state=NORMAL)
+        else:
+            self.canvas.coords(self.first_line, center_x, center_y)
+            self.canvas.itemconfigure(self.first_line, text=lines[0], fill=self.color2, anchor=CENTER, state=NORMAL)
+            self.canvas.itemconfigure(self.second_line, state=HIDDEN)
+        window_size = (x2 - x1 + 30, y2 - y1 + 30)
+        if window_size != self.window_size:
+            self.window_size = window_size
+            self.geometry_changes += 1
+            self.canvas.config(width=window_size[0], height=window_size[1])
+            self.root.geometry(f"{window_size[0]}x{window_size[1]}+{self.window_x}+{self.window_y}")
@@ -0,0 +1,97 @@
+import sqlite3
+import threading
+import time
+from timeline import LyricTimeline
+
+# Single file lyrics cache keyed by trackid.track_key. Each row holds the raw LRC text and the compiled timeline blob, so a hit is one
+# primary key lookup and no parsing. Rows without lyrics are negative entries that expire after negative_ttl.
+
+NO_LYRICS = object()
+
+class LyricsNotFound(Exception):
+    # every provider answered and none had the track, the only lookup failure worth a negative entry
+    pass
+
+class LyricStore:
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, negative_ttl=6 * 3600, touch_interval=3600, clock=time.time):
+        # clock is wall time, the entries outlive the process
+        self.path = path
+        self.clock = clock
+        self.max_bytes = max_bytes
+        self.negative_ttl = negative_ttl
+        # LRU order only needs coarse access times, so hits rarely turn into writes
+        self.touch_interval = touch_interval
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS lyrics (
+            key TEXT PRIMARY KEY,
+            raw TEXT,
+            timeline BLOB,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL
+        ) WITHOUT ROWID''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS lyrics_accessed ON lyrics (accessed)')
+        self.total_bytes = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM lyrics').fetchone()[0]
+
+    def get(self, key):
+        # returns (raw, timeline), NO_LYRICS for a live negative entry or None on a miss
+        now = self.clock()
+        with self.lock:
+            row = self.connection.execute('SELECT raw, timeline, created, accessed FROM lyrics WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            raw, blob, created, accessed = row
+            if raw is None and now - created > self.negative_ttl:
+                self.connection.execute('DELETE FROM lyrics WHERE key = ?', (key,))
+                return None
+            if now - accessed > self.touch_interval:
+                self.connection.execute('UPDATE lyrics SET accessed = ? WHERE key = ?', (now, key))
+        if raw is None:
+            return NO_LYRICS
+        return raw, LyricTimeline.from_bytes(blob)
+
+    def put(self, key, raw, timeline):
+        blob = timeline.to_bytes()
+        self.write(key, raw, blob, len(key) + len(raw.encode('utf-8')) + len(blob))
+
+    def put_missing(self, key):
+        self.write(key, None, None, len(key))
+
+    def write(self, key, raw, blob, size):
+        now = self.clock()
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                old = self.connection.execute('SELECT size FROM lyrics WHERE key = ?', (key,)).fetchone()
+                self.connection.execute('INSERT OR REPLACE INTO lyrics VALUES (?, ?, ?, ?, ?, ?)', (key, raw, blob, size, now, now))
+                self.total_bytes += size - (old[0] if old else 0)
+                if self.total_bytes > self.max_bytes:
+                    self.evict()
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+
+    def evict(self):
+        # other processes may share the file, so recount before dropping the least recently used rows
+        self.total_bytes = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM lyrics').fetchone()[0]
+        target = self.max_bytes * 0.9
+        rows = self.connection.execute('SELECT key, size FROM lyrics ORDER BY accessed')
+        victims = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            victims.append((key,))
+            self.total_bytes -= size
+        self.connection.executemany('DELETE FROM lyrics WHERE key = ?', victims)
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM lyrics').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
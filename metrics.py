@@ -0,0 +1,210 @@
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Timing spans and histograms for the stages between a track change and its lyrics on screen. Disabled by
+# default, span() then hands out one shared no-op object and observe() returns at once.
+# Exported as a rotating JSON lines file and a Prometheus text endpoint (/metrics).
+
+DURATION_BOUNDS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+LATENESS_BOUNDS = (-500, -100, -50, -10, 0, 10, 50, 100, 250, 500, 1000, 2500)
+# histograms that are not plain durations
+BOUNDS = {
+    'line_lateness_ms': LATENESS_BOUNDS,
+}
+EXPORT_INTERVAL = 30
+
+class Histogram:
+    def __init__(self, bounds=DURATION_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, fraction):
+        # upper bound of the bucket holding the quantile, the last finite bound for the overflow bucket
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.bounds[-1]
+
+    def snapshot(self):
+        with self.lock:
+            cumulative = []
+            seen = 0
+            for bound, count in zip(self.bounds, self.counts):
+                seen += count
+                cumulative.append((bound, seen))
+            return {'count': self.count, 'sum': round(self.sum, 3), 'buckets': cumulative,
+                    'p50': self.quantile(0.5) if self.count else None, 'p95': self.quantile(0.95) if self.count else None}
+
+class Span:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe((time.perf_counter() - self.start) * 1000)
+        return False
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram(BOUNDS.get(name, DURATION_BOUNDS)))
+        return histogram
+
+    def span(self, name):
+        # with metrics.span('palette'): ... records the block's wall time in ms under palette_ms
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self.histogram(name + '_ms'))
+
+    def observe(self, name, value):
+        if self.enabled:
+            self.histogram(name).observe(value)
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(sorted(self.counters.items()))
+        return {'time': round(time.time(), 3), 'histograms': {name: histogram.snapshot() for name, histogram in sorted(self.histograms.items())},
+                'counters': counters}
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+        for name, value in counters:
+            lines.append(f"# TYPE winlyrics_{name}_total counter")
+            lines.append(f"winlyrics_{name}_total {value}")
+        for name, histogram in sorted(self.histograms.items()):
+            metric = 'winlyrics_' + name
+            snapshot = histogram.snapshot()
+            lines.append(f"# TYPE {metric} histogram")
+            for bound, count in snapshot['buckets']:
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {snapshot["count"]}')
+            lines.append(f"{metric}_sum {snapshot['sum']}")
+            lines.append(f"{metric}_count {snapshot['count']}")
+        return "\n".join(lines) + "\n"
+
+registry = Metrics()
+
+def enable():
+    registry.enabled = True
+
+def span(name):
+    return registry.span(name)
+
+def observe(name, value):
+    registry.observe(name, value)
+
+def count(name, amount=1):
+    registry.count(name, amount)
+
+class JsonExporter:
+    # appends a snapshot per line, rotating to path.1 .. path.<backups> past max_bytes
+    def __init__(self, path, max_bytes=1024 * 1024, backups=3, metrics=registry, executor=None):
+        # with an executor the file writes happen on its threads
+        self.path = path
+        self.executor = executor
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.metrics = metrics
+
+    def write(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+            self.rotate()
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(self.metrics.snapshot()) + '\n')
+
+    def rotate(self):
+        for number in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{number}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{number + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    async def run(self, interval=EXPORT_INTERVAL):
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                if self.executor:
+                    await self.executor.io(self.write)
+                else:
+                    self.write()
+        finally:
+            self.write()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.metrics.prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=9464, metrics=registry):
+        super().__init__((host, port), MetricsHandler)
+        self.metrics = metrics
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
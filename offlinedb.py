@@ -0,0 +1,205 @@
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from executor import inline
+from lrclibclient import SearchResult
+from trackid import fold
+
+# Offline lyrics index built from an lrclib database dump (or a JSON list of lrclib records, as served by
+# lrclibstub). Track, artist and album are folded (casefold, no accents) into an FTS5 word index, the search's
+# queries become phrase lookups, and durations are bucketed so a query scoped to the playing track only looks
+# at candidates the ranking would accept anyway. An optional trigram index answers substring queries that
+# match no whole words; it is several times larger and slower on common trigrams, so it is only a fallback.
+
+DURATION_BUCKET = 10
+SEARCH_LIMIT = 20
+# the trigram tokenizer can not match shorter terms
+MIN_TRIGRAM_TERM = 3
+IMPORT_BATCH = 5000
+
+COLUMNS = (('track_name', 'track'), ('artist_name', 'artist'), ('album_name', 'album'))
+
+def duration_bucket(duration):
+    return int(duration or 0) // DURATION_BUCKET
+
+def phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+class OfflineIndex:
+    def __init__(self, path, trigram=False, executor=inline):
+        # search_lyrics runs the SQLite lookups on executor's threads
+        self.path = path
+        self.executor = executor
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.create_function('fold', 1, fold, deterministic=True)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS tracks (
+            id INTEGER PRIMARY KEY,
+            track_name TEXT,
+            artist_name TEXT,
+            album_name TEXT,
+            duration REAL,
+            bucket INTEGER,
+            instrumental INTEGER,
+            plain_lyrics TEXT,
+            synced_lyrics TEXT
+        )''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS tracks_bucket ON tracks (bucket)')
+        self.connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS track_words USING fts5(track, artist, album, content='', tokenize='unicode61 remove_diacritics 2')")
+        if trigram:
+            self.connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS track_grams USING fts5(track, artist, album, content='', tokenize='trigram')")
+        self.trigram = self.connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'track_grams'").fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM tracks').fetchone()[0]
+
+    def import_dump(self, dump_path):
+        # lrclib dump layout: tracks(id, name, artist_name, album_name, duration, last_lyrics_id, ...) and
+        # lyrics(id, plain_lyrics, synced_lyrics, instrumental, ...)
+        with self.lock:
+            self.connection.execute('ATTACH DATABASE ? AS dump', (dump_path,))
+            try:
+                self.connection.execute('BEGIN')
+                self.connection.execute(f'''INSERT OR REPLACE INTO tracks
+                    SELECT t.id, t.name, t.artist_name, t.album_name, t.duration, CAST(t.duration AS INTEGER) / {DURATION_BUCKET},
+                           COALESCE(l.instrumental, 0), l.plain_lyrics, l.synced_lyrics
+                    FROM dump.tracks t LEFT JOIN dump.lyrics l ON l.id = t.last_lyrics_id''')
+                self.rebuild_search()
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            finally:
+                self.connection.execute('DETACH DATABASE dump')
+
+    def import_records(self, records):
+        # records in the lrclib API shape (trackName, artistName, albumName, duration, syncedLyrics, ...)
+        with self.lock:
+            self.connection.execute('BEGIN')
+            try:
+                batch = []
+                for record in records:
+                    batch.append((record['id'], record.get('trackName'), record.get('artistName'), record.get('albumName'),
+                                  record.get('duration') or 0, duration_bucket(record.get('duration')),
+                                  int(bool(record.get('instrumental'))), record.get('plainLyrics'), record.get('syncedLyrics')))
+                    if len(batch) >= IMPORT_BATCH:
+                        self.connection.executemany('INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+                        batch = []
+                self.connection.executemany('INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+                self.rebuild_search()
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+
+    def rebuild_search(self):
+        # called with the lock held
+        tables = ('track_words', 'track_grams') if self.trigram else ('track_words',)
+        # contentless tables, only the rowids come back out of a match
+        for table in tables:
+            self.connection.execute(f"INSERT INTO {table} ({table}) VALUES ('delete-all')")
+            self.connection.execute(f'''INSERT INTO {table} (rowid, track, artist, album)
+                SELECT id, fold(track_name), fold(artist_name), fold(album_name) FROM tracks''')
+            self.connection.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+
+    def search(self, track_name=None, artist_name=None, album_name=None, query=None, duration=None, limit=SEARCH_LIMIT):
+        # same filters as /api/search: every given field must contain the text, query matches words in any field
+        fields = [(column, fold(value)) for (_, column), value in zip(COLUMNS, (track_name, artist_name, album_name))]
+        words = fold(query).split()
+        results = self.match('track_words', fields, words, duration, limit)
+        if not results and self.trigram:
+            fields = [(column, term) for column, term in fields if len(term) >= MIN_TRIGRAM_TERM]
+            words = [word for word in words if len(word) >= MIN_TRIGRAM_TERM]
+            results = self.match('track_grams', fields, words, duration, limit)
+        return results
+
+    def match(self, table, fields, words, duration, limit):
+        terms = [f"{column} : {phrase(term)}" for column, term in fields if term]
+        terms += [phrase(word) for word in words]
+        if not terms:
+            return []
+        # no ORDER BY rank, scoring every match of a common word costs more than the lookup and the ranking
+        # re-orders the candidates by duration anyway
+        conditions = [f'{table} MATCH ?']
+        params = [' AND '.join(terms)]
+        if duration:
+            bucket = duration_bucket(duration)
+            conditions.append('t.bucket BETWEEN ? AND ?')
+            params += [bucket - 1, bucket + 1]
+        with self.lock:
+            rows = self.connection.execute(f'''SELECT t.id, t.track_name, t.artist_name, t.album_name, t.duration,
+                    t.instrumental, t.plain_lyrics, t.synced_lyrics
+                FROM {table} s JOIN tracks t ON t.id = s.rowid
+                WHERE {' AND '.join(conditions)} LIMIT ?''', (*params, limit)).fetchall()
+        return [search_result(row) for row in rows]
+
+    def get(self, lrclib_id):
+        with self.lock:
+            row = self.connection.execute('''SELECT id, track_name, artist_name, album_name, duration, instrumental,
+                plain_lyrics, synced_lyrics FROM tracks WHERE id = ?''', (lrclib_id,)).fetchone()
+        return search_result(row) if row else None
+
+    def scoped(self, duration):
+        return ScopedIndex(self, duration)
+
+    async def search_lyrics(self, track_name=None, artist_name=None, album_name=None, query=None):
+        return await self.executor.io(self.search, track_name, artist_name, album_name, query)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+class ScopedIndex:
+    # search_lyrics client for ranking.staged_search that only returns tracks near the playing track's duration
+    def __init__(self, index, duration):
+        self.index = index
+        self.duration = duration
+
+    async def search_lyrics(self, track_name=None, artist_name=None, album_name=None, query=None):
+        return await self.index.executor.io(self.index.search, track_name, artist_name, album_name, query, self.duration)
+
+def search_result(row):
+    track_id, track_name, artist_name, album_name, duration, instrumental, plain_lyrics, synced_lyrics = row
+    return SearchResult({'id': track_id, 'trackName': track_name, 'artistName': artist_name, 'albumName': album_name,
+                         'duration': duration, 'instrumental': bool(instrumental), 'plainLyrics': plain_lyrics,
+                         'syncedLyrics': synced_lyrics})
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or query the offline lrclib index')
+    parser.add_argument('index', help='index database, saved/lrclib.db for working.py')
+    commands = parser.add_subparsers(dest='command', required=True)
+    dump_parser = commands.add_parser('import', help='import an lrclib SQLite dump')
+    dump_parser.add_argument('dump')
+    records_parser = commands.add_parser('import-json', help='import a JSON list of lrclib records')
+    records_parser.add_argument('records')
+    for command in (dump_parser, records_parser):
+        command.add_argument('--trigram', action='store_true', help='also build the substring fallback index')
+    search_parser = commands.add_parser('search')
+    search_parser.add_argument('--track')
+    search_parser.add_argument('--artist')
+    search_parser.add_argument('--album')
+    search_parser.add_argument('--query')
+    search_parser.add_argument('--duration', type=float)
+    args = parser.parse_args()
+
+    index = OfflineIndex(args.index, trigram=getattr(args, 'trigram', False))
+    start = time.perf_counter()
+    if args.command == 'import':
+        index.import_dump(args.dump)
+        print(f"{len(index)} tracks indexed in {time.perf_counter() - start:.1f} s")
+    elif args.command == 'import-json':
+        with open(args.records, 'r', encoding='utf-8') as file:
+            index.import_records(json.load(file))
+        print(f"{len(index)} tracks indexed in {time.perf_counter() - start:.1f} s")
+    else:
+        results = index.search(args.track, args.artist, args.album, args.query, args.duration)
+        elapsed = time.perf_counter() - start
+        for result in results:
+            print(f"{result.id}  {result.track_name} - {result.artist_name} ({result.album_name}) {result.duration:.0f} s"
+                  f"{'  synced' if result.synced_lyrics else ''}")
+        print(f"{len(results)} results in {elapsed * 1000:.2f} ms")
+    index.close()
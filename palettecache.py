@@ -0,0 +1,119 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import plugins
+
+# Palettes keyed by a hash of the raw thumbnail bytes. Albums repeat a lot, so most track changes are answered
+# from memory or the on-disk table without decoding the cover or quantizing it again.
+
+DEFAULT_PALETTE = plugins.DEFAULT_PALETTE
+
+def thumbnail_key(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def compute_palette(compute, data, num_colors):
+    # compute is a palette backend from plugins, run in a process pool worker
+    return compute(data, num_colors) or DEFAULT_PALETTE
+
+class PaletteCache:
+    def __init__(self, path=None, num_colors=10, memory_entries=256, disk_entries=4096, backend=None):
+        # backend names a palette backend in plugins, by default the first one installed
+        self.num_colors = num_colors
+        self.backend, self.compute = plugins.load('palette', backend)
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = None
+        if path:
+            self.connection = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS palettes (
+                key BLOB PRIMARY KEY,
+                color1 TEXT NOT NULL,
+                color2 TEXT NOT NULL,
+                halfway TEXT NOT NULL,
+                accessed REAL NOT NULL
+            ) WITHOUT ROWID''')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS palettes_accessed ON palettes (accessed)')
+
+    def get(self, data):
+        # returns (color1, color2, halfway tone) for the encoded thumbnail bytes
+        if not data:
+            return DEFAULT_PALETTE
+        key = thumbnail_key(data)
+        palette = self.lookup(key)
+        if palette is None:
+            palette = compute_palette(self.compute, data, self.num_colors)
+            self.save(key, palette)
+        return palette
+
+    async def get_async(self, data, executor, group=None):
+        # get() with the disk table on the executor's threads and the quantizing on its process pool
+        if not data:
+            return DEFAULT_PALETTE
+        key = thumbnail_key(data)
+        with self.lock:
+            palette = self.memory.get(key)
+            if palette is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return palette
+        palette = await executor.io(self.lookup, key, group=group)
+        if palette is None:
+            palette = await executor.cpu(compute_palette, self.compute, data, self.num_colors, group=group)
+            await executor.io(self.save, key, palette, group=group)
+        return palette
+
+    def lookup(self, key):
+        with self.lock:
+            palette = self.memory.get(key)
+            if palette is None:
+                palette = self.load(key)
+                if palette is None:
+                    self.misses += 1
+                    return None
+                self.remember(key, palette)
+            else:
+                self.memory.move_to_end(key)
+            self.hits += 1
+            return palette
+
+    def save(self, key, palette):
+        if palette == DEFAULT_PALETTE:
+            # undecodable thumbnail, not worth a row
+            return
+        with self.lock:
+            self.store(key, palette)
+            self.remember(key, palette)
+
+    def remember(self, key, palette):
+        self.memory[key] = palette
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def load(self, key):
+        if self.connection is None:
+            return None
+        row = self.connection.execute('SELECT color1, color2, halfway FROM palettes WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self.connection.execute('UPDATE palettes SET accessed = ? WHERE key = ?', (time.time(), key))
+        return tuple(row)
+
+    def store(self, key, palette):
+        if self.connection is None:
+            return
+        self.connection.execute('INSERT OR REPLACE INTO palettes VALUES (?, ?, ?, ?, ?)', (key, *palette, time.time()))
+        # drop the least recently used palettes past the disk budget
+        self.connection.execute('''DELETE FROM palettes WHERE key IN (
+            SELECT key FROM palettes ORDER BY accessed DESC LIMIT -1 OFFSET ?)''', (self.disk_entries,))
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
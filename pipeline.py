@@ -0,0 +1,243 @@
+import asyncio
+from executor import inline
+from lazyimport import lazy_module
+from timeline import LyricTimeline, SheetCache
+import lyricstore
+import metrics
+import playback
+import trackid
+
+# builds its lookup tables on import, only needed when lyrics come from a provider rather than the store
+lrcparser = lazy_module('lrcparser')
+
+# The track following and line switching loop, kept free of Tk and WinRT so replay.py can run it headless.
+
+RETRY_DELAY = 2
+
+class TrackChanged(Exception):
+    pass
+
+class LyricPipeline:
+    def __init__(self, engine, lyric_display, lyric_store, palette_cache, get_media_info, fetch_lyrics, karaoke_player=None,
+                 executor=inline, sheet_cache=None, broadcaster=None):
+        # get_media_info() returns the current MediaInfo, fetch_lyrics(media_info) returns (LRC text, its
+        # lrcparser.parse_lrc lines when the provider already parsed them, else None) or raises,
+        # lyricstore.LyricsNotFound when the track has no lyrics anywhere and anything else when it could not tell.
+        # Store, palette and file work goes through executor, jobs are grouped by track key and cancelled when
+        # the track changes. sheet_cache keeps compiled sheets in memory in front of the store. broadcaster
+        # (broadcast.BroadcastServer) gets the sheet on a track change and the clock whenever it moves.
+        self.engine = engine
+        self.lyric_display = lyric_display
+        self.lyric_store = lyric_store
+        self.palette_cache = palette_cache
+        self.get_media_info = get_media_info
+        self.fetch_lyrics = fetch_lyrics
+        self.karaoke_player = karaoke_player
+        self.executor = executor
+        self.sheet_cache = sheet_cache if sheet_cache is not None else SheetCache()
+        self.broadcaster = broadcaster
+        self.retry_delay = RETRY_DELAY
+        self.track_key = None
+        # track key -> task preparing ((lyrics, timeline) or NO_LYRICS, palette), shared by every session playing it
+        self.prepared = {}
+        # session id -> key of the track it plays, filled by track_changed
+        self.session_keys = {}
+
+    async def display_lyrics(self, timeline, startinfo, palette):
+        # returns when the displayed track or session changes
+        lyric_display = self.lyric_display
+        karaoke_player = self.karaoke_player
+        last_displayed_index = -1
+        state = self.engine.state
+        clock = self.engine.clock
+        playback_status = state.status
+        color1, color2, _ = palette
+        lyric_display.update_text(str(f"{startinfo.title} - {startinfo.artist}"), color1, color2)
+        broadcaster = self.broadcaster
+        if broadcaster:
+            broadcaster.show_track(startinfo, timeline, palette, clock)
+
+        def current_position_ms():
+            return int(clock.now()[0] * 1000)
+
+        if karaoke_player:
+            # the frame scheduler switches and animates the lines, this loop only follows the session
+            karaoke_player.play(timeline, current_position_ms, color1, color2)
+        try:
+            while True:
+                if state.status != playback_status:
+                    print(state.status)
+                playback_status = state.status
+                if self.engine.state is not state or state.title != startinfo.title:
+                    return
+                if broadcaster:
+                    # a no-op unless a sample, seek or pause moved the clock
+                    broadcaster.update_clock(clock)
+                wait = None
+                if karaoke_player:
+                    karaoke_player.set_running(playback_status == playback.PLAYING)
+
+                elif playback_status == playback.PLAYING:
+                    current_position_ms_now = current_position_ms()
+
+                    # Find the current index based on the current position
+                    new_displayed_index = timeline.index_at(current_position_ms_now)
+
+                    # Check if the new displayed index is different from the last displayed index
+                    if new_displayed_index != last_displayed_index:
+                        if new_displayed_index >= 0 and new_displayed_index < len(timeline) - 1:
+                            linestodisplay = f"{timeline.text(new_displayed_index)}\n{timeline.text(new_displayed_index + 1)}"
+                            print(timeline.text(new_displayed_index))
+                            with metrics.span('update_text'):
+                                lyric_display.update_text(linestodisplay, color1, color2)
+                            self.observe_switch(timeline, new_displayed_index, last_displayed_index, current_position_ms_now)
+                            last_displayed_index = new_displayed_index
+
+                    # Sleep until the next line boundary, session events wake us up earlier
+                    until_next = timeline.ms_until_next(current_position_ms_now)
+                    if until_next is not None:
+                        wait = until_next / 1000
+
+                await self.engine.wait_for_change(wait)
+        finally:
+            if karaoke_player:
+                karaoke_player.stop()
+
+    def observe_switch(self, timeline, index, previous_index, position_ms):
+        # lateness of a switch that happened by playing on, seeks jump over lines and are not counted
+        lateness = position_ms - timeline.times[index]
+        if previous_index == -1:
+            now = self.engine.monotonic()
+            due = now - lateness / 1000
+            metrics.observe('first_line_ms', (now - max(self.engine.state.media_changed, due)) * 1000)
+        elif index == previous_index + 1:
+            metrics.observe('line_lateness_ms', lateness)
+
+    async def while_current(self, awaitable, title):
+        # awaits awaitable unless the displayed track or session changes first, then cancels it
+        state = self.engine.state
+        task = asyncio.ensure_future(awaitable)
+        try:
+            while not task.done():
+                if self.engine.state is not state or state.title != title:
+                    raise TrackChanged('music change')
+                change = asyncio.ensure_future(self.engine.wait_for_change())
+                try:
+                    await asyncio.wait((task, change), return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    change.cancel()
+            return task.result()
+        finally:
+            task.cancel()
+
+    async def prepare(self, media_info, key):
+        # lyrics from the store or the provider, and the cover palette, for one track
+        executor = self.executor
+        lyric_store = self.lyric_store
+        timeline = self.sheet_cache.get(key)
+        if timeline is not None:
+            # replayed or switched back to: the compiled sheet is still in memory, the raw text is not needed
+            cached = None, timeline
+        else:
+            with metrics.span('cache_lookup'):
+                cached = await executor.io(lyric_store.get, key, group=key)
+                near_key = trackid.neighbour_key(media_info.title, media_info.artist, media_info.duration)
+                if cached is None and near_key:
+                    cached = await executor.io(lyric_store.get, near_key, group=key)
+            if cached is lyricstore.NO_LYRICS:
+                print("no lyrics cached for:", key)
+                return cached, None
+            if cached:
+                print("loaded cached lyrics:", key)
+                self.sheet_cache.put(key, cached[1])
+            else:
+                try:
+                    with metrics.span('lyrics_fetch'):
+                        lyrics, lines = await self.fetch_lyrics(media_info)
+                except lyricstore.LyricsNotFound as e:
+                    print(e)
+                    await executor.io(lyric_store.put_missing, key, group=key)
+                    return lyricstore.NO_LYRICS, None
+                except Exception as e:
+                    # an outage or an open breaker: nothing is cached, and this task is dropped so that the next
+                    # play, or another session switching to the track, asks again rather than reusing its answer
+                    print(e)
+                    if self.prepared.get(key) is asyncio.current_task():
+                        del self.prepared[key]
+                    return lyricstore.NO_LYRICS, None
+                if lines is None:
+                    lines = lrcparser.parse_lrc(lyrics)
+                timeline = LyricTimeline(lines)
+                await executor.io(lyric_store.put, key, lyrics, timeline, group=key)
+                self.sheet_cache.put(key, timeline)
+                cached = lyrics, timeline
+        with metrics.span('palette'):
+            palette = await self.palette_cache.get_async(media_info.thumbnail_bytes, executor, key)
+        return cached, palette
+
+    def prefetch(self, media_info):
+        # starts preparing the track unless that is already under way, returns the task
+        key = trackid.track_key(media_info.title, media_info.artist, media_info.duration)
+        task = self.prepared.get(key)
+        if task is None or (task.done() and (task.cancelled() or task.exception())):
+            task = asyncio.get_running_loop().create_task(self.prepare(media_info, key))
+            self.prepared[key] = task
+        return key, task
+
+    def track_changed(self, session_id, media_info):
+        # SessionManager.on_track: a session started another track (media_info) or closed (None)
+        old_key = self.session_keys.pop(session_id, None)
+        if media_info is not None:
+            self.session_keys[session_id] = self.prefetch(media_info)[0]
+        if old_key is not None:
+            self.release(old_key)
+
+    def release(self, key):
+        # drops a track no session plays and that is not on screen, cancelling whatever it still had queued
+        if key == self.track_key or key in self.session_keys.values():
+            return
+        task = self.prepared.pop(key, None)
+        if task is not None:
+            task.cancel()
+        self.executor.cancel(key)
+
+    async def wait_for_track_end(self, title):
+        state = self.engine.state
+        while self.engine.state is state and state.title == title:
+            await self.engine.wait_for_change()
+
+    async def run(self):
+        engine = self.engine
+        lyric_display = self.lyric_display
+        await engine.start()
+        while True:
+            key = None
+            try:
+                lyric_display.update_text("")
+                with metrics.span('get_media_info'):
+                    current_media_info = await self.get_media_info()
+                print(current_media_info)
+                key, task = self.prefetch(current_media_info)
+                self.track_key = key
+                # a prefetched track is ready at once, otherwise this waits unless the track changes meanwhile
+                cached, palette = await self.while_current(asyncio.shield(task), current_media_info.title)
+                if cached is lyricstore.NO_LYRICS:
+                    if self.broadcaster:
+                        self.broadcaster.show_track(current_media_info, None, None, self.engine.clock)
+                    await self.wait_for_track_end(current_media_info.title)
+                else:
+                    lyrics, timeline = cached
+                    await self.display_lyrics(timeline, current_media_info, palette)
+            except TrackChanged:
+                pass
+            except Exception as e:
+                print('Error:', e)
+                lyric_display.update_text("")
+                if self.broadcaster:
+                    self.broadcaster.clear()
+                # no session, or the source failed: retry after a while, or as soon as a session shows up
+                await engine.wait_for_change(self.retry_delay)
+            finally:
+                self.track_key = None
+                if key is not None:
+                    self.release(key)
@@ -0,0 +1,275 @@
+import asyncio
+import time
+from clock import PlaybackClock
+
+PLAYING = 'playing'
+PAUSED = 'paused'
+STOPPED = 'stopped'
+
+SESSION_EVENT = 'session'
+PLAYBACK_EVENT = 'playback'
+MEDIA_EVENT = 'media'
+TIMELINE_EVENT = 'timeline'
+
+class MediaInfo:
+    __slots__ = ('title', 'artist', 'album_title', 'position', 'duration', 'status', 'thumbnail_bytes')
+
+    def __init__(self, title, artist, album_title, position=0.0, duration=0.0, status=STOPPED, thumbnail_bytes=None):
+        self.title = title
+        self.artist = artist
+        self.album_title = album_title
+        self.position = position
+        self.duration = duration
+        self.status = status
+        self.thumbnail_bytes = thumbnail_bytes
+
+    @property
+    def identity(self):
+        return self.title, self.artist, self.album_title
+
+    def __repr__(self):
+        return f"MediaInfo({self.title!r}, {self.artist!r}, {self.album_title!r}, position={self.position:.2f}, duration={self.duration:.2f}, status={self.status!r})"
+
+class PlaybackState:
+    def __init__(self):
+        self.session_id = None
+        self.status = STOPPED
+        self.title = None
+        self.artist = None
+        self.album_title = None
+        self.duration = 0.0
+        self.position = 0.0
+        self.position_updated = time.monotonic()
+        self.media_changed = time.monotonic()
+        self.thumbnail_bytes = None
+
+    def position_now(self, now=None):
+        # extrapolates the last reported position while playing
+        if self.status != PLAYING:
+            return self.position
+        if now is None:
+            now = time.monotonic()
+        return self.position + (now - self.position_updated)
+
+def session_keys(app_ids):
+    # ids for the sessions of a source that only names the app playing them, in the order the system lists
+    # them: the app id, then "#2", "#3" for more sessions of one app (browser tabs)
+    counts = {}
+    keys = []
+    for app_id in app_ids:
+        counts[app_id] = counts.get(app_id, 0) + 1
+        keys.append(app_id if counts[app_id] == 1 else f"{app_id}#{counts[app_id]}")
+    return keys
+
+class MediaSource:
+    # on_event(kind, session_id) must be called on the event loop thread
+    async def start(self, on_event):
+        raise NotImplementedError
+
+    def current_session_id(self):
+        raise NotImplementedError
+
+    def session_ids(self):
+        # every session the source knows about, sources that only see one report just the current session
+        current = self.current_session_id()
+        return [] if current is None else [current]
+
+    async def read_playback(self, session_id):
+        # returns one of PLAYING, PAUSED, STOPPED
+        raise NotImplementedError
+
+    async def read_media(self, session_id):
+        # returns a dict with title, artist and album_title
+        raise NotImplementedError
+
+    async def read_timeline(self, session_id):
+        # returns (position, duration, position_updated) in seconds, position_updated on the time.monotonic clock
+        raise NotImplementedError
+
+    async def read_artwork(self, session_id):
+        # returns the encoded cover of the session's track, or None
+        return None
+
+class PlaybackEngine:
+    def __init__(self, source, monotonic=time.monotonic, session_id=None, artwork=False):
+        # monotonic is the clock positions are reported on, the replay harness passes its virtual loop time.
+        # By default the engine follows the source's current session, with session_id it stays on that one.
+        # artwork reads the cover into state.thumbnail_bytes on every track change.
+        self.source = source
+        self.monotonic = monotonic
+        self.session_id = session_id
+        self.artwork = artwork
+        # on_change(engine) runs after every refresh, for owners of several engines
+        self.on_change = None
+        self.state = PlaybackState()
+        self.clock = PlaybackClock(monotonic=monotonic)
+        self.version = 0
+        self.source_reads = 0
+        self._changed = asyncio.Event()
+        self._pending = set()
+
+    async def start(self):
+        await self.source.start(self.handle_event)
+        await self._refresh(SESSION_EVENT)
+
+    async def attach(self):
+        # first read for an engine whose events are forwarded by someone else already subscribed to the source
+        await self._refresh(SESSION_EVENT)
+
+    def handle_event(self, kind, session_id):
+        if kind != SESSION_EVENT and session_id != self.state.session_id:
+            return
+        # events often arrive in bursts, one refresh per tier is enough
+        if kind in self._pending:
+            return
+        self._pending.add(kind)
+        asyncio.get_running_loop().create_task(self._refresh(kind))
+
+    async def wait_for_change(self, timeout=None):
+        version = self.version
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.version != version
+
+    async def _refresh(self, kind):
+        self._pending.discard(kind)
+        state = self.state
+        if kind == SESSION_EVENT:
+            self.source_reads += 1
+            session_id = self.session_id or self.source.current_session_id()
+            if session_id == state.session_id:
+                return
+            state.session_id = session_id
+            self.clock.reset()
+            if session_id is None:
+                state.status = STOPPED
+            else:
+                await self._read_playback(state)
+                await self._read_media(state)
+                await self._read_timeline(state)
+        elif kind == PLAYBACK_EVENT:
+            await self._read_playback(state)
+        elif kind == MEDIA_EVENT:
+            await self._read_media(state)
+        elif kind == TIMELINE_EVENT:
+            await self._read_timeline(state)
+        self._notify()
+
+    async def _read_playback(self, state):
+        self.source_reads += 1
+        status = await self.source.read_playback(state.session_id)
+        if status != state.status:
+            # keep the extrapolated position continuous across play/pause
+            now = self.monotonic()
+            state.position = state.position_now(now)
+            state.position_updated = now
+            state.status = status
+            self.clock.set_playing(status == PLAYING, now)
+
+    async def _read_media(self, state):
+        self.source_reads += 1
+        media = await self.source.read_media(state.session_id)
+        changed = media['title'] != state.title or media['artist'] != state.artist
+        if changed:
+            state.media_changed = self.monotonic()
+        state.title = media['title']
+        state.artist = media['artist']
+        state.album_title = media['album_title']
+        if changed and self.artwork:
+            state.thumbnail_bytes = await self.source.read_artwork(state.session_id)
+
+    async def _read_timeline(self, state):
+        self.source_reads += 1
+        state.position, state.duration, state.position_updated = await self.source.read_timeline(state.session_id)
+        self.clock.add_sample(state.position, state.position_updated, state.status == PLAYING)
+
+    def _notify(self):
+        self.version += 1
+        self._changed.set()
+        self._changed = asyncio.Event()
+        if self.on_change:
+            self.on_change(self)
+
+class FakeMediaSource(MediaSource):
+    # in-process media source driven by method calls, used to run the pipeline without WinRT
+    def __init__(self):
+        self.sessions = {}
+        self.current_id = None
+        self.on_event = None
+        self.reads = 0
+
+    async def start(self, on_event):
+        self.on_event = on_event
+
+    def current_session_id(self):
+        return self.current_id
+
+    def session_ids(self):
+        return list(self.sessions)
+
+    async def read_playback(self, session_id):
+        self.reads += 1
+        return self.sessions[session_id]['status']
+
+    async def read_media(self, session_id):
+        self.reads += 1
+        session = self.sessions[session_id]
+        return {'title': session['title'], 'artist': session['artist'], 'album_title': session['album_title']}
+
+    async def read_timeline(self, session_id):
+        self.reads += 1
+        session = self.sessions[session_id]
+        return session['position'], session['duration'], session['position_updated']
+
+    async def read_artwork(self, session_id):
+        return self.sessions[session_id].get('thumbnail')
+
+    def _emit(self, kind, session_id):
+        if self.on_event:
+            self.on_event(kind, session_id)
+
+    def _position_now(self, session):
+        now = time.monotonic()
+        if session['status'] == PLAYING:
+            return session['position'] + (now - session['position_updated']), now
+        return session['position'], now
+
+    def set_track(self, session_id, title, artist, album_title='', duration=0.0, position=0.0, status=PLAYING, thumbnail=None):
+        new = session_id not in self.sessions
+        session = self.sessions.setdefault(session_id, {})
+        session.update(title=title, artist=artist, album_title=album_title, duration=duration,
+                       position=position, position_updated=time.monotonic(), status=status, thumbnail=thumbnail)
+        if self.current_id is None:
+            self.current_id = session_id
+            self._emit(SESSION_EVENT, session_id)
+        elif new:
+            # another player opened, the current session stays
+            self._emit(SESSION_EVENT, session_id)
+        else:
+            self._emit(MEDIA_EVENT, session_id)
+            self._emit(TIMELINE_EVENT, session_id)
+            self._emit(PLAYBACK_EVENT, session_id)
+
+    def set_current(self, session_id):
+        self.current_id = session_id
+        self._emit(SESSION_EVENT, session_id)
+
+    def close(self, session_id):
+        del self.sessions[session_id]
+        if self.current_id == session_id:
+            self.current_id = next(iter(self.sessions), None)
+        self._emit(SESSION_EVENT, self.current_id)
+
+    def set_status(self, session_id, status):
+        session = self.sessions[session_id]
+        session['position'], session['position_updated'] = self._position_now(session)
+        session['status'] = status
+        self._emit(PLAYBACK_EVENT, session_id)
+
+    def seek(self, session_id, position):
+        session = self.sessions[session_id]
+        session['position'] = position
+        session['position_updated'] = time.monotonic()
+        self._emit(TIMELINE_EVENT, session_id)
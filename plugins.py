@@ -0,0 +1,96 @@
+import importlib
+import importlib.util
+import io
+import colors
+
+# Optional backends, in order of preference. Nothing is imported until a backend runs, and one whose
+# dependencies are not installed is skipped, so neither cv2 nor syncedlyrics is needed to start the overlay.
+# Palette backends take the encoded thumbnail and return (color1, color2, halfway tone), or None when the
+# bytes do not decode. They run in the executor's process pool, so they have to stay module level functions.
+# Tag backends read (title, artist, album, duration seconds) from an audio file, None when it has no title.
+
+DEFAULT_PALETTE = ('#1a1a1a', '#ffffff', colors.halfway_tone('#1a1a1a', '#ffffff'))
+
+def opencv_palette(data, num_colors):
+    import cv2
+    import numpy as np
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    return colors.palette_from_image(image, num_colors)
+
+def pillow_palette(data, num_colors):
+    from PIL import Image
+    import numpy as np
+    try:
+        image = Image.open(io.BytesIO(data))
+        # JPEG covers decode straight at a fraction of their size
+        image.draft('RGB', (2 * colors.MAX_SIDE, 2 * colors.MAX_SIDE))
+        image = image.convert('RGB')
+    except OSError:
+        return None
+    image.thumbnail((colors.MAX_SIDE, colors.MAX_SIDE), Image.BOX)
+    return colors.palette_from_image(np.asarray(image)[:, :, ::-1], num_colors)
+
+def no_palette(data, num_colors):
+    return DEFAULT_PALETTE
+
+def syncedlyrics_search(title, artist, provider=None):
+    # provider limits the search to one of syncedlyrics' providers, by its name there
+    import syncedlyrics
+    return syncedlyrics.search(f"{title} {artist}", synced_only=True, providers=[provider] if provider else None)
+
+def mutagen_tags(path):
+    import mutagen
+    try:
+        audio = mutagen.File(path, easy=True)
+    except mutagen.MutagenError:
+        return None
+    if audio is None or not audio.tags or not audio.tags.get('title'):
+        return None
+    tags = audio.tags
+
+    def first(name):
+        return (tags.get(name) or [''])[0]
+    duration = audio.info.length if audio.info else 0.0
+    return first('title'), first('artist') or first('albumartist'), first('album'), duration
+
+# kind -> name -> (function, modules it needs)
+BACKENDS = {
+    'palette': {
+        'opencv': (opencv_palette, ('cv2', 'numpy')),
+        'pillow': (pillow_palette, ('PIL', 'numpy')),
+        'none': (no_palette, ()),
+    },
+    'fallback': {
+        'syncedlyrics': (syncedlyrics_search, ('syncedlyrics',)),
+    },
+    'tags': {
+        'mutagen': (mutagen_tags, ('mutagen',)),
+    },
+}
+
+def installed(modules):
+    return all(importlib.util.find_spec(module) is not None for module in modules)
+
+def available(kind):
+    return [name for name, (_, modules) in BACKENDS[kind].items() if installed(modules)]
+
+def preload(kind, name):
+    # imports what a backend needs, for warming up a worker process before the first job
+    for module in BACKENDS[kind][name][1]:
+        importlib.import_module(module)
+
+def load(kind, preferred=None):
+    # returns (name, function) of the preferred backend, or the first installed one; (None, None) if none is
+    backends = BACKENDS[kind]
+    if preferred is not None:
+        if preferred not in backends:
+            raise ValueError(f"unknown {kind} backend {preferred!r}, choose from {', '.join(backends)}")
+        function, modules = backends[preferred]
+        if installed(modules):
+            return preferred, function
+        print(f"{kind} backend {preferred} needs {', '.join(modules)}, trying the others")
+    for name in available(kind):
+        return name, backends[name][0]
+    return None, None
@@ -0,0 +1,370 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import time
+import lrclibclient
+import lrcparser
+import lyricstore
+import offlinedb
+import plugins
+import providers
+import ranking
+import trackid
+from executor import WorkExecutor, inline
+from playback import MediaInfo
+from timeline import LyricTimeline
+
+# Resolves lyrics ahead of time for a playlist export or a music directory and fills the lyrics store working.py
+# reads, so those tracks show their first line without a search. Tracks are matched by ranking.find_track, the
+# search behind working.py's offline index and lrclib providers, the index first as its head start in the race
+# would have it, and a match is only stored when it passes providers.check_lyrics like it would have to in the
+# live race; the scrapers are left to the live path, so tracks only they have are counted as missing here. Every
+# API request waits for one shared token bucket, failed requests are retried with exponential backoff and each
+# finished track is appended to a checkpoint file, so an interrupted run picks up where it stopped. Tracks whose
+# requests kept failing are left out of the checkpoint.
+#
+# usage: python prefetch.py playlist.csv|playlist.m3u|tracks.json|music_dir [--rate 5] [--workers 8]
+#        [--api https://lrclib.net | --no-api] [--offline saved/lrclib.db] [--checkpoint saved/prefetch.jsonl]
+
+LYRICS_DB = os.path.join("saved", "lyrics.db")
+CHECKPOINT = os.path.join("saved", "prefetch.jsonl")
+OFFLINE_INDEX = os.path.join("saved", "lrclib.db")
+API_URL = 'https://lrclib.net'
+USER_AGENT = "my-app/0.0.1"
+# requests a second across all workers, lrclib publishes no limit so stay well below what a browser would do
+RATE = 5
+BURST = 10
+WORKERS = 8
+RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+REPORT_INTERVAL = 10
+AUDIO_EXTENSIONS = ('.mp3', '.flac', '.m4a', '.mp4', '.aac', '.ogg', '.opus', '.wma', '.wav', '.aiff', '.ape', '.wv')
+# playlist export column names, lower cased: Exportify, iTunes/Apple Music text exports and plain CSVs
+CSV_COLUMNS = {
+    'title': ('track name', 'title', 'name', 'track', 'song'),
+    'artist': ('artist name(s)', 'artist name', 'artist', 'artists'),
+    'album': ('album name', 'album'),
+}
+# (column, seconds per unit)
+DURATION_COLUMNS = (('duration (ms)', 0.001), ('duration_ms', 0.001), ('duration', 1), ('time', 1), ('length', 1))
+
+class RateLimiter:
+    # token bucket shared by every worker, rate requests a second with bursts of up to burst. A 429 pauses it
+    # for everyone, not just the worker that got it
+    def __init__(self, rate, burst=BURST, monotonic=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.monotonic = monotonic
+        self.tokens = burst
+        self.updated = monotonic()
+        self.resume_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = self.monotonic()
+                if now < self.resume_at:
+                    await asyncio.sleep(self.resume_at - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, delay):
+        self.resume_at = max(self.resume_at, self.monotonic() + delay)
+
+class RetryingClient:
+    # search_lyrics for one track through the shared limiter, failed requests are retried with backoff. failed
+    # is set once a request gave up, the track then counts as failed rather than missing
+    def __init__(self, client, limiter, progress, retries=RETRIES):
+        self.client = client
+        self.limiter = limiter
+        self.progress = progress
+        self.retries = retries
+        self.failed = False
+
+    async def search_lyrics(self, track_name=None, artist_name=None, album_name=None, query=None):
+        for attempt in range(self.retries + 1):
+            await self.limiter.acquire()
+            self.progress.requests += 1
+            try:
+                return await self.client.search_lyrics(track_name, artist_name, album_name, query)
+            except lrclibclient.HTTPError as e:
+                if e.status not in RETRY_STATUSES:
+                    self.failed = True
+                    raise
+                error = e
+            except (OSError, EOFError, asyncio.TimeoutError) as e:
+                error = e
+            if attempt == self.retries:
+                break
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1)
+            self.progress.retries += 1
+            if isinstance(error, lrclibclient.HTTPError) and error.status == 429:
+                self.limiter.pause(delay)
+            await asyncio.sleep(delay)
+        self.failed = True
+        raise error
+
+class Checkpoint:
+    # one JSON line per finished track, written as it finishes. A line cut off by a crash is ignored
+    def __init__(self, path):
+        self.done = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.done[entry['key']] = entry['status']
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def record(self, key, status):
+        self.done[key] = status
+        self.file.write(json.dumps({'key': key, 'status': status}) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class Progress:
+    def __init__(self, total):
+        self.total = total
+        self.started = time.perf_counter()
+        self.skipped = 0
+        self.found = 0
+        self.missing = 0
+        self.failed = 0
+        self.requests = 0
+        self.retries = 0
+
+    @property
+    def resolved(self):
+        return self.found + self.missing + self.failed
+
+    def rate(self):
+        return self.resolved / max(time.perf_counter() - self.started, 1e-9)
+
+    def report(self):
+        print(f"{self.resolved + self.skipped}/{self.total} tracks: {self.found} found, {self.missing} missing, "
+              f"{self.failed} failed, {self.skipped} already done, {self.rate():.1f} tracks/s, "
+              f"{self.requests} requests, {self.retries} retries")
+
+def find_column(fields, names):
+    lowered = {field.strip().lower(): field for field in fields}
+    return next((lowered[name] for name in names if name in lowered), None)
+
+def read_csv(path):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+        reader = csv.DictReader(file)
+        fields = reader.fieldnames or []
+        columns = {kind: find_column(fields, names) for kind, names in CSV_COLUMNS.items()}
+        if columns['title'] is None:
+            raise ValueError(f"{path} has no title column, expected one of {', '.join(CSV_COLUMNS['title'])}")
+        duration_column, unit = next(((find_column(fields, (name,)), unit) for name, unit in DURATION_COLUMNS
+                                      if find_column(fields, (name,))), (None, 0))
+        tracks = []
+        for row in reader:
+            duration = 0.0
+            if duration_column and row.get(duration_column):
+                duration = parse_duration(row[duration_column]) * unit
+            tracks.append(MediaInfo(row[columns['title']], row.get(columns['artist']) or '',
+                                    row.get(columns['album']) or '', duration=duration))
+        return tracks
+
+def parse_duration(text):
+    # "215", "215000" or "3:35"
+    seconds = 0.0
+    for part in text.strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def read_json(path):
+    # a list of {title, artist, album, duration} objects, or lrclib style records
+    with open(path, 'r', encoding='utf-8') as file:
+        entries = json.load(file)
+    return [MediaInfo(entry.get('title') or entry.get('trackName'), entry.get('artist') or entry.get('artistName') or '',
+                      entry.get('album') or entry.get('albumName') or '', duration=float(entry.get('duration') or 0))
+            for entry in entries]
+
+def read_m3u(path):
+    # returns (tracks from #EXTINF lines, files without one whose tags still have to be read)
+    tracks = []
+    files = []
+    info = None
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r', encoding='utf-8-sig') as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith('#EXTINF:'):
+                duration, _, name = line[len('#EXTINF:'):].partition(',')
+                artist, separator, title = name.partition(' - ')
+                info = (title, artist) if separator else (name, '')
+                info += (max(float((duration.split() or ['0'])[0]), 0.0),)
+            elif line and not line.startswith('#'):
+                if info and info[0]:
+                    tracks.append(MediaInfo(info[0], info[1], '', duration=info[2]))
+                else:
+                    files.append(line if os.path.isabs(line) else os.path.join(base, line))
+                info = None
+    return tracks, files
+
+def audio_files(directory):
+    for folder, _, names in os.walk(directory):
+        for name in sorted(names):
+            if name.lower().endswith(AUDIO_EXTENSIONS):
+                yield os.path.join(folder, name)
+
+async def read_tags(files, executor):
+    if not files:
+        return []
+    _, read = plugins.load('tags')
+    if read is None:
+        raise RuntimeError(f"reading tags needs one of: {', '.join(plugins.BACKENDS['tags'])}")
+    tags = await asyncio.gather(*[executor.io(read, path) for path in files])
+    return [MediaInfo(title, artist, album, duration=duration) for title, artist, album, duration in filter(None, tags)]
+
+async def load_tracks(source, executor):
+    # MediaInfo records for the source, with tracks listed more than once kept once
+    if os.path.isdir(source):
+        tracks = await read_tags(list(audio_files(source)), executor)
+    elif source.lower().endswith('.csv'):
+        tracks = read_csv(source)
+    elif source.lower().endswith('.json'):
+        tracks = read_json(source)
+    elif source.lower().endswith(('.m3u', '.m3u8')):
+        tracks, files = read_m3u(source)
+        tracks += await read_tags(files, executor)
+    else:
+        raise ValueError(f"{source} is not a directory, .csv, .json or .m3u playlist")
+    unique = {}
+    for track in tracks:
+        if track.title:
+            unique.setdefault(trackid.track_key(track.title, track.artist, track.duration), track)
+    return unique
+
+async def search(media_info, offline_index, client):
+    # the index scoped to the track's duration, then lrclib. Returns a ranking.Match or None
+    match = None
+    if offline_index:
+        match = await ranking.find_track(offline_index.scoped(media_info.duration), media_info)
+    if match is None and client:
+        match = await ranking.find_track(client, media_info)
+    return match
+
+async def resolve(key, media_info, store, api, offline_index, limiter, progress, executor):
+    # returns the status to checkpoint, or None when the track should be tried again on the next run
+    client = RetryingClient(api, limiter, progress) if api else None
+    try:
+        match = await search(media_info, offline_index, client)
+    except Exception as e:
+        print("search failed:", media_info.title, "-", media_info.artist, e)
+        progress.failed += 1
+        return None
+    if match is None or not match.result.synced_lyrics:
+        if client and client.failed:
+            progress.failed += 1
+            return None
+        progress.missing += 1
+        return 'missing'
+    lyrics = match.result.synced_lyrics
+    # a player reports the length of its own file, which the playlist usually has; otherwise go by lrclib's
+    duration = media_info.duration or match.result.duration
+    problem = providers.check_lyrics(lyrics, duration)
+    if problem:
+        # the store serves whatever it has, an unsynced sheet or one for another cut would stick
+        print("lyrics rejected:", media_info.title, "-", media_info.artist, problem)
+        progress.missing += 1
+        return 'missing'
+    if not media_info.duration:
+        key = trackid.track_key(media_info.title, media_info.artist, duration)
+    await executor.io(store.put, key, lyrics, LyricTimeline(lrcparser.parse_lrc(lyrics)))
+    progress.found += 1
+    return 'found'
+
+async def prefetch(tracks, store, checkpoint, api=None, offline_index=None, rate=RATE, workers=WORKERS,
+                   executor=inline, report_interval=REPORT_INTERVAL):
+    # tracks maps track key -> MediaInfo, returns the Progress
+    progress = Progress(len(tracks))
+    limiter = RateLimiter(rate)
+    queue = asyncio.Queue()
+    for key, media_info in tracks.items():
+        if key in checkpoint.done:
+            progress.skipped += 1
+        else:
+            queue.put_nowait((key, media_info))
+
+    async def worker():
+        while not queue.empty():
+            key, media_info = queue.get_nowait()
+            cached = await executor.io(store.get, key)
+            near_key = trackid.neighbour_key(media_info.title, media_info.artist, media_info.duration)
+            if cached is None and near_key:
+                cached = await executor.io(store.get, near_key)
+            if cached is not None and cached is not lyricstore.NO_LYRICS:
+                progress.skipped += 1
+                checkpoint.record(key, 'found')
+                continue
+            status = await resolve(key, media_info, store, api, offline_index, limiter, progress, executor)
+            if status is not None:
+                checkpoint.record(key, status)
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(report_interval)
+            progress.report()
+
+    reporting = asyncio.get_running_loop().create_task(reporter())
+    try:
+        await asyncio.gather(*[worker() for _ in range(workers)])
+    finally:
+        reporting.cancel()
+    return progress
+
+async def main(args):
+    os.makedirs(os.path.dirname(os.path.abspath(args.lyrics)), exist_ok=True)
+    executor = WorkExecutor(io_workers=args.workers, cpu_workers=0)
+    api = None if args.no_api else lrclibclient.LrcLibClient(user_agent=USER_AGENT, base_url=args.api,
+                                                             max_connections=args.workers)
+    offline_index = None
+    if args.offline and os.path.exists(args.offline):
+        offline_index = offlinedb.OfflineIndex(args.offline, executor=executor)
+    if api is None and offline_index is None:
+        raise SystemExit("nothing to search: --no-api and no offline index")
+    store = lyricstore.LyricStore(args.lyrics)
+    checkpoint = Checkpoint(args.checkpoint)
+    try:
+        tracks = await load_tracks(args.source, executor)
+        print(f"{len(tracks)} tracks, {sum(key in checkpoint.done for key in tracks)} done by an earlier run")
+        progress = await prefetch(tracks, store, checkpoint, api, offline_index, args.rate, args.workers, executor)
+        progress.report()
+    finally:
+        checkpoint.close()
+        if api:
+            api.close()
+        if offline_index:
+            offline_index.close()
+        store.close()
+        executor.shutdown()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fetch lyrics for a playlist or music directory into the lyrics cache')
+    parser.add_argument('source', help='a .csv, .json or .m3u playlist, or a directory of tagged audio files')
+    parser.add_argument('--lyrics', default=LYRICS_DB, help='lyrics store to fill, saved/lyrics.db for working.py')
+    parser.add_argument('--checkpoint', default=CHECKPOINT, help='progress file, delete it to search missing tracks again')
+    parser.add_argument('--api', default=API_URL, help='lrclib base url, lrclibstub.py serves a local one')
+    parser.add_argument('--no-api', action='store_true', help='search the offline index only')
+    parser.add_argument('--offline', default=OFFLINE_INDEX, help='offline lrclib index searched before the API')
+    parser.add_argument('--rate', type=float, default=RATE, help='API requests a second')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='tracks searched at once')
+    asyncio.run(main(parser.parse_args()))
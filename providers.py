@@ -0,0 +1,245 @@
+import asyncio
+import time
+from collections import deque
+import lrcparser
+import lyricstore
+import metrics
+import ranking
+
+# Races the lyrics providers for a track instead of trying them one after another. Each provider has its own
+# deadline and a delay before it joins: the offline index and lrclib start at once, the syncedlyrics scrapers
+# join after FALLBACK_DELAY, or as soon as everything started before them has come back empty. The first
+# answer that is synced and fits the track's duration wins and the others are cancelled.
+# Every provider keeps a rolling window of its latency and outcomes, and a circuit breaker that stops asking a
+# provider after FAILURE_THRESHOLD errors or timeouts in a row, for a cooldown that doubles while it keeps
+# failing. "Not found" is an answer, only errors and timeouts count against a provider.
+# fetch raises lyricstore.LyricsNotFound only when every provider was asked and said not found or had nothing
+# usable; errors, timeouts and providers skipped by their breaker raise a plain Exception, which is not cached.
+
+DEADLINE = 5.0
+OFFLINE_DEADLINE = 2.0
+# lrclib waits this long for the offline index when there is one
+OFFLINE_HEAD_START = 0.2
+# scrapers only join when lrclib has not answered within this, most tracks never reach them
+FALLBACK_DELAY = 1.0
+# syncedlyrics' own providers worth racing, its Lrclib duplicates ours and Genius has no synced lyrics
+SYNCEDLYRICS_PROVIDERS = ('Musixmatch', 'NetEase', 'Megalobiz')
+STATS_WINDOW = 50
+FAILURE_THRESHOLD = 3
+COOLDOWN = 30
+MAX_COOLDOWN = 600
+MIN_SYNCED_LINES = 3
+# the last line may start this long after the reported end, fades and outros are cut differently
+DURATION_SLACK = 15
+# and should not start before this share of the track, a sheet for a different cut or an intro only
+MIN_COVERAGE = 0.4
+
+# outcomes
+FOUND = 'found'
+REJECTED = 'rejected'
+MISSING = 'missing'
+FAILED = 'failed'
+TIMEOUT = 'timeout'
+
+def check_lyrics(lyrics, duration):
+    # None when the sheet is usable for a track of duration seconds, otherwise why not
+    return check_lines(lrcparser.parse_lrc(lyrics), duration)
+
+def check_lines(lines, duration):
+    # check_lyrics for a sheet parse_lrc has already read
+    if len(lines) < MIN_SYNCED_LINES:
+        return 'not synced'
+    if duration:
+        last = lines[-1][0] / 1000
+        if last > duration + DURATION_SLACK:
+            return f'last line at {last:.0f} s, the track is {duration:.0f} s'
+        if last < duration * MIN_COVERAGE:
+            return f'lines end at {last:.0f} s of {duration:.0f} s'
+    return None
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN, max_cooldown=MAX_COOLDOWN,
+                 monotonic=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.monotonic = monotonic
+        self.failures = 0
+        self.open_until = None
+        self.trial = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        if self.open_until is None:
+            return 'closed'
+        return 'open' if self.monotonic() < self.open_until else 'half-open'
+
+    def allow(self):
+        # once the cooldown is over a single trial call decides whether the provider is back
+        if self.open_until is None:
+            return True
+        if self.monotonic() < self.open_until or self.trial:
+            return False
+        self.trial = True
+        return True
+
+    def record(self, ok):
+        self.trial = False
+        if ok:
+            self.failures = 0
+            self.open_until = None
+            self.cooldown = self.base_cooldown
+            return
+        self.failures += 1
+        if self.open_until is not None:
+            # the trial failed
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+        elif self.failures < self.failure_threshold:
+            return
+        self.open_until = self.monotonic() + self.cooldown
+        self.trips += 1
+
+    def abandon(self):
+        # the call was cancelled before it could tell anything
+        self.trial = False
+
+class ProviderStats:
+    # outcomes and latencies of the last window calls
+    def __init__(self, window=STATS_WINDOW):
+        self.calls = deque(maxlen=window)
+
+    def record(self, outcome, latency):
+        self.calls.append((outcome, latency))
+
+    def success_rate(self):
+        if not self.calls:
+            return None
+        return sum(outcome not in (FAILED, TIMEOUT) for outcome, _ in self.calls) / len(self.calls)
+
+    def latency(self, fraction):
+        latencies = sorted(latency for _, latency in self.calls)
+        if not latencies:
+            return None
+        return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)]
+
+    def count(self, outcome):
+        return sum(recorded == outcome for recorded, _ in self.calls)
+
+class Provider:
+    # search(media_info) returns LRC text or None
+    def __init__(self, name, search, deadline=DEADLINE, delay=0.0, monotonic=time.monotonic):
+        self.name = name
+        self.search = search
+        self.deadline = deadline
+        self.delay = delay
+        self.monotonic = monotonic
+        self.stats = ProviderStats()
+        self.breaker = CircuitBreaker(monotonic=monotonic)
+
+    async def run(self, media_info):
+        # returns (outcome, lyrics, their parse_lrc lines or None)
+        start = self.monotonic()
+        lines = None
+        try:
+            lyrics = await asyncio.wait_for(self.search(media_info), self.deadline)
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            raise
+        except asyncio.TimeoutError:
+            outcome, lyrics = TIMEOUT, None
+        except Exception as e:
+            print(f"{self.name} failed:", e)
+            outcome, lyrics = FAILED, None
+        else:
+            if not lyrics:
+                outcome = MISSING
+            else:
+                lines = lrcparser.parse_lrc(lyrics)
+                problem = check_lines(lines, media_info.duration)
+                if problem:
+                    print(f"{self.name} lyrics rejected: {problem}")
+                outcome = REJECTED if problem else FOUND
+        latency = self.monotonic() - start
+        self.stats.record(outcome, latency)
+        self.breaker.record(outcome not in (FAILED, TIMEOUT))
+        metrics.observe(f'provider_{self.name}_ms', latency * 1000)
+        metrics.count(f'provider_{self.name}_{outcome}')
+        return outcome, lyrics, lines
+
+class ProviderRace:
+    def __init__(self, providers, monotonic=time.monotonic):
+        self.providers = providers
+        self.monotonic = monotonic
+
+    async def fetch(self, media_info):
+        # returns (provider name, lyrics, their parse_lrc lines) or raises when no provider had usable lyrics
+        start = self.monotonic()
+        waiting = sorted((provider for provider in self.providers if provider.breaker.allow()), key=lambda p: p.delay)
+        skipped = [provider.name for provider in self.providers if provider not in waiting]
+        running = {}
+        outcomes = []
+        try:
+            while waiting or running:
+                elapsed = self.monotonic() - start
+                # everything started so far came back empty, do not sit out the rest of the delay
+                while waiting and (waiting[0].delay <= elapsed or not running):
+                    provider = waiting.pop(0)
+                    running[asyncio.ensure_future(provider.run(media_info))] = provider
+                timeout = max(waiting[0].delay - elapsed, 0) if waiting else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider = running.pop(task)
+                    outcome, lyrics, lines = task.result()
+                    outcomes.append((provider.name, outcome))
+                    if outcome == FOUND:
+                        return provider.name, lyrics, lines
+        finally:
+            for task, provider in running.items():
+                task.cancel()
+                provider.breaker.abandon()
+            # allow() may have handed these their trial call
+            for provider in waiting:
+                provider.breaker.abandon()
+        answered = all(outcome in (MISSING, REJECTED) for _, outcome in outcomes)
+        summary = [f"{name} {outcome}" for name, outcome in outcomes]
+        if skipped:
+            summary.append(f"{', '.join(skipped)} skipped by their circuit breakers")
+        message = f"No lyrics from any provider: {'; '.join(summary) or 'none available'}"
+        if answered and outcomes and not skipped:
+            raise lyricstore.LyricsNotFound(message)
+        raise Exception(message)
+
+    def report(self):
+        lines = []
+        for provider in self.providers:
+            stats = provider.stats
+            rate = stats.success_rate()
+            p50 = stats.latency(0.5)
+            p95 = stats.latency(0.95)
+            lines.append(f"{provider.name:12s} {len(stats.calls):3d} calls  "
+                         f"ok {'-' if rate is None else f'{rate:4.0%}'}  "
+                         f"p50 {'-' if p50 is None else f'{p50 * 1000:6.0f} ms'}  "
+                         f"p95 {'-' if p95 is None else f'{p95 * 1000:6.0f} ms'}  "
+                         f"found {stats.count(FOUND)}  breaker {provider.breaker.state}, {provider.breaker.trips} trips")
+        return "\n".join(lines)
+
+def index_provider(offline_index, deadline=OFFLINE_DEADLINE):
+    async def search(media_info):
+        match = await ranking.find_track(offline_index.scoped(media_info.duration), media_info)
+        return match.result.synced_lyrics if match else None
+    return Provider('offline', search, deadline)
+
+def lrclib_provider(api, deadline=DEADLINE, delay=0.0):
+    async def search(media_info):
+        match = await ranking.find_track(api, media_info)
+        return match.result.synced_lyrics if match else None
+    return Provider('lrclib', search, deadline, delay)
+
+def syncedlyrics_provider(name, search_function, executor, deadline=DEADLINE, delay=FALLBACK_DELAY):
+    # search_function is plugins.syncedlyrics_search, it blocks so it runs on the executor's threads; a call
+    # past its deadline keeps its thread until it returns, the breaker stops piling more onto a hung provider
+    async def search(media_info):
+        return await executor.io(search_function, media_info.title, media_info.artist, name)
+    return Provider(name, search, deadline, delay)
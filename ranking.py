@@ -0,0 +1,166 @@
+import asyncio
+from lazyimport import lazy_module
+from trackid import clean_title, fold, primary_artist
+
+np = lazy_module('numpy')
+
+# Ranks lrclib candidates for the playing track. Every candidate gathered so far is scored in one numpy pass on
+# title, artist and album similarity, duration distance, synced lyrics and the instrumental flag. The searches
+# are staged: the specific query goes out alone and the broader ones are only sent when it found nothing
+# convincing, and the search stops as soon as a candidate scores CONFIDENT_SCORE.
+
+DURATION_THRESHOLD = 10
+CONFIDENT_SCORE = 0.85
+TRIGRAM_BUCKETS = 2048
+
+TITLE_WEIGHT = 0.4
+ARTIST_WEIGHT = 0.25
+ALBUM_WEIGHT = 0.05
+DURATION_WEIGHT = 0.2
+SYNCED_WEIGHT = 0.1
+UNSYNCED_PENALTY = 0.5
+INSTRUMENTAL_PENALTY = 0.3
+
+# a candidate below either similarity names another song or another artist, whatever its total. Spellings of
+# one name as players and lrclib report them ("Guns N' Roses", "Mr. Brightside", the variants in
+# benchmarks/bench_trackid.py) score 0.83 and up, a leading "The" about 0.7, different artists close to 0
+MIN_TITLE_SIMILARITY = 0.7
+MIN_ARTIST_SIMILARITY = 0.6
+# the weakest candidate still accepted: both names at their minimum, synced, no album given and just inside
+# DURATION_THRESHOLD, which is what the old duration filter let through; an unsynced one can not reach it
+MIN_SCORE = TITLE_WEIGHT * MIN_TITLE_SIMILARITY + ARTIST_WEIGHT * MIN_ARTIST_SIMILARITY + SYNCED_WEIGHT
+
+def trigram_matrix(texts):
+    # rows of hashed character trigram counts, L2 normalized, so a matrix product gives cosine similarities
+    # all texts are encoded in one go, trigrams straddling two texts are dropped
+    padded = [f"  {text} " for text in texts]
+    codes = np.frombuffer("".join(padded).encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+    rows = np.repeat(np.arange(len(texts)), [len(text) for text in padded])
+    grams = (codes[:-2] * 1000003 + codes[1:-1] * 1009 + codes[2:]) % TRIGRAM_BUCKETS
+    inside = rows[:-2] == rows[2:]
+    matrix = np.bincount(rows[:-2][inside] * TRIGRAM_BUCKETS + grams[inside],
+                         minlength=len(texts) * TRIGRAM_BUCKETS).reshape(len(texts), TRIGRAM_BUCKETS).astype(np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-9)
+
+def similarity(query_texts, candidate_texts):
+    # best cosine similarity of each candidate text against any of the query texts
+    return (trigram_matrix(candidate_texts) @ trigram_matrix(query_texts).T).max(axis=1)
+
+def without_article(name):
+    # "The Weeknd" and "Weeknd" are one artist to a player and lrclib alike
+    return name[4:] if name.startswith('the ') and len(name) > 4 else name
+
+def artist_forms(artist):
+    primary = primary_artist(artist)
+    return [fold(artist), primary, without_article(primary)]
+
+def score_candidates(results, title, artist, album, duration):
+    count = len(results)
+    if count == 0:
+        return np.zeros(0, np.float32)
+    titles = similarity([fold(title), clean_title(title)],
+                        [clean_title(result.track_name) for result in results] + [fold(result.track_name) for result in results])
+    title_score = np.maximum(titles[:count], titles[count:])
+    artists = similarity(artist_forms(artist),
+                         [without_article(primary_artist(result.artist_name)) for result in results]
+                         + [fold(result.artist_name) for result in results])
+    artist_score = np.maximum(artists[:count], artists[count:])
+    album_score = similarity([fold(album)], [fold(result.album_name) for result in results]) if album else np.zeros(count, np.float32)
+    durations = np.array([result.duration for result in results], np.float32)
+    synced = np.array([result.synced_lyrics is not None for result in results])
+    instrumental = np.array([result.instrumental for result in results])
+    differences = np.abs(durations - duration)
+    if duration:
+        duration_score = np.clip(1 - differences / DURATION_THRESHOLD, 0, 1)
+    else:
+        duration_score = np.full(count, 0.5, np.float32)
+    scores = (TITLE_WEIGHT * title_score + ARTIST_WEIGHT * artist_score + ALBUM_WEIGHT * album_score
+              + DURATION_WEIGHT * duration_score + np.where(synced, SYNCED_WEIGHT, -UNSYNCED_PENALTY)
+              - INSTRUMENTAL_PENALTY * instrumental)
+    if duration:
+        # the same threshold the old duration filter used, a different cut of the song can not be synced
+        scores[differences >= DURATION_THRESHOLD] = -1
+    scores[title_score < MIN_TITLE_SIMILARITY] = -1
+    if artist:
+        scores[artist_score < MIN_ARTIST_SIMILARITY] = -1
+    return scores
+
+def search_stages(title, artist):
+    # a small fixed set of queries, most specific first
+    main_artist = primary_artist(artist)
+    short_title = clean_title(title)
+    stages = [[dict(track_name=title, artist_name=main_artist)], []]
+    seen = {(fold(title), main_artist)}
+    for query in (dict(track_name=short_title, artist_name=main_artist), dict(track_name=short_title),
+                  dict(query=f"{short_title} {main_artist}")):
+        key = (fold(query.get('track_name') or query.get('query')), query.get('artist_name'))
+        if key not in seen:
+            seen.add(key)
+            stages[1].append(query)
+    return stages
+
+class Match:
+    __slots__ = ('result', 'score', 'calls', 'candidates')
+
+    def __init__(self, result, score, calls, candidates):
+        self.result = result
+        self.score = score
+        self.calls = calls
+        self.candidates = candidates
+
+    def __repr__(self):
+        result = self.result
+        return f"Match({result.track_name!r}, {result.artist_name!r}, score={self.score:.2f}, calls={self.calls}, candidates={self.candidates})"
+
+async def find_lyrics(client, title, artist, album, duration, deadline=None):
+    # returns the best Match or None, client is anything with search_lyrics (LrcLibClient, OfflineIndex)
+    return await asyncio.wait_for(staged_search(client, title, artist, album, duration), deadline)
+
+async def find_track(client, media_info, deadline=None):
+    # find_lyrics for what a player or a playlist reports: the one search behind the offline and lrclib providers
+    # of the live race and behind prefetch.py
+    return await find_lyrics(client, media_info.title, media_info.artist, media_info.album_title, media_info.duration,
+                             deadline)
+
+async def staged_search(client, title, artist, album, duration):
+    candidates = {}
+    calls = 0
+    failures = 0
+    error = None
+    best = None
+    best_score = -1.0
+    for stage in search_stages(title, artist):
+        if not stage:
+            continue
+        tasks = [asyncio.ensure_future(client.search_lyrics(**query)) for query in stage]
+        calls += len(tasks)
+        try:
+            for finished in asyncio.as_completed(tasks):
+                try:
+                    results = await finished
+                except Exception as e:
+                    print("lyrics search failed:", e)
+                    failures += 1
+                    error = e
+                    continue
+                fresh = [result for result in results if result.id not in candidates]
+                for result in fresh:
+                    candidates[result.id] = result
+                if not fresh:
+                    continue
+                scores = score_candidates(fresh, title, artist, album, duration)
+                index = int(np.argmax(scores))
+                if scores[index] > best_score:
+                    best, best_score = fresh[index], float(scores[index])
+                if best_score >= CONFIDENT_SCORE:
+                    return Match(best, best_score, calls, len(candidates))
+        finally:
+            for task in tasks:
+                task.cancel()
+    if best is None and failures == calls and error is not None:
+        # not a single answer, the client is down rather than the track missing
+        raise error
+    if best is None or best_score < MIN_SCORE:
+        return None
+    return Match(best, best_score, calls, len(candidates))
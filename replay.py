@@ -0,0 +1,365 @@
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import random
+import selectors
+import time
+import lrcparser
+import lyricstore
+import playback
+import trackid
+from palettecache import PaletteCache
+from pipeline import LyricPipeline
+
+# Records the media session stream to JSONL on Windows and replays recorded or synthetic traces through
+# LyricPipeline on a virtual clock anywhere, reporting how far each displayed line was from the player's
+# position, how long a track change takes to reach its first line and the CPU spent per played minute.
+#
+# usage: python replay.py record trace.jsonl
+#        python replay.py play trace.jsonl [--lyrics saved/lyrics.db]
+#        python replay.py synthetic [--tracks 20] [--save trace.jsonl]
+
+RECORD_FIELDS = ('session_id', 'status', 'title', 'artist', 'album_title', 'duration', 'position', 'position_updated')
+MEDIA_FIELDS = ('title', 'artist', 'album_title')
+# a report this far off the running position is a seek, lines made current by it are due from the seek on
+JUMP_THRESHOLD = 0.5
+SYNTHETIC_WORDS = "oh la love night heart baby dance fire never away tonight feel light rain".split()
+
+class VirtualSelector:
+    # wraps the loop's selector, instead of blocking until the next timer it moves the virtual clock there
+    def __init__(self, selector):
+        self.selector = selector
+        self.loop = None
+
+    def select(self, timeout=None):
+        if timeout is None:
+            # nothing scheduled, only another thread can wake the loop up
+            return self.selector.select(None)
+        events = self.selector.select(0)
+        if not events and timeout > 0:
+            self.loop.virtual_time += timeout
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    # timers run in order as fast as the callbacks allow, loop.time() only moves when the loop would sleep
+    def __init__(self):
+        selector = VirtualSelector(selectors.DefaultSelector())
+        super().__init__(selector)
+        selector.loop = self
+        self.virtual_time = 0.0
+
+    def time(self):
+        return self.virtual_time
+
+def load_trace(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def save_trace(path, records):
+    with open(path, 'w', encoding='utf-8') as file:
+        for record in records:
+            file.write(json.dumps(record) + '\n')
+
+async def record(path, poll=0.5):
+    # Appends one line per change of the session state, re-reading the timeline every poll seconds so players
+    # that rarely raise timeline events still leave position samples in the trace
+    from winmedia import WinRTMediaSource  # WinRT only imports on Windows
+    engine = playback.PlaybackEngine(WinRTMediaSource())
+    await engine.start()
+    start = time.monotonic()
+    last = None
+    with open(path, 'a', encoding='utf-8') as file:
+        while True:
+            if not await engine.wait_for_change(poll) and engine.state.session_id:
+                engine.handle_event(playback.TIMELINE_EVENT, engine.state.session_id)
+                continue
+            state = engine.state
+            values = [getattr(state, name) for name in RECORD_FIELDS]
+            if values == last:
+                continue
+            last = values
+            entry = dict(zip(RECORD_FIELDS, values))
+            entry['t'] = round(time.monotonic() - start, 4)
+            entry['position_updated'] = round(state.position_updated - start, 4)
+            file.write(json.dumps(entry) + '\n')
+            file.flush()
+
+def synthetic_trace(rng, tracks=5, jitter=0.04, session_id='synthetic'):
+    # A listening session with jittery, late delivered position reports, pauses and seeks. Every record also
+    # carries the exact position (true_position at true_at) the report was derived from.
+    records = []
+    t = 0.0
+    for number in range(tracks):
+        title = f"Track {number}"
+        artist = f"Artist {rng.randint(1, 9)}"
+        duration = round(rng.uniform(150, 260), 1)
+        position = rng.choice((0.0, 0.0, 0.0, rng.uniform(0, 30)))
+        status = playback.PLAYING
+
+        def report():
+            records.append({'t': round(t + rng.uniform(0.01, 0.2), 4), 'session_id': session_id, 'status': status,
+                            'title': title, 'artist': artist, 'album_title': '', 'duration': duration,
+                            'position': round(position + rng.gauss(0, jitter / 2), 4),
+                            'position_updated': round(t + rng.gauss(0, jitter), 4),
+                            'true_position': round(position, 4), 'true_at': round(t, 4)})
+
+        report()
+        while position < duration:
+            step = rng.uniform(1.0, 6.0)
+            if status == playback.PLAYING:
+                step = min(step, duration - position)
+                position += step
+            t += step
+            roll = rng.random()
+            if roll < 0.03:
+                position = rng.uniform(0, duration - 10)
+            elif roll < 0.06:
+                status = playback.PAUSED if status == playback.PLAYING else playback.PLAYING
+            if position < duration:
+                report()
+    return records
+
+def synthetic_lyrics(title, artist, duration):
+    # deterministic per title, repeated lines included like real choruses
+    rng = random.Random(hashlib.blake2b(title.encode('utf-8'), digest_size=8).digest())
+    chorus = [" ".join(rng.choice(SYNTHETIC_WORDS) for _ in range(rng.randint(2, 6))) for _ in range(4)]
+    lines = []
+    ms = rng.randint(3000, 20000)
+    while ms < (duration - 5) * 1000:
+        if rng.random() < 0.3:
+            text = rng.choice(chorus)
+        else:
+            text = " ".join(rng.choice(SYNTHETIC_WORDS) for _ in range(rng.randint(2, 8)))
+        lines.append(f"[{ms // 60000:02d}:{ms // 1000 % 60:02d}.{ms % 1000 // 10:02d}] {text}")
+        ms += rng.randint(1500, 6000)
+    return "\n".join(lines) + "\n"
+
+def store_lyrics(path):
+    store = lyricstore.LyricStore(path)
+
+    def lookup(title, artist, duration):
+        cached = store.get(trackid.track_key(title, artist, duration))
+        if cached is None or cached is lyricstore.NO_LYRICS:
+            return None
+        return cached[0]
+    return lookup
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def summarize(values):
+    if not values:
+        return None
+    return {'mean': round(sum(values) / len(values), 1), 'mean_abs': round(sum(abs(v) for v in values) / len(values), 1),
+            'p50': round(percentile(values, 0.5), 1), 'p95': round(percentile([abs(v) for v in values], 0.95), 1),
+            'max': round(max(values, key=abs), 1)}
+
+class ReplaySource(playback.MediaSource):
+    def __init__(self):
+        self.current = None
+        self.on_event = None
+
+    async def start(self, on_event):
+        self.on_event = on_event
+
+    def current_session_id(self):
+        return self.current['session_id'] if self.current else None
+
+    async def read_playback(self, session_id):
+        return self.current['status']
+
+    async def read_media(self, session_id):
+        return {name: self.current[name] for name in MEDIA_FIELDS}
+
+    async def read_timeline(self, session_id):
+        return self.current['position'], self.current['duration'], self.current['position_updated']
+
+    def apply(self, entry):
+        previous = self.current
+        self.current = entry
+        if self.on_event is None:
+            return
+        session_id = entry['session_id']
+        if previous is None or previous['session_id'] != session_id:
+            self.on_event(playback.SESSION_EVENT, session_id)
+            return
+        if any(previous[name] != entry[name] for name in MEDIA_FIELDS):
+            self.on_event(playback.MEDIA_EVENT, session_id)
+        if previous['status'] != entry['status']:
+            self.on_event(playback.PLAYBACK_EVENT, session_id)
+        if previous['position'] != entry['position'] or previous['position_updated'] != entry['position_updated']:
+            self.on_event(playback.TIMELINE_EVENT, session_id)
+
+    def true_position(self, at):
+        entry = self.current
+        position = entry.get('true_position', entry['position'])
+        if entry['status'] != playback.PLAYING:
+            return position
+        return position + at - entry.get('true_at', entry['position_updated'])
+
+class ReplayRun:
+    # stands in for the lyric display and scores every line the pipeline shows against the trace
+    def __init__(self, records, lyrics_for=synthetic_lyrics, fetch_delay=0.3, tail=5.0):
+        self.records = records
+        self.lyrics_for = lyrics_for
+        self.fetch_delay = fetch_delay
+        self.tail = tail
+        self.source = ReplaySource()
+        self.timelines = {}
+        self.errors = []
+        self.first_line = []
+        self.unmatched = 0
+        self.changed_at = None
+        self.jumped_at = None
+        self.loop = None
+
+    async def get_media_info(self):
+        entry = self.source.current
+        if entry is None:
+            raise Exception('No active media session found.')
+        return playback.MediaInfo(entry['title'], entry['artist'], entry['album_title'],
+                                  self.source.true_position(self.loop.time()), entry['duration'], entry['status'])
+
+    async def fetch_lyrics(self, media_info):
+        await asyncio.sleep(self.fetch_delay)
+        lyrics = self.lyrics_for(media_info.title, media_info.artist, media_info.duration)
+        if lyrics is None:
+            raise lyricstore.LyricsNotFound('Lyrics not found in trace')
+        return lyrics, None
+
+    def timeline_for(self, entry):
+        key = (entry['title'], entry['artist'])
+        timeline = self.timelines.get(key)
+        if timeline is None:
+            lyrics = self.lyrics_for(entry['title'], entry['artist'], entry['duration'])
+            timeline = lrcparser.parse_lrc(lyrics) if lyrics else []
+            self.timelines[key] = timeline
+        return timeline
+
+    def update_text(self, text, ucolor1='gray10', ucolor2='white'):
+        if "\n" not in text:
+            return
+        now = self.loop.time()
+        entry = self.source.current
+        shown = text.split("\n")[0]
+        true_ms = self.source.true_position(now) * 1000
+        candidates = [ms for ms, line, _ in self.timeline_for(entry) if line == shown]
+        if not candidates or entry['status'] != playback.PLAYING:
+            self.unmatched += 1
+            return
+        line_ms = min(candidates, key=lambda ms: abs(ms - true_ms))
+        error = true_ms - line_ms
+        if error > 0 and self.jumped_at is not None:
+            error = min(error, (now - self.jumped_at) * 1000)
+        self.errors.append(error)
+        if self.changed_at is not None:
+            due = now - error / 1000
+            self.first_line.append((now - max(self.changed_at, due)) * 1000)
+            self.changed_at = None
+
+    def apply(self, entry):
+        now = self.loop.time()
+        previous = self.source.current
+        changed = previous is None or any(previous[name] != entry[name] for name in MEDIA_FIELDS)
+        expected = None if changed else self.source.true_position(now)
+        self.source.apply(entry)
+        # the seek, resume or track change happened when the player says, not when the report arrived
+        happened = entry.get('true_at', entry['position_updated'])
+        if changed:
+            self.changed_at = happened
+        if changed or previous['status'] != entry['status'] or abs(self.source.true_position(now) - expected) > JUMP_THRESHOLD:
+            self.jumped_at = happened
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        shift = self.loop.time() - self.records[0]['t']
+        records = []
+        for entry in self.records:
+            entry = dict(entry, t=entry['t'] + shift, position_updated=entry['position_updated'] + shift)
+            if 'true_at' in entry:
+                entry['true_at'] += shift
+            records.append(entry)
+        self.apply(records[0])
+        engine = playback.PlaybackEngine(self.source, monotonic=self.loop.time)
+        lyric_pipeline = LyricPipeline(engine, self, lyricstore.LyricStore(':memory:'), PaletteCache(),
+                                       self.get_media_info, self.fetch_lyrics)
+        cpu_start = time.process_time()
+        task = self.loop.create_task(lyric_pipeline.run())
+        for entry in records[1:]:
+            delay = entry['t'] - self.loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.apply(entry)
+        await asyncio.sleep(self.tail)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        cpu = time.process_time() - cpu_start
+        played = sum(after['t'] - before['t'] for before, after in zip(records, records[1:])
+                     if before['status'] == playback.PLAYING)
+        tracks = len({(entry['title'], entry['artist']) for entry in records})
+        return {'tracks': tracks, 'played_minutes': round(played / 60, 2), 'lines': len(self.errors),
+                'unmatched': self.unmatched, 'line_error_ms': summarize(self.errors),
+                'first_line_ms': summarize(self.first_line),
+                'cpu_ms_per_minute': round(cpu * 1000 / max(played / 60, 1e-9), 2)}
+
+def replay(records, lyrics_for=synthetic_lyrics, fetch_delay=0.3, quiet=True):
+    loop = VirtualTimeLoop()
+    run = ReplayRun(records, lyrics_for, fetch_delay)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+            return loop.run_until_complete(run.run())
+    finally:
+        loop.close()
+
+def print_report(report):
+    print(f"{report['tracks']} tracks, {report['played_minutes']} played minutes, {report['lines']} lines shown, {report['unmatched']} unmatched")
+    for name in ('line_error_ms', 'first_line_ms'):
+        stats = report[name]
+        if stats:
+            print(f"{name:14} mean {stats['mean']:8.1f}  mean abs {stats['mean_abs']:8.1f}  p50 {stats['p50']:8.1f}  p95 {stats['p95']:8.1f}  max {stats['max']:8.1f}")
+    print(f"cpu            {report['cpu_ms_per_minute']} ms per played minute")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record or replay media session traces')
+    commands = parser.add_subparsers(dest='command', required=True)
+    record_parser = commands.add_parser('record', help='record the current media session to a JSONL trace (Windows)')
+    record_parser.add_argument('trace')
+    record_parser.add_argument('--poll', type=float, default=0.5, help='seconds between forced timeline reads')
+    play_parser = commands.add_parser('play', help='replay a JSONL trace headless')
+    play_parser.add_argument('trace')
+    play_parser.add_argument('--lyrics', help='LyricStore database to take lyrics from, synthetic lyrics otherwise')
+    synthetic_parser = commands.add_parser('synthetic', help='replay generated traces headless')
+    synthetic_parser.add_argument('--tracks', type=int, default=20)
+    synthetic_parser.add_argument('--seed', type=int, default=1)
+    synthetic_parser.add_argument('--jitter', type=float, default=0.04)
+    synthetic_parser.add_argument('--save', help='also write the generated trace to this file')
+    for command in (play_parser, synthetic_parser):
+        command.add_argument('--fetch-delay', type=float, default=0.3, help='virtual seconds a lyrics lookup takes')
+        command.add_argument('--json', action='store_true', help='print the report as JSON')
+        command.add_argument('--verbose', action='store_true', help='show the pipeline output')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        asyncio.run(record(args.trace, args.poll))
+    else:
+        if args.command == 'play':
+            records = load_trace(args.trace)
+            lyrics_for = store_lyrics(args.lyrics) if args.lyrics else synthetic_lyrics
+        else:
+            records = synthetic_trace(random.Random(args.seed), args.tracks, args.jitter)
+            lyrics_for = synthetic_lyrics
+            if args.save:
+                save_trace(args.save, records)
+        report = replay(records, lyrics_for, args.fetch_delay, quiet=not args.verbose)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report)
@@ -0,0 +1,137 @@
+import asyncio
+import time
+import playback
+from playback import MediaInfo, PlaybackEngine, PlaybackState
+from clock import PlaybackClock
+
+# Follows every media session the source reports at once, one PlaybackEngine (state, clock, cover) per session.
+# on_track(session_id, media_info) fires for a track change in any session, so lyrics and palettes can be
+# prepared before that session is shown. The displayed session is the source's current one unless focus()
+# pinned another; switching only swaps which engine state and clock point at, no session is read again.
+# To the pipeline it looks like a single PlaybackEngine.
+
+class SessionManager:
+    def __init__(self, source, monotonic=time.monotonic):
+        self.source = source
+        self.monotonic = monotonic
+        self.engines = {}
+        self.displayed = None
+        self.pinned = None
+        self.on_track = None
+        self.tracks = {}
+        self.version = 0
+        self._changed = asyncio.Event()
+        self._refreshing = False
+        # what state and clock show while there is no session at all
+        self._idle_state = PlaybackState()
+        self._idle_clock = PlaybackClock(monotonic=monotonic)
+
+    @property
+    def state(self):
+        return self.displayed.state if self.displayed else self._idle_state
+
+    @property
+    def clock(self):
+        return self.displayed.clock if self.displayed else self._idle_clock
+
+    @property
+    def source_reads(self):
+        return sum(engine.source_reads for engine in self.engines.values())
+
+    async def start(self):
+        await self.source.start(self.handle_event)
+        await self.refresh_sessions()
+
+    def handle_event(self, kind, session_id):
+        engine = self.engines.get(session_id)
+        if kind == playback.SESSION_EVENT or engine is None:
+            # a player opened or closed, or the system moved the current session
+            if not self._refreshing:
+                self._refreshing = True
+                asyncio.get_running_loop().create_task(self.refresh_sessions())
+            return
+        engine.handle_event(kind, session_id)
+
+    async def refresh_sessions(self):
+        self._refreshing = False
+        session_ids = self.source.session_ids()
+        for session_id in [session_id for session_id in self.engines if session_id not in session_ids]:
+            engine = self.engines.pop(session_id)
+            engine.on_change = None
+            self.tracks.pop(session_id, None)
+            print("session closed:", session_id)
+            if self.on_track:
+                self.on_track(session_id, None)
+        for session_id in session_ids:
+            if session_id not in self.engines:
+                engine = PlaybackEngine(self.source, self.monotonic, session_id=session_id, artwork=True)
+                engine.on_change = self.engine_changed
+                self.engines[session_id] = engine
+                print("session opened:", session_id)
+                await engine.attach()
+        self.select()
+        self._notify()
+
+    def select(self):
+        current = self.source.current_session_id()
+        if self.pinned in self.engines:
+            session_id = self.pinned
+        elif current in self.engines:
+            session_id = current
+        else:
+            playing = [session_id for session_id, engine in self.engines.items() if engine.state.status == playback.PLAYING]
+            session_id = (playing or list(self.engines) or [None])[0]
+        engine = self.engines.get(session_id)
+        if engine is not self.displayed:
+            self.displayed = engine
+            print("showing session:", session_id)
+
+    def focus(self, session_id):
+        # pins the displayed session, None goes back to following the source's current session
+        self.pinned = session_id
+        self.select()
+        self._notify()
+
+    def cycle(self):
+        # shows the next session, for a key or mouse binding on the overlay
+        if not self.engines:
+            return
+        session_ids = list(self.engines)
+        shown = self.displayed.session_id if self.displayed else None
+        index = session_ids.index(shown) + 1 if shown in session_ids else 0
+        self.focus(session_ids[index % len(session_ids)])
+
+    def engine_changed(self, engine):
+        state = engine.state
+        identity = (state.title, state.artist, state.album_title)
+        if state.title and self.tracks.get(engine.session_id) != identity:
+            self.tracks[engine.session_id] = identity
+            if self.on_track:
+                self.on_track(engine.session_id, self.media_info(engine))
+        if engine is self.displayed:
+            self._notify()
+
+    def media_info(self, engine=None):
+        engine = engine or self.displayed
+        state = engine.state
+        return MediaInfo(state.title, state.artist, state.album_title, engine.clock.now()[0], state.duration, state.status,
+                         state.thumbnail_bytes)
+
+    async def get_media_info(self):
+        # the displayed session's track from what the engines already hold, no source reads
+        if self.displayed is None or not self.displayed.state.title:
+            raise Exception('No active media session found.')
+        return self.media_info()
+
+    async def wait_for_change(self, timeout=None):
+        version = self.version
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.version != version
+
+    def _notify(self):
+        self.version += 1
+        self._changed.set()
+        self._changed = asyncio.Event()
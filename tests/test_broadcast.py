@@ -0,0 +1,13 @@
+import pytest
+from broadcast import BroadcastServer
+
+def test_start_raises_when_the_port_is_taken():
+    first = BroadcastServer(port=0).start()
+    try:
+        second = BroadcastServer(port=first.port)
+        with pytest.raises(OSError):
+            second.start()
+        # nothing to stop, this must not block either
+        second.stop()
+    finally:
+        first.stop()
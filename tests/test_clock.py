@@ -0,0 +1,83 @@
+import asyncio
+import random
+import playback
+from playback import FakeMediaSource, PlaybackEngine
+
+# the player runs a little fast and reports its position with jitter, about once a second
+RATE = 1.002
+JITTER = 0.04
+TOLERANCE = 0.1
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+def report(source, position, at):
+    session = source.sessions['player']
+    session['position'] = position
+    session['position_updated'] = at
+    source._emit(playback.TIMELINE_EVENT, 'player')
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+def test_clock_follows_jittery_samples_and_a_seek():
+    async def main():
+        rng = random.Random(11)
+        clock = FakeClock()
+        source = FakeMediaSource()
+        source.set_track('player', "Song", "Artist", duration=300)
+        # the fake source stamps samples with time.monotonic, this test runs on its own clock
+        source.sessions['player']['position_updated'] = clock.now
+        engine = PlaybackEngine(source, monotonic=clock)
+        await engine.start()
+        start = clock.now
+        offset = 0.0
+
+        def true_position(at):
+            return offset + (at - start) * RATE
+
+        worst = 0.0
+        for second in range(1, 60):
+            if second == 30:
+                # the listener jumps ahead
+                offset += 90.0
+            clock.now = start + second
+            report(source, true_position(clock.now) + rng.uniform(-JITTER, JITTER), clock.now)
+            await settle()
+            # right after the sample and halfway to the next one
+            for ahead in (0.0, 0.5, 0.99):
+                clock.now = start + second + ahead
+                position, error = engine.clock.now()
+                miss = abs(position - true_position(clock.now))
+                if second > 2 and second != 30:
+                    worst = max(worst, miss)
+                    assert miss <= max(error, TOLERANCE)
+        assert worst < TOLERANCE
+        assert engine.clock.seeks == 1
+        assert abs(engine.clock.rate - RATE) < 0.002
+    asyncio.run(main())
+
+def test_pause_holds_the_position():
+    async def main():
+        clock = FakeClock()
+        source = FakeMediaSource()
+        source.set_track('player', "Song", "Artist", duration=300, position=10.0)
+        source.sessions['player']['position_updated'] = clock.now
+        engine = PlaybackEngine(source, monotonic=clock)
+        await engine.start()
+        report(source, 10.0, clock.now)
+        await settle()
+        clock.now += 5
+        source.sessions['player']['status'] = playback.PAUSED
+        source._emit(playback.PLAYBACK_EVENT, 'player')
+        await settle()
+        paused_at = engine.clock.now()[0]
+        assert abs(paused_at - 15.0) < TOLERANCE
+        clock.now += 60
+        assert engine.clock.now()[0] == paused_at
+    asyncio.run(main())
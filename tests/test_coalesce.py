@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+import lrclibclient
+
+class FakeClient:
+    # answers after latency with one result per call, or raises error
+    def __init__(self, latency=0.05, error=None):
+        self.latency = latency
+        self.error = error
+        self.calls = 0
+        self.finished = 0
+
+    async def search_lyrics(self, track_name=None, artist_name=None, album_name=None, query=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        self.finished += 1
+        if self.error:
+            raise self.error
+        return [lrclibclient.SearchResult({'id': self.calls, 'trackName': track_name})]
+
+    async def get_lyrics_by_id(self, lrclib_id):
+        self.calls += 1
+        return lrclibclient.SearchResult({'id': lrclib_id})
+
+    def close(self):
+        pass
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_identical_requests_in_flight_share_one_call():
+    client = FakeClient()
+    coalescing = lrclibclient.CoalescingClient(client)
+
+    async def main():
+        return await asyncio.gather(coalescing.search_lyrics("Blue Hour", "Nova"),
+                                    coalescing.search_lyrics("  blue HOUR ", "nova"),
+                                    coalescing.search_lyrics("Blue Hour", "Nova"),
+                                    coalescing.search_lyrics("Blue Hour"))
+    first, second, third, other = asyncio.run(main())
+    assert first is second is third
+    assert other is not first
+    assert client.calls == 2
+    assert (coalescing.misses, coalescing.coalesced) == (2, 2)
+
+def test_answers_are_kept_for_their_ttl():
+    client = FakeClient(latency=0)
+    clock = Clock()
+    coalescing = lrclibclient.CoalescingClient(client, ttl=60, monotonic=clock)
+
+    async def main():
+        first = await coalescing.search_lyrics("Blue Hour", "Nova")
+        clock.now = 59
+        assert await coalescing.search_lyrics("Blue Hour", "Nova") is first
+        clock.now = 61
+        assert await coalescing.search_lyrics("Blue Hour", "Nova") is not first
+    asyncio.run(main())
+    assert client.calls == 2 and coalescing.hits == 1
+
+def test_least_recently_used_answers_are_dropped_past_max_entries():
+    client = FakeClient(latency=0)
+    coalescing = lrclibclient.CoalescingClient(client, max_entries=2)
+
+    async def main():
+        for title in ("a", "b", "a", "c", "a", "b"):
+            await coalescing.search_lyrics(title)
+    asyncio.run(main())
+    # a stayed recent, b was dropped for c and asked again
+    assert client.calls == 4
+
+def test_errors_are_not_kept():
+    client = FakeClient(latency=0, error=lrclibclient.HTTPError(503, '/api/search'))
+    coalescing = lrclibclient.CoalescingClient(client)
+
+    async def main():
+        for _ in range(2):
+            with pytest.raises(lrclibclient.HTTPError):
+                await coalescing.search_lyrics("Blue Hour")
+    asyncio.run(main())
+    assert client.calls == 2 and not coalescing.in_flight
+
+def test_a_cancelled_caller_leaves_the_shared_call_running():
+    client = FakeClient(latency=0.1)
+    coalescing = lrclibclient.CoalescingClient(client)
+
+    async def main():
+        skipped = asyncio.ensure_future(coalescing.search_lyrics("Blue Hour", "Nova"))
+        waiting = asyncio.ensure_future(coalescing.search_lyrics("Blue Hour", "Nova"))
+        await asyncio.sleep(0.02)
+        skipped.cancel()
+        results = await waiting
+        assert skipped.cancelled()
+        # the skipped track played again after the call finished is answered from the kept response
+        assert await coalescing.search_lyrics("Blue Hour", "Nova") is results
+    asyncio.run(main())
+    assert client.calls == 1 and client.finished == 1
+
+def test_a_call_outlives_its_only_caller():
+    client = FakeClient(latency=0.05)
+    coalescing = lrclibclient.CoalescingClient(client)
+
+    async def main():
+        caller = asyncio.ensure_future(coalescing.search_lyrics("Blue Hour", "Nova"))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.sleep(0.1)
+        assert await coalescing.search_lyrics("Blue Hour", "Nova")
+    asyncio.run(main())
+    assert client.calls == 1 and coalescing.hits == 1
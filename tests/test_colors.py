@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+import colors
+
+# RGB colours of the fixture cover
+BLUE = (10, 50, 200)
+# within MIN_COLOR_DISTANCE of BLUE but in another histogram bin, it must not become a palette colour of its own
+NEAR_BLUE = (10, 50, 216)
+WHITE = (255, 255, 255)
+RED = (220, 20, 30)
+
+def cover(scale=1):
+    # BGR like cv2 decodes it, bands of 38 rows of blue, 16 white, 6 of a shade of the blue and 4 red. At scale 10
+    # the bands stay whole through the decimation and the area resize
+    side = 64 * scale
+    image = np.zeros((side, side, 3), np.uint8)
+    top = 0
+    for rgb, rows in ((BLUE, 38), (WHITE, 16), (NEAR_BLUE, 6), (RED, 4)):
+        image[top:top + rows * scale] = rgb[::-1]
+        top += rows * scale
+    return image
+
+def test_dominant_colors_of_a_known_cover():
+    found, counts = colors.get_dominant_colors(cover(), 5)
+    assert [tuple(color) for color in found] == [BLUE, WHITE, RED]
+    assert list(counts) == [38 * 64, 16 * 64, 4 * 64]
+
+def test_quantizer_is_deterministic():
+    rng = np.random.default_rng(5)
+    image = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    first = colors.get_dominant_colors(image, 8)
+    for _ in range(3):
+        again = colors.get_dominant_colors(image.copy(), 8)
+        assert np.array_equal(first[0], again[0]) and np.array_equal(first[1], again[1])
+    assert len(first[0]) == 8
+
+def test_contrasting_colors():
+    # the two palette colours furthest apart, white and red, the more common of them as the background
+    assert colors.palette_from_image(cover(), 5) == ('#ffffff', '#dc141e', '#ed898e')
+    # a flat cover is paired with black or white
+    flat = np.full((16, 16, 3), 240, np.uint8)
+    assert colors.get_contrasting_colors(flat) == ('#f0f0f0', '#000000')
+
+def test_large_covers_are_shrunk_first():
+    pytest.importorskip('cv2')
+    found, counts = colors.get_dominant_colors(cover(10), 5)
+    assert [tuple(color) for color in found] == [BLUE, WHITE, RED]
+    assert counts.sum() <= colors.MAX_SIDE ** 2
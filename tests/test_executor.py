@@ -0,0 +1,37 @@
+import asyncio
+import threading
+import pytest
+from executor import WorkExecutor
+
+def run_cancellation(io_queue):
+    # one worker busy with the current track, the skipped track's jobs wait behind it
+    executor = WorkExecutor(io_workers=1, cpu_workers=0, io_queue=io_queue)
+    release = threading.Event()
+    ran = []
+
+    async def main():
+        blocker = asyncio.ensure_future(executor.io(release.wait, group='current'))
+        await asyncio.sleep(0.01)
+        queued = [asyncio.ensure_future(executor.io(ran.append, number, group='skipped')) for number in range(4)]
+        await asyncio.sleep(0.01)
+        cancelled = executor.cancel('skipped')
+        release.set()
+        results = await asyncio.gather(*queued, return_exceptions=True)
+        await blocker
+        # the slots freed by the cancelled callers are usable again
+        await executor.io(ran.append, 'after', group='next')
+        return cancelled, results
+    try:
+        return (*asyncio.run(main()), ran, executor)
+    finally:
+        executor.shutdown()
+
+@pytest.mark.parametrize('io_queue', [1, 8])
+def test_cancel_reaches_jobs_queued_in_the_pool_and_callers_waiting_for_a_slot(io_queue):
+    # with io_queue=1 every skipped job waits for a slot, with 8 they are all queued in the pool
+    cancelled, results, ran, executor = run_cancellation(io_queue)
+    assert cancelled == 4
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert ran == ['after']
+    assert executor.pending() == 0
+    assert executor.free['io'] == io_queue
@@ -0,0 +1,36 @@
+import karaoke
+import metrics
+
+class FakeRoot:
+    # root.after without a Tk loop, the test fires the frames itself
+    def __init__(self):
+        self.pending = None
+
+    def after(self, delay, callback):
+        self.pending = callback
+        return 'after'
+
+    def after_cancel(self, after_id):
+        self.pending = None
+
+class FakeDisplay:
+    def __init__(self):
+        self.root = FakeRoot()
+
+def test_frame_counts_of_each_track_go_to_metrics(monkeypatch, capsys):
+    registry = metrics.Metrics()
+    registry.enabled = True
+    monkeypatch.setattr(metrics, 'registry', registry)
+    player = karaoke.KaraokePlayer(FakeDisplay())
+    # no timeline to draw, only the scheduler is exercised
+    player.scheduler.callback = lambda now: None
+    for frames in (3, 2):
+        player.set_running(True)
+        for _ in range(frames):
+            player.display.root.pending()
+        player.stop()
+    # a track change with the scheduler never started adds nothing
+    player.stop()
+    assert registry.counters['karaoke_frames'] == 5
+    assert registry.histograms['karaoke_frame_ms'].count == 2
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+import time
+import lrclibclient
+import ranking
+from lrclibstub import StubServer, make_record
+from replay import synthetic_lyrics
+
+LATENCY = 0.2
+LYRICS = synthetic_lyrics("Blue Hour", "Nova", 200)
+
+RECORDS = [
+    make_record(1, "Blue Hour", "Nova", "Night", 200, LYRICS),
+    make_record(2, "Blue Hour", "Nova Tribute Band", "Covers", 200, LYRICS),
+    make_record(3, "Blue Hour (Karaoke Version)", "Karaoke Hits", "Karaoke", 200, LYRICS),
+    make_record(4, "Blue Hour", "Nova", "Night", 200, None, instrumental=True),
+]
+
+def search(title, artist, album, duration):
+    server = StubServer(RECORDS, latency=LATENCY)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = lrclibclient.LrcLibClient(user_agent="test", base_url=server.base_url)
+
+    async def run():
+        try:
+            start = time.perf_counter()
+            match = await ranking.find_lyrics(client, title, artist, album, duration)
+            return match, time.perf_counter() - start
+        finally:
+            client.close()
+    try:
+        match, elapsed = asyncio.run(run())
+        return match, elapsed, server.requests
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_exact_track_is_found_with_one_request():
+    match, elapsed, requests = search("Blue Hour", "Nova", "Night", 200.5)
+    assert match.result.id == 1
+    assert match.calls == requests == 1
+
+def test_second_stage_queries_run_concurrently():
+    # the player's decorated title misses the first query, the cleaned up ones go out together
+    match, elapsed, requests = search("Blue Hour - Remastered 2019", "Nova", "", 201)
+    assert match.result.id == 1
+    stages = ranking.search_stages("Blue Hour - Remastered 2019", "Nova")
+    assert requests == match.calls <= len(stages[0]) + len(stages[1])
+    assert len(stages[1]) > 1
+    # two round trips, not one per query
+    assert elapsed < 3 * LATENCY
+
+def test_unknown_track_is_not_matched():
+    match, elapsed, requests = search("Another Song", "Somebody", "", 180)
+    assert match is None
+    assert requests == sum(len(stage) for stage in ranking.search_stages("Another Song", "Somebody"))
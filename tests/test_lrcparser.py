@@ -0,0 +1,24 @@
+import lrcparser
+
+def test_repeated_line_shifts_its_word_times():
+    entries = lrcparser.parse_lrc("[00:10.00][01:00.00]<00:10.00>a <00:11.00>b\n")
+    assert entries == [(10000, 'a b', ((10000, 'a '), (11000, 'b'))),
+                       (60000, 'a b', ((60000, 'a '), (61000, 'b')))]
+
+def test_extended_syntax():
+    sheet = "[ar:Someone]\n[offset:500]\n[00:05.5] five\n[00:01.250][00:03.00] twice\n[00:04.00]\n[00:02.00] two\n"
+    assert lrcparser.parse_lrc(sheet) == [(750, 'twice', None), (1500, 'two', None), (2500, 'twice', None),
+                                          (3500, '', None), (5000, 'five', None)]
+
+def test_string_and_line_iterator_agree():
+    sheet = "[00:02.00] two\n[00:01.00] one\n[00:03.00][00:04.00] chorus\n"
+    assert lrcparser.parse_lrc(sheet) == lrcparser.parse_lrc_lines(sheet.splitlines(True)) == [
+        (1000, 'one', None), (2000, 'two', None), (3000, 'chorus', None), (4000, 'chorus', None)]
+
+def test_spaces_between_stamps():
+    expected = [(12000, 'chorus', None), (30000, 'chorus', None)]
+    assert lrcparser.parse_lrc("[00:12.00] [00:30.00] chorus\n") == expected
+    assert lrcparser.parse_lrc_lines(["[00:12.00] [00:30.00] chorus\n"]) == expected
+    # a sheet of simple lines with one such line among them
+    sheet = "[00:01.00] one\n[00:12.00] [00:30.00] chorus\n[00:20.00] two\n"
+    assert lrcparser.parse_lrc(sheet) == [(1000, 'one', None), (12000, 'chorus', None), (20000, 'two', None), (30000, 'chorus', None)]
@@ -0,0 +1,105 @@
+import threading
+import lrcparser
+import lyricstore
+from replay import synthetic_lyrics
+from timeline import LyricTimeline
+
+LYRICS = synthetic_lyrics("Blue Hour", "Nova", 200)
+TIMELINE = LyricTimeline(lrcparser.parse_lrc(LYRICS))
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def entry_size(key):
+    return len(key) + len(LYRICS.encode('utf-8')) + len(TIMELINE.to_bytes())
+
+def test_hit_returns_the_compiled_timeline(tmp_path):
+    store = lyricstore.LyricStore(str(tmp_path / "lyrics.db"))
+    store.put('key', LYRICS, TIMELINE)
+    raw, timeline = store.get('key')
+    assert raw == LYRICS and timeline.to_bytes() == TIMELINE.to_bytes()
+    assert store.get('other') is None
+    store.close()
+
+def test_negative_entries_expire_after_their_ttl(tmp_path):
+    clock = Clock()
+    store = lyricstore.LyricStore(str(tmp_path / "lyrics.db"), negative_ttl=60, clock=clock)
+    store.put_missing('missing')
+    store.put('found', LYRICS, TIMELINE)
+    clock.now += 60
+    assert store.get('missing') is lyricstore.NO_LYRICS
+    clock.now += 1
+    assert store.get('missing') is None
+    assert len(store) == 1
+    # lyrics do not expire
+    clock.now += 10 ** 6
+    assert store.get('found')[0] == LYRICS
+    store.close()
+
+def test_eviction_drops_the_least_recently_used(tmp_path):
+    clock = Clock()
+    store = lyricstore.LyricStore(str(tmp_path / "lyrics.db"), max_bytes=int(entry_size('a') * 3.5),
+                                  touch_interval=10, clock=clock)
+    for key in 'abc':
+        store.put(key, LYRICS, TIMELINE)
+        clock.now += 1
+    # a is read past the touch interval and becomes the most recently used, b is now the oldest
+    clock.now += 100
+    assert store.get('a') is not None
+    clock.now += 1
+    store.put('d', LYRICS, TIMELINE)
+    assert store.get('b') is None
+    assert all(store.get(key) is not None for key in 'acd')
+    assert store.total_bytes <= store.max_bytes
+    store.close()
+
+def test_reads_within_the_touch_interval_do_not_reorder(tmp_path):
+    clock = Clock()
+    store = lyricstore.LyricStore(str(tmp_path / "lyrics.db"), max_bytes=int(entry_size('a') * 2.5),
+                                  touch_interval=10, clock=clock)
+    store.put('a', LYRICS, TIMELINE)
+    clock.now += 1
+    store.put('b', LYRICS, TIMELINE)
+    clock.now += 5
+    store.get('a')
+    store.put('c', LYRICS, TIMELINE)
+    assert store.get('a') is None and store.get('b') is not None
+    store.close()
+
+def test_concurrent_writers_and_readers_share_the_file(tmp_path):
+    # working.py and prefetch.py each open the store, WAL lets them read while the other writes
+    path = str(tmp_path / "lyrics.db")
+    stores = [lyricstore.LyricStore(path), lyricstore.LyricStore(path)]
+    errors = []
+    keys = [f'track {number}' for number in range(200)]
+
+    def writer(store, offset):
+        try:
+            for key in keys[offset::2]:
+                store.put(key, LYRICS, TIMELINE)
+        except Exception as e:
+            errors.append(e)
+
+    def reader(store):
+        try:
+            for _ in range(3):
+                for key in keys:
+                    cached = store.get(key)
+                    # a row is either not there yet or whole
+                    assert cached is None or cached[0] == LYRICS
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=writer, args=(stores[0], 0)), threading.Thread(target=writer, args=(stores[1], 1)),
+               threading.Thread(target=reader, args=(stores[0],)), threading.Thread(target=reader, args=(stores[1],))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(stores[0]) == len(stores[1]) == len(keys)
+    for store in stores:
+        store.close()
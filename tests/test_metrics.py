@@ -0,0 +1,88 @@
+import asyncio
+import json
+import time
+import metrics
+from executor import LoopWatchdog
+
+def test_histogram_quantiles_are_bucket_bounds():
+    histogram = metrics.Histogram((10, 20, 50))
+    for value in [5] * 50 + [15] * 40 + [30] * 9 + [1000]:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 10
+    assert histogram.quantile(0.9) == 20
+    assert histogram.quantile(0.95) == 50
+    # the overflow bucket reports the last finite bound
+    assert histogram.quantile(1.0) == 50
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 100 and snapshot['buckets'] == [(10, 50), (20, 90), (50, 99)]
+    assert snapshot['sum'] == 5 * 50 + 15 * 40 + 30 * 9 + 1000
+    assert metrics.Histogram().snapshot()['p50'] is None
+
+def test_spans_are_free_when_disabled():
+    registry = metrics.Metrics()
+    assert registry.span('palette') is metrics.NULL_SPAN
+    with registry.span('palette'):
+        pass
+    registry.observe('first_line_ms', 10)
+    registry.count('hits')
+    assert registry.histograms == {} and registry.counters == {}
+
+def test_spans_record_milliseconds_when_enabled():
+    registry = metrics.Metrics()
+    registry.enabled = True
+    with registry.span('palette'):
+        time.sleep(0.02)
+    histogram = registry.histograms['palette_ms']
+    assert histogram.count == 1 and 15 < histogram.sum < 500
+    # lateness can be negative and has bounds of its own
+    registry.observe('line_lateness_ms', -20)
+    assert registry.histograms['line_lateness_ms'].bounds == metrics.LATENESS_BOUNDS
+
+def test_prometheus_text():
+    registry = metrics.Metrics()
+    registry.enabled = True
+    registry.count('lrclib_coalesced', 3)
+    registry.observe('first_line_ms', 7)
+    registry.observe('first_line_ms', 700)
+    lines = registry.prometheus_text().splitlines()
+    assert lines[:2] == ["# TYPE winlyrics_lrclib_coalesced_total counter", "winlyrics_lrclib_coalesced_total 3"]
+    assert "# TYPE winlyrics_first_line_ms histogram" in lines
+    assert 'winlyrics_first_line_ms_bucket{le="5"} 0' in lines
+    assert 'winlyrics_first_line_ms_bucket{le="10"} 1' in lines
+    assert 'winlyrics_first_line_ms_bucket{le="1000"} 2' in lines
+    assert 'winlyrics_first_line_ms_bucket{le="+Inf"} 2' in lines
+    assert lines[-2:] == ["winlyrics_first_line_ms_sum 707.0", "winlyrics_first_line_ms_count 2"]
+
+def test_json_exporter_rotates(tmp_path):
+    registry = metrics.Metrics()
+    registry.enabled = True
+    registry.count('hits')
+    path = str(tmp_path / "metrics.jsonl")
+    exporter = metrics.JsonExporter(path, max_bytes=1, backups=2, metrics=registry)
+    for _ in range(4):
+        exporter.write()
+    # every write past the first found the file over max_bytes, only two backups are kept
+    assert sorted(entry.name for entry in tmp_path.iterdir()) == ["metrics.jsonl", "metrics.jsonl.1", "metrics.jsonl.2"]
+    with open(path, encoding='utf-8') as file:
+        snapshots = [json.loads(line) for line in file]
+    assert len(snapshots) == 1 and snapshots[0]['counters'] == {'hits': 1}
+
+def test_watchdog_records_loop_lag(monkeypatch):
+    registry = metrics.Metrics()
+    registry.enabled = True
+    monkeypatch.setattr(metrics, 'registry', registry)
+
+    async def main():
+        watchdog = LoopWatchdog(budget=0.02, report=False)
+        watchdog.start()
+        await asyncio.sleep(0.05)
+        # hold the loop past the budget
+        time.sleep(0.1)
+        await asyncio.sleep(0.05)
+        watchdog.stop()
+        return watchdog
+    watchdog = asyncio.run(main())
+    assert watchdog.stalls >= 1
+    lag = registry.histograms['loop_lag_ms']
+    assert lag.count > 2 and lag.quantile(1.0) >= 50
+    assert registry.histograms['loop_stall_ms'].count == watchdog.stalls
@@ -0,0 +1,87 @@
+import asyncio
+import sqlite3
+import threading
+import pytest
+import offlinedb
+from lrclibstub import make_record
+
+RECORDS = [
+    make_record(1, "Midnight City", "M83", "Hurry Up, We're Dreaming", 243, "[00:01.00] waiting"),
+    make_record(2, "Midnight City (Live)", "M83", "Live at the Fillmore", 262, "[00:01.00] waiting"),
+    make_record(3, "Café Society", "Beyoncé", "Lemonade", 200, "[00:01.00] la"),
+    make_record(4, "City Lights", "Nova", "Night", 180, None, instrumental=True),
+]
+
+def make_index(tmp_path, trigram=False):
+    index = offlinedb.OfflineIndex(str(tmp_path / ("grams.db" if trigram else "lrclib.db")), trigram=trigram)
+    index.import_records(RECORDS)
+    return index
+
+def ids(results):
+    return sorted(result.id for result in results)
+
+def test_fields_match_whole_words_folded(tmp_path):
+    index = make_index(tmp_path)
+    assert len(index) == 4
+    assert ids(index.search(track_name="midnight city", artist_name="m83")) == [1, 2]
+    # accents and case are folded on both sides
+    assert ids(index.search(track_name="CAFE SOCIETY", artist_name="beyonce")) == [3]
+    # every given field has to match, query words may be in any field
+    assert ids(index.search(track_name="city", album_name="night")) == [4]
+    assert ids(index.search(query="city m83 live")) == [2]
+    assert index.search(track_name="midnight", artist_name="nova") == []
+    assert index.search() == []
+    assert index.get(3).track_name == "Café Society" and index.get(99) is None
+    index.close()
+
+def test_duration_is_limited_to_neighbouring_buckets(tmp_path):
+    index = make_index(tmp_path)
+    # 243 s is bucket 24, the live cut at 262 s is bucket 26
+    assert ids(index.search(track_name="midnight city", duration=243)) == [1]
+    assert ids(index.search(track_name="midnight city", duration=255)) == [1, 2]
+    assert ids(index.search(track_name="midnight city", duration=100)) == []
+    index.close()
+
+def test_trigram_index_answers_partial_words(tmp_path):
+    if sqlite3.sqlite_version_info < (3, 34):
+        pytest.skip("the trigram tokenizer needs SQLite 3.34")
+    plain = make_index(tmp_path)
+    assert plain.search(track_name="idnigh") == []
+    plain.close()
+    index = make_index(tmp_path, trigram=True)
+    assert ids(index.search(track_name="idnigh")) == [1, 2]
+    # whole words are still answered by the word index first
+    assert ids(index.search(track_name="city lights")) == [4]
+    # terms under three letters can not use the trigram index and are left out of the fallback
+    assert ids(index.search(track_name="idnigh", artist_name="m")) == [1, 2]
+    index.close()
+
+def test_scoped_index_searches_near_the_track_duration(tmp_path):
+    index = make_index(tmp_path)
+
+    async def main():
+        return (await index.scoped(262).search_lyrics(track_name="midnight city"),
+                await index.search_lyrics(track_name="midnight city"))
+    scoped, unscoped = asyncio.run(main())
+    assert ids(scoped) == [2] and ids(unscoped) == [1, 2]
+    index.close()
+
+def test_lookups_from_several_threads(tmp_path):
+    index = make_index(tmp_path)
+    errors = []
+
+    def lookups():
+        try:
+            for _ in range(200):
+                assert ids(index.search(track_name="midnight city")) == [1, 2]
+                assert index.get(1).id == 1
+                assert len(index) == 4
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=lookups) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    index.close()
@@ -0,0 +1,75 @@
+import asyncio
+import io
+import numpy as np
+import pytest
+import colors
+import palettecache
+from test_colors import cover
+
+def png(image):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(image[:, :, ::-1])).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+class CountingBackend:
+    def __init__(self, palette=('#0a32c8', '#ffffff', '#8498e3')):
+        self.palette = palette
+        self.calls = 0
+
+    def __call__(self, data, num_colors):
+        self.calls += 1
+        return self.palette
+
+def make_cache(path, backend, **options):
+    cache = palettecache.PaletteCache(path, backend='none', **options)
+    cache.compute = backend
+    return cache
+
+def test_cache_answers_from_memory_then_disk(tmp_path):
+    path = str(tmp_path / "palettes.db")
+    backend = CountingBackend()
+    cache = make_cache(path, backend)
+    data = b'cover bytes' * 100
+    assert cache.get(data) == backend.palette
+    # keyed by the bytes, not the object
+    assert cache.get(bytes(bytearray(data))) == backend.palette
+    assert backend.calls == 1 and (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+    # a new process finds it in the table without computing it again
+    cache = make_cache(path, backend)
+    assert cache.get(data) == backend.palette
+    assert backend.calls == 1 and cache.hits == 1
+    assert palettecache.thumbnail_key(data) in cache.memory
+    cache.close()
+
+def test_cache_keeps_memory_and_disk_bounded(tmp_path):
+    backend = CountingBackend()
+    cache = make_cache(str(tmp_path / "palettes.db"), backend, memory_entries=2, disk_entries=3)
+    thumbnails = [bytes([number]) * 100 for number in range(5)]
+    for data in thumbnails:
+        cache.get(data)
+    assert list(cache.memory) == [palettecache.thumbnail_key(data) for data in thumbnails[-2:]]
+    assert cache.connection.execute('SELECT COUNT(*) FROM palettes').fetchone()[0] == 3
+    # the oldest fell out of both and is computed again
+    cache.get(thumbnails[0])
+    assert backend.calls == 6
+    cache.close()
+
+def test_undecodable_covers_are_not_stored(tmp_path):
+    backend = CountingBackend(None)
+    cache = make_cache(str(tmp_path / "palettes.db"), backend)
+    assert cache.get(b'not an image') == palettecache.DEFAULT_PALETTE
+    assert cache.get(b'not an image') == palettecache.DEFAULT_PALETTE
+    assert backend.calls == 2 and not cache.memory
+    assert cache.get(None) == palettecache.DEFAULT_PALETTE and backend.calls == 2
+    cache.close()
+
+def test_get_async_matches_get():
+    pytest.importorskip('PIL')
+    from executor import inline
+    cache = palettecache.PaletteCache(backend='pillow')
+    data = png(cover())
+    palette = asyncio.run(cache.get_async(data, inline, 'key'))
+    assert palette == colors.palette_from_image(cover(), cache.num_colors)
+    assert asyncio.run(cache.get_async(data, inline)) is palette and cache.hits == 1
@@ -0,0 +1,132 @@
+import asyncio
+import time
+import lrclibclient
+import lyricstore
+import prefetch
+import trackid
+from lrclibstub import StubServer, make_record
+from playback import MediaInfo
+from replay import synthetic_lyrics
+
+TRACKS = [("Blue Hour", "Nova", 200), ("Red Line", "Kite", 180), ("Green Room", "Pale", 240)]
+
+class FlakyClient:
+    # fails with the given statuses first, then answers with no results
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    async def search_lyrics(self, track_name=None, artist_name=None, album_name=None, query=None):
+        self.calls += 1
+        if self.statuses:
+            raise lrclibclient.HTTPError(self.statuses.pop(0), '/api/search')
+        return []
+
+def test_rate_limiter_spaces_requests_after_the_burst():
+    async def main():
+        limiter = prefetch.RateLimiter(50, burst=2)
+        start = time.monotonic()
+        for _ in range(12):
+            await limiter.acquire()
+        return time.monotonic() - start
+    # two go at once, the other ten wait 20 ms each
+    assert 0.18 < asyncio.run(main()) < 1.0
+
+def test_rate_limiter_pause_holds_every_caller():
+    async def main():
+        limiter = prefetch.RateLimiter(1000)
+        limiter.pause(0.1)
+        start = time.monotonic()
+        await asyncio.gather(limiter.acquire(), limiter.acquire())
+        return time.monotonic() - start
+    assert asyncio.run(main()) >= 0.1
+
+def test_retrying_client_backs_off_and_recovers(monkeypatch):
+    monkeypatch.setattr(prefetch, 'BACKOFF_BASE', 0.01)
+    client = FlakyClient(503, 429)
+    limiter = prefetch.RateLimiter(1000)
+    progress = prefetch.Progress(1)
+    retrying = prefetch.RetryingClient(client, limiter, progress)
+    assert asyncio.run(retrying.search_lyrics("Blue Hour", "Nova")) == []
+    assert (client.calls, progress.requests, progress.retries) == (3, 3, 2)
+    # the 429 paused the shared limiter
+    assert limiter.resume_at > 0
+    assert not retrying.failed
+
+def test_retrying_client_gives_up(monkeypatch):
+    monkeypatch.setattr(prefetch, 'BACKOFF_BASE', 0.001)
+    progress = prefetch.Progress(1)
+    # a status that is not worth retrying fails at once
+    retrying = prefetch.RetryingClient(FlakyClient(404), prefetch.RateLimiter(1000), progress)
+    try:
+        asyncio.run(retrying.search_lyrics("Blue Hour", "Nova"))
+        assert False, "expected an HTTPError"
+    except lrclibclient.HTTPError as e:
+        assert e.status == 404
+    assert retrying.failed and progress.requests == 1
+    retrying = prefetch.RetryingClient(FlakyClient(*[503] * 10), prefetch.RateLimiter(1000), progress, retries=2)
+    try:
+        asyncio.run(retrying.search_lyrics("Blue Hour", "Nova"))
+        assert False, "expected an HTTPError"
+    except lrclibclient.HTTPError as e:
+        assert e.status == 503
+    assert retrying.failed and progress.requests == 4
+
+def test_prefetch_fills_the_store_and_resumes_from_the_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(prefetch, 'BACKOFF_BASE', 0.01)
+    records = [make_record(number, title, artist, "", duration, synthetic_lyrics(title, artist, duration))
+               for number, (title, artist, duration) in enumerate(TRACKS, 1)]
+    server = StubServer(records, error_rate=0.3).start()
+    tracks = {trackid.track_key(title, artist, duration): MediaInfo(title, artist, "", duration=duration)
+              for title, artist, duration in TRACKS + [("Nowhere", "Nobody", 200)]}
+    store = lyricstore.LyricStore(str(tmp_path / "lyrics.db"))
+    path = str(tmp_path / "prefetch.jsonl")
+
+    async def run():
+        api = lrclibclient.LrcLibClient(user_agent="test", base_url=server.base_url)
+        checkpoint = prefetch.Checkpoint(path)
+        try:
+            return await prefetch.prefetch(tracks, store, checkpoint, api=api, rate=1000, workers=2)
+        finally:
+            checkpoint.close()
+            api.close()
+    try:
+        progress = asyncio.run(run())
+        assert (progress.found, progress.missing, progress.failed) == (3, 1, 0)
+        # the stub failed some requests, the retries got past them
+        assert progress.retries > 0
+        for title, artist, duration in TRACKS:
+            cached = store.get(trackid.track_key(title, artist, duration))
+            assert cached is not None and cached is not lyricstore.NO_LYRICS
+        # a crash cut the last line short, the next run still skips every finished track without a request
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write('{"key": "cut')
+        requests = server.requests
+        progress = asyncio.run(run())
+        assert progress.skipped == 4 and progress.resolved == 0
+        assert server.requests == requests
+    finally:
+        store.close()
+        server.stop()
+
+def test_read_csv_export(tmp_path):
+    path = tmp_path / "playlist.csv"
+    path.write_text("Track Name,Artist Name(s),Album Name,Duration (ms)\n"
+                    "Blue Hour,Nova,Night,200500\n"
+                    "Red Line,Kite,,\n", encoding='utf-8')
+    tracks = prefetch.read_csv(str(path))
+    assert [(track.title, track.artist, track.album_title, track.duration) for track in tracks] == [
+        ("Blue Hour", "Nova", "Night", 200.5), ("Red Line", "Kite", "", 0.0)]
+
+def test_read_m3u(tmp_path):
+    path = tmp_path / "playlist.m3u"
+    path.write_text("#EXTM3U\n"
+                    "#EXTINF:200,Nova - Blue Hour\n"
+                    "music/blue.mp3\n"
+                    "#EXTINF:-1,Untitled Stream\n"
+                    "http://radio.example/stream\n"
+                    "music/untagged.flac\n", encoding='utf-8')
+    tracks, files = prefetch.read_m3u(str(path))
+    assert [(track.title, track.artist, track.duration) for track in tracks] == [
+        ("Blue Hour", "Nova", 200.0), ("Untitled Stream", "", 0.0)]
+    assert files == [str(tmp_path / "music" / "untagged.flac")]
@@ -0,0 +1,265 @@
+import asyncio
+import pytest
+import lrcparser
+import lyricstore
+import providers
+import ranking
+import pipeline
+from palettecache import PaletteCache
+from pipeline import LyricPipeline
+from playback import MediaInfo
+from replay import synthetic_lyrics
+
+TRACK = MediaInfo("Test Song", "Test Artist", "", duration=200)
+LYRICS = synthetic_lyrics(TRACK.title, TRACK.artist, TRACK.duration)
+LINES = lrcparser.parse_lrc(LYRICS)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def fake_search(result=None, error=None, latency=0.0, calls=None):
+    async def search(media_info):
+        if calls is not None:
+            calls.append(media_info.title)
+        await asyncio.sleep(latency)
+        if error:
+            raise error
+        return result
+    return search
+
+# circuit breaker
+
+def test_breaker_opens_after_threshold_and_lets_one_trial_through():
+    clock = FakeClock()
+    breaker = providers.CircuitBreaker(failure_threshold=3, cooldown=30, monotonic=clock)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record(False)
+    assert breaker.state == 'closed'
+    breaker.record(False)
+    assert breaker.state == 'open' and breaker.trips == 1
+    assert not breaker.allow()
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    # a single trial at a time
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == 'closed' and breaker.allow()
+
+def test_breaker_doubles_cooldown_while_trials_fail():
+    clock = FakeClock()
+    breaker = providers.CircuitBreaker(failure_threshold=1, cooldown=10, max_cooldown=25, monotonic=clock)
+    breaker.record(False)
+    for cooldown in (20, 25, 25):
+        clock.now = breaker.open_until
+        assert breaker.allow()
+        breaker.record(False)
+        assert breaker.cooldown == cooldown
+        assert breaker.open_until == clock.now + cooldown
+        assert not breaker.allow()
+
+def test_abandoned_trial_frees_the_breaker():
+    clock = FakeClock()
+    breaker = providers.CircuitBreaker(failure_threshold=1, cooldown=10, monotonic=clock)
+    breaker.record(False)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.abandon()
+    assert breaker.allow()
+
+# one provider
+
+def test_not_found_does_not_count_against_a_provider():
+    provider = providers.Provider('p', fake_search(None))
+    for _ in range(providers.FAILURE_THRESHOLD + 1):
+        assert asyncio.run(provider.run(TRACK)) == (providers.MISSING, None, None)
+    assert provider.breaker.state == 'closed'
+
+def test_errors_and_timeouts_trip_the_breaker():
+    clock = FakeClock()
+    failing = providers.Provider('failing', fake_search(error=ConnectionRefusedError('refused')), monotonic=clock)
+    hanging = providers.Provider('hanging', fake_search(LYRICS, latency=10), deadline=0.01, monotonic=clock)
+    for provider, outcome in ((failing, providers.FAILED), (hanging, providers.TIMEOUT)):
+        for _ in range(providers.FAILURE_THRESHOLD):
+            assert asyncio.run(provider.run(TRACK))[0] == outcome
+        assert provider.breaker.state == 'open'
+        assert provider.stats.success_rate() == 0
+
+def test_unusable_sheets_are_rejected():
+    provider = providers.Provider('p', fake_search("just\nplain\nlines\n"))
+    assert asyncio.run(provider.run(TRACK))[0] == providers.REJECTED
+    other_cut = synthetic_lyrics(TRACK.title, TRACK.artist, TRACK.duration * 2)
+    assert providers.check_lyrics(other_cut, TRACK.duration) is not None
+    assert providers.check_lyrics(LYRICS, TRACK.duration) is None
+
+# the race
+
+def test_delayed_provider_is_not_asked_when_the_first_answers_in_time():
+    scraper_calls = []
+    race = providers.ProviderRace([
+        providers.Provider('scraper', fake_search(LYRICS, calls=scraper_calls), delay=0.2),
+        providers.Provider('lrclib', fake_search(LYRICS, latency=0.01)),
+    ])
+    assert asyncio.run(race.fetch(TRACK)) == ('lrclib', LYRICS, LINES)
+    assert scraper_calls == []
+
+def test_delayed_provider_starts_early_when_everything_before_it_came_back_empty():
+    race = providers.ProviderRace([
+        providers.Provider('lrclib', fake_search(None)),
+        providers.Provider('scraper', fake_search(LYRICS), delay=30),
+    ])
+    assert asyncio.run(asyncio.wait_for(race.fetch(TRACK), 1)) == ('scraper', LYRICS, LINES)
+
+def test_slow_provider_is_hedged_after_its_delay_and_cancelled_once_another_wins():
+    cancelled = []
+
+    async def slow(media_info):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+    race = providers.ProviderRace([
+        providers.Provider('lrclib', slow),
+        providers.Provider('scraper', fake_search(LYRICS), delay=0.05),
+    ])
+    assert asyncio.run(asyncio.wait_for(race.fetch(TRACK), 1)) == ('scraper', LYRICS, LINES)
+    assert cancelled == [True]
+    assert race.providers[0].breaker.state == 'closed'
+
+def test_first_usable_answer_wins_over_a_faster_unusable_one():
+    race = providers.ProviderRace([
+        providers.Provider('fast', fake_search("just\nplain\nlines\n")),
+        providers.Provider('slow', fake_search(LYRICS, latency=0.02)),
+    ])
+    assert asyncio.run(race.fetch(TRACK)) == ('slow', LYRICS, LINES)
+
+def test_not_found_only_when_every_provider_answered():
+    race = providers.ProviderRace([
+        providers.Provider('a', fake_search(None)),
+        providers.Provider('b', fake_search("just\nplain\nlines\n"), delay=0.01),
+    ])
+    with pytest.raises(lyricstore.LyricsNotFound):
+        asyncio.run(race.fetch(TRACK))
+
+def test_failures_are_not_reported_as_not_found():
+    race = providers.ProviderRace([
+        providers.Provider('a', fake_search(None)),
+        providers.Provider('b', fake_search(error=ConnectionRefusedError('refused'))),
+    ])
+    with pytest.raises(Exception) as raised:
+        asyncio.run(race.fetch(TRACK))
+    assert not isinstance(raised.value, lyricstore.LyricsNotFound)
+
+def test_providers_behind_an_open_breaker_are_skipped_and_not_reported_as_not_found():
+    clock = FakeClock()
+    down_calls = []
+    down = providers.Provider('down', fake_search(error=ConnectionRefusedError('refused'), calls=down_calls),
+                              monotonic=clock)
+    down.breaker = providers.CircuitBreaker(failure_threshold=1, cooldown=30, monotonic=clock)
+    race = providers.ProviderRace([providers.Provider('lrclib', fake_search(None)), down], monotonic=clock)
+    with pytest.raises(Exception):
+        asyncio.run(race.fetch(TRACK))
+    assert len(down_calls) == 1 and down.breaker.state == 'open'
+    with pytest.raises(Exception) as raised:
+        asyncio.run(race.fetch(TRACK))
+    assert len(down_calls) == 1
+    assert not isinstance(raised.value, lyricstore.LyricsNotFound)
+    assert 'skipped' in str(raised.value)
+    # after the cooldown the provider gets its trial call
+    clock.now += 30
+    with pytest.raises(Exception):
+        asyncio.run(race.fetch(TRACK))
+    assert len(down_calls) == 2
+
+# lrclib errors reach the breaker
+
+class FailingClient:
+    def __init__(self):
+        self.calls = 0
+
+    async def search_lyrics(self, **query):
+        self.calls += 1
+        raise ConnectionRefusedError('refused')
+
+class EmptyClient:
+    async def search_lyrics(self, **query):
+        return []
+
+def test_staged_search_raises_when_every_query_failed():
+    client = FailingClient()
+    with pytest.raises(ConnectionRefusedError):
+        asyncio.run(ranking.staged_search(client, "Song (feat. Someone)", "Artist", "", 200))
+    assert client.calls > 1
+    assert asyncio.run(ranking.staged_search(EmptyClient(), "Song", "Artist", "", 200)) is None
+
+def test_lrclib_outage_trips_the_breaker():
+    provider = providers.lrclib_provider(FailingClient())
+    for _ in range(providers.FAILURE_THRESHOLD):
+        assert asyncio.run(provider.run(TRACK))[0] == providers.FAILED
+    assert provider.breaker.state == 'open'
+
+# only "not found" is cached
+
+class FakeStore:
+    def __init__(self):
+        self.missing = []
+
+    def get(self, key):
+        return None
+
+    def put_missing(self, key):
+        self.missing.append(key)
+
+def prepare_with(error):
+    store = FakeStore()
+
+    async def fetch_lyrics(media_info):
+        raise error
+    pipeline = LyricPipeline(None, None, store, None, None, fetch_lyrics)
+    assert asyncio.run(pipeline.prepare(TRACK, 'key')) == (lyricstore.NO_LYRICS, None)
+    return store.missing
+
+def test_prepare_caches_not_found():
+    assert prepare_with(lyricstore.LyricsNotFound('none')) == ['key']
+
+def test_prepare_does_not_cache_failures():
+    assert prepare_with(Exception('No lyrics from any provider: lrclib failed')) == []
+
+def test_failed_prepare_is_not_reused():
+    answers = [Exception('No lyrics from any provider: lrclib failed'), (LYRICS, None)]
+
+    async def fetch_lyrics(media_info):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    async def main():
+        pipeline = LyricPipeline(None, None, lyricstore.LyricStore(':memory:'), PaletteCache(), None, fetch_lyrics)
+        key, task = pipeline.prefetch(TRACK)
+        assert (await task)[0] is lyricstore.NO_LYRICS
+        assert key not in pipeline.prepared
+        _, task = pipeline.prefetch(TRACK)
+        (lyrics, timeline), _ = await task
+        assert lyrics == LYRICS and len(timeline) == len(LINES)
+    asyncio.run(main())
+
+def test_prepare_uses_the_lines_the_race_parsed(monkeypatch):
+    class NoParser:
+        def parse_lrc(self, text):
+            raise AssertionError("parsed twice")
+    monkeypatch.setattr(pipeline, 'lrcparser', NoParser())
+
+    async def fetch_lyrics(media_info):
+        return LYRICS, LINES
+    store = lyricstore.LyricStore(':memory:')
+    (lyrics, timeline), _ = asyncio.run(LyricPipeline(None, None, store, PaletteCache(), None, fetch_lyrics).prepare(TRACK, 'key'))
+    assert timeline.text(0) == LINES[0][1]
@@ -0,0 +1,29 @@
+import ranking
+from lrclibclient import SearchResult
+from lrclibstub import make_record
+
+SYNCED = "[00:01.00] la\n"
+
+def best(records, title, artist, album, duration):
+    results = [SearchResult(record) for record in records]
+    scores = ranking.score_candidates(results, title, artist, album, duration)
+    index = int(scores.argmax())
+    return results[index].id if scores[index] >= ranking.MIN_SCORE else None
+
+def test_right_song_a_few_seconds_off_is_accepted_without_an_album():
+    # what the old 10 s duration filter let through
+    for offset in (7, 8, 9, -9):
+        assert best([make_record(1, "Blue Hour", "Nova", "Night", 200 + offset, SYNCED)], "Blue Hour", "Nova", "", 200) == 1
+
+def test_same_titled_song_by_another_artist_is_rejected_at_any_duration():
+    cover = make_record(2, "Blue Hour", "Karaoke Hits", "Covers", 200, SYNCED)
+    assert best([cover], "Blue Hour", "Nova", "", 200) is None
+    assert best([cover, make_record(1, "Blue Hour", "Nova", "", 209, SYNCED)], "Blue Hour", "Nova", "", 200) == 1
+
+def test_names_spelled_differently_still_match():
+    for title, artist, record_title, record_artist in (("Mr Brightside", "The Killers", "Mr. Brightside", "Killers"),
+                                                       ("Sweet Child O Mine", "Guns N Roses", "Sweet Child O' Mine", "Guns N' Roses")):
+        assert best([make_record(1, record_title, record_artist, "", 300, SYNCED)], title, artist, "", 301) == 1
+
+def test_unsynced_copy_is_never_accepted():
+    assert best([make_record(1, "Blue Hour", "Nova", "Night", 200, None)], "Blue Hour", "Nova", "Night", 200) is None
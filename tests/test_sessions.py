@@ -0,0 +1,122 @@
+import asyncio
+import playback
+from playback import FakeMediaSource
+from sessions import SessionManager
+
+async def settle():
+    # session events refresh on a task of their own
+    for _ in range(5):
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)
+
+async def started(*tracks):
+    source = FakeMediaSource()
+    for session_id, title in tracks:
+        source.set_track(session_id, title, "Artist", duration=200)
+    manager = SessionManager(source)
+    changes = []
+    manager.on_track = lambda session_id, media_info: changes.append((session_id, media_info and media_info.title))
+    await manager.start()
+    await settle()
+    return source, manager, changes
+
+def shown(manager):
+    return manager.displayed.session_id if manager.displayed else None
+
+def test_every_session_is_followed_and_the_current_one_shown():
+    async def main():
+        source, manager, changes = await started(('spotify', "One"), ('browser', "Two"))
+        assert set(manager.engines) == {'spotify', 'browser'}
+        assert sorted(changes) == [('browser', "Two"), ('spotify', "One")]
+        assert shown(manager) == 'spotify'
+        assert (await manager.get_media_info()).title == "One"
+        # a session opened later is followed too, without taking over the display
+        source.set_track('vlc', "Three", "Artist", duration=180)
+        await settle()
+        assert 'vlc' in manager.engines and ('vlc', "Three") in changes
+        assert shown(manager) == 'spotify'
+    asyncio.run(main())
+
+def test_switches_with_the_current_session_without_reading_it_again():
+    async def main():
+        source, manager, changes = await started(('spotify', "One"), ('browser', "Two"))
+        reads = source.reads
+        source.set_current('browser')
+        await settle()
+        assert shown(manager) == 'browser'
+        assert (await manager.get_media_info()).title == "Two"
+        assert source.reads == reads
+        # a track change in a session that is not shown is still reported
+        source.set_track('spotify', "One More", "Artist", duration=210)
+        await settle()
+        assert changes[-1] == ('spotify', "One More")
+        assert shown(manager) == 'browser'
+    asyncio.run(main())
+
+def test_focus_pins_a_session_until_released():
+    async def main():
+        source, manager, _ = await started(('spotify', "One"), ('browser', "Two"))
+        manager.focus('browser')
+        assert shown(manager) == 'browser'
+        source.set_current('spotify')
+        await settle()
+        assert shown(manager) == 'browser'
+        manager.focus(None)
+        assert shown(manager) == 'spotify'
+        manager.cycle()
+        assert shown(manager) == 'browser'
+        manager.cycle()
+        assert shown(manager) == 'spotify'
+    asyncio.run(main())
+
+def test_closed_session_is_dropped_and_the_display_falls_back():
+    async def main():
+        source, manager, changes = await started(('spotify', "One"), ('browser', "Two"))
+        source.close('spotify')
+        await settle()
+        assert list(manager.engines) == ['browser']
+        assert ('spotify', None) in changes
+        assert shown(manager) == 'browser'
+        source.close('browser')
+        await settle()
+        assert manager.displayed is None
+        assert manager.state.status == playback.PlaybackState().status
+    asyncio.run(main())
+
+def test_sessions_of_one_app_get_their_own_ids():
+    assert playback.session_keys(['msedge', 'spotify', 'msedge', 'msedge']) == ['msedge', 'spotify', 'msedge#2', 'msedge#3']
+
+def test_two_sessions_of_one_app_are_followed_separately():
+    async def main():
+        first, second = playback.session_keys(['msedge', 'msedge'])
+        source, manager, changes = await started((first, "Tab One"), (second, "Tab Two"))
+        assert set(manager.engines) == {first, second}
+        assert manager.engines[first].state.title == "Tab One"
+        assert manager.engines[second].state.title == "Tab Two"
+        source.set_track(second, "Tab Two Next", "Artist", duration=190)
+        await settle()
+        assert changes[-1] == (second, "Tab Two Next")
+        assert manager.engines[first].state.title == "Tab One"
+        source.close(first)
+        await settle()
+        assert list(manager.engines) == [second]
+        assert shown(manager) == second
+    asyncio.run(main())
+
+def test_a_burst_of_events_is_one_read_per_tier():
+    async def main():
+        source = FakeMediaSource()
+        source.set_track('player', "Song", "Artist", duration=200)
+        engine = playback.PlaybackEngine(source, session_id='player')
+        await engine.start()
+        reads, engine_reads = source.reads, engine.source_reads
+        for _ in range(5):
+            source._emit(playback.TIMELINE_EVENT, 'player')
+            source._emit(playback.MEDIA_EVENT, 'player')
+        source._emit(playback.PLAYBACK_EVENT, 'player')
+        # events for another session are not this engine's
+        source._emit(playback.TIMELINE_EVENT, 'other')
+        await settle()
+        assert source.reads - reads == 3
+        assert engine.source_reads - engine_reads == 3
+    asyncio.run(main())
@@ -0,0 +1,15 @@
+import trackid
+
+def test_neighbour_key_reaches_across_a_bucket_edge():
+    stored = trackid.track_key("Song", "Artist", 199.4)
+    assert trackid.track_key("Song", "Artist", 199.6) != stored
+    assert trackid.neighbour_key("Song", "Artist", 199.6) == stored
+    assert trackid.neighbour_key("Song", "Artist", 199.4) == trackid.track_key("Song", "Artist", 199.6)
+
+def test_neighbour_key_stays_within_a_second():
+    assert trackid.neighbour_key("Song", "Artist", 0) is None
+    for duration in (180.0, 180.4, 180.6, 181.0, 181.49, 181.51):
+        keys = {trackid.track_key("Song", "Artist", duration), trackid.neighbour_key("Song", "Artist", duration)}
+        for other in (duration - 1, duration - 0.3, duration + 0.3, duration + 1):
+            assert trackid.track_key("Song", "Artist", other) in keys
+        assert trackid.track_key("Song", "Artist", duration + 3) not in keys
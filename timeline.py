@@ -0,0 +1,135 @@
+import json
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+
+# to_bytes layout: version byte, line count, text byte length, little endian int64 times, the texts joined by
+# newlines and finally the word stamps of enhanced lines as JSON. Version 1 blobs have no text length or words.
+BLOB_VERSION = 2
+BLOB_HEADER = struct.Struct('<BII')
+BLOB_HEADER_V1 = struct.Struct('<BI')
+
+# default budget of the in-process sheet cache, a typical sheet compiles to a few kilobytes
+SHEET_CACHE_BYTES = 4 * 1024 * 1024
+# OrderedDict node, key string and size bookkeeping per cached sheet
+SHEET_ENTRY_OVERHEAD = 200
+
+def line_offsets(buffer, count):
+    # start of every line in the newline joined buffer, plus one past the end of the last line
+    offsets = array('I', [0])
+    if count:
+        offsets.extend(accumulate(len(line) + 1 for line in buffer.split('\n')))
+    return offsets
+
+class LyricTimeline:
+    # A compiled sheet: start times in an int64 array, all line texts in one newline joined string with an
+    # offsets array into it. No per line objects, so a sheet costs its text plus 12 bytes a line.
+    __slots__ = ('times', 'buffer', 'offsets', 'words')
+
+    def __init__(self, lines):
+        # lines are the sorted (ms, text, words) tuples returned by lrcparser
+        self.times = array('q', [line[0] for line in lines])
+        self.buffer = '\n'.join([line[1] for line in lines])
+        self.offsets = line_offsets(self.buffer, len(lines))
+        # word stamps only exist for enhanced lines, keyed by line index
+        self.words = {index: line[2] for index, line in enumerate(lines) if line[2]}
+
+    @classmethod
+    def from_bytes(cls, blob):
+        version = blob[0]
+        if version == 1:
+            _, count = BLOB_HEADER_V1.unpack_from(blob)
+            start = BLOB_HEADER_V1.size
+            text_end = len(blob)
+        elif version == BLOB_VERSION:
+            _, count, text_length = BLOB_HEADER.unpack_from(blob)
+            start = BLOB_HEADER.size
+            text_end = start + count * 8 + text_length
+        else:
+            raise ValueError(f'unsupported timeline blob version {version}')
+        timeline = cls.__new__(cls)
+        timeline.times = array('q')
+        timeline.times.frombytes(blob[start:start + count * 8])
+        if sys.byteorder == 'big':
+            timeline.times.byteswap()
+        timeline.buffer = blob[start + count * 8:text_end].decode('utf-8')
+        timeline.offsets = line_offsets(timeline.buffer, count)
+        timeline.words = {}
+        if text_end < len(blob):
+            timeline.words = {index: tuple((ms, chunk) for ms, chunk in words) for index, words in json.loads(blob[text_end:])}
+        return timeline
+
+    def to_bytes(self):
+        times = array('q', self.times)
+        if sys.byteorder == 'big':
+            times.byteswap()
+        texts = self.buffer.encode('utf-8')
+        blob = BLOB_HEADER.pack(BLOB_VERSION, len(self.times), len(texts)) + times.tobytes() + texts
+        if self.words:
+            blob += json.dumps(sorted(self.words.items())).encode('utf-8')
+        return blob
+
+    def __len__(self):
+        return len(self.times)
+
+    def index_at(self, position_ms):
+        # index of the last line starting at or before position_ms, -1 before the first line
+        return bisect_right(self.times, position_ms) - 1
+
+    def text(self, index):
+        if index < 0:
+            index += len(self.times)
+        return self.buffer[self.offsets[index]:self.offsets[index + 1] - 1]
+
+    def memory_size(self):
+        # bytes held by this sheet, what SheetCache budgets with
+        size = (sys.getsizeof(self) + sys.getsizeof(self.times) + sys.getsizeof(self.offsets)
+                + sys.getsizeof(self.buffer) + sys.getsizeof(self.words))
+        for words in self.words.values():
+            size += sys.getsizeof(words) + sum(sys.getsizeof(word) + sys.getsizeof(word[1]) for word in words)
+        return size
+
+    def ms_until_next(self, position_ms):
+        # milliseconds until the next line boundary, None once the last line has started
+        next_index = bisect_right(self.times, position_ms)
+        if next_index >= len(self.times):
+            return None
+        return self.times[next_index] - position_ms
+
+class SheetCache:
+    # compiled sheets by track key, the least recently used are dropped past max_bytes. Only touched from the
+    # event loop thread, so a replayed track or a session switch gets its sheet without disk, parsing or a thread.
+    def __init__(self, max_bytes=SHEET_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.sheets = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.sheets.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.sheets.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, timeline):
+        size = timeline.memory_size() + sys.getsizeof(key) + SHEET_ENTRY_OVERHEAD
+        old = self.sheets.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        if size > self.max_bytes:
+            return
+        self.sheets[key] = (timeline, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted) = self.sheets.popitem(last=False)
+            self.bytes -= evicted
+
+    def __len__(self):
+        return len(self.sheets)
@@ -0,0 +1,78 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+# Track identity shared by every cache and matcher. Players and lrclib spell the same track differently:
+# "Song - Remastered 2011", "Song (feat. X)", "Artist, X", "Artist - Topic", accents or curly quotes. fold()
+# only evens out case, accents and spacing and is what the matchers and the offline index compare; track_key()
+# also drops version and feature decorations, keeps the first of several artists and buckets the duration, so
+# every variant of one recording lands on one key. A live cut or an edit keeps its own key through its length.
+# The patterns are compiled once and the folded strings are memoized, a key costs a few dict lookups once the
+# player's strings have been seen. Durations a second apart can straddle a bucket edge, so a cache that misses
+# on track_key() also tries neighbour_key().
+
+DURATION_BUCKET = 2
+FOLD_CACHE = 4096
+
+WHITESPACE = re.compile(r'\s+')
+# "’" and friends as typed by some stores, NFKD leaves them alone
+QUOTES = str.maketrans({'‘': "'", '’': "'", 'ʼ': "'", '`': "'", '´': "'", '“': '"', '”': '"'})
+# " - Remastered 2011", "(feat. X)", "[Live]" and similar decorations players add to titles
+TITLE_DECORATION = re.compile(r'\s*(\(.*?\)|\[.*?\]|\s-\s.*$)')
+TITLE_FEATURING = re.compile(r'\s+(feat\.?|ft\.?|featuring)\s.*$')
+ARTIST_FEATURING = re.compile(r'\s+(feat\.?|ft\.?|featuring|with)\s.*$')
+ARTIST_SEPARATOR = re.compile(r'\s*(?:,|&|;|/|\bx\b|\band\b|\be\b|\by\b)\s*')
+# YouTube's auto generated artist channels
+ARTIST_CHANNEL = re.compile(r'\s+-\s+topic$')
+# keys keep letters and digits only, "Uptown Funk!" and "Guns N' Roses" match their plainer spellings
+PUNCTUATION = re.compile(r"[\W_]+")
+
+def normalize(text):
+    return WHITESPACE.sub(' ', (text or '').casefold()).strip()
+
+@lru_cache(maxsize=FOLD_CACHE)
+def fold(text):
+    # normalize and strip accents, for matching names typed differently by players and lrclib
+    text = unicodedata.normalize('NFKD', normalize(text).translate(QUOTES))
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+def clean_title(title):
+    return TITLE_FEATURING.sub('', TITLE_DECORATION.sub('', fold(title))).strip() or fold(title)
+
+def artists(artist):
+    # the separate names of "A, B & C feat. D", the featured one last
+    folded = ARTIST_CHANNEL.sub('', fold(artist))
+    featuring = ARTIST_FEATURING.search(folded)
+    names = ARTIST_SEPARATOR.split(ARTIST_FEATURING.sub('', folded))
+    if featuring:
+        names += ARTIST_SEPARATOR.split(featuring.group(0).split(None, 1)[1])
+    return [name.strip() for name in names if name.strip()]
+
+def primary_artist(artist):
+    return (artists(artist) or [fold(artist)])[0]
+
+def duration_bucket(duration):
+    # durations reported by players and lrclib differ by a second or so
+    return int(round(duration or 0)) // DURATION_BUCKET
+
+@lru_cache(maxsize=FOLD_CACHE)
+def title_key(title):
+    return PUNCTUATION.sub(' ', clean_title(title)).strip()
+
+@lru_cache(maxsize=FOLD_CACHE)
+def artist_key(artist):
+    return PUNCTUATION.sub(' ', primary_artist(artist)).strip()
+
+def track_key(title, artist, duration):
+    return f"{title_key(title)}\x1f{artist_key(artist)}\x1f{duration_bucket(duration)}"
+
+def neighbour_key(title, artist, duration):
+    # the key of the adjacent bucket within a second of duration, 199.4 s and 199.6 s round to either side of
+    # an edge; None when the duration is unknown
+    if not duration:
+        return None
+    bucket = duration_bucket(duration)
+    for near in (duration_bucket(duration - 1), duration_bucket(duration + 1)):
+        if near != bucket:
+            return f"{title_key(title)}\x1f{artist_key(artist)}\x1f{near}"
+    return None
@@ -0,0 +1,73 @@
+import time
+from datetime import datetime, timezone
+from winrt.windows.media.control import GlobalSystemMediaTransportControlsSessionPlaybackStatus as SessionPlaybackStatus
+import winrt.windows.storage.streams as wss
+from eventhandlertry import MediaEventHandler
+import playback
+
+STATUS_NAMES = {
+    SessionPlaybackStatus.PLAYING: playback.PLAYING,
+    SessionPlaybackStatus.PAUSED: playback.PAUSED,
+}
+
+# Tier 1: position and status, plain property reads on the session
+def read_position(session):
+    timeline_properties = session.get_timeline_properties()
+    # the position was sampled at last_updated_time, move that onto the monotonic clock
+    last_updated = timeline_properties.last_updated_time
+    if last_updated.tzinfo is None:
+        last_updated = last_updated.replace(tzinfo=timezone.utc)
+    age = max((datetime.now(timezone.utc) - last_updated).total_seconds(), 0.0)
+    return (timeline_properties.position.total_seconds(),
+            timeline_properties.end_time.total_seconds(),
+            time.monotonic() - age)
+
+def read_status(session):
+    return STATUS_NAMES.get(session.get_playback_info().playback_status, playback.STOPPED)
+
+# Tier 2: text metadata, one async call, the properties object is kept for the artwork tier
+async def read_media_properties(session):
+    return await session.try_get_media_properties_async()
+
+# Tier 3: artwork, read as encoded bytes only when the track identity changes
+async def read_artwork(properties):
+    if not properties.thumbnail:
+        return None
+    stream = await properties.thumbnail.open_read_async()
+    buffer = bytearray(stream.size)
+    reader = wss.DataReader(stream)
+    await reader.load_async(stream.size)
+    reader.read_bytes(buffer)
+    return bytes(buffer)
+
+class WinRTMediaSource(playback.MediaSource):
+    # sessions are named and kept by MediaEventHandler, which drops closed ones on every sessions change
+    def __init__(self):
+        self.handler = None
+
+    @property
+    def sessions(self):
+        return self.handler.sessions
+
+    async def start(self, on_event):
+        self.handler = MediaEventHandler(on_event)
+        await self.handler.initialize()
+
+    def current_session_id(self):
+        return self.handler.current_session_id()
+
+    def session_ids(self):
+        return list(self.handler.sessions)
+
+    async def read_playback(self, session_id):
+        return read_status(self.sessions[session_id])
+
+    async def read_media(self, session_id):
+        properties = await read_media_properties(self.sessions[session_id])
+        return {'title': properties.title, 'artist': properties.artist, 'album_title': properties.album_title}
+
+    async def read_timeline(self, session_id):
+        return read_position(self.sessions[session_id])
+
+    async def read_artwork(self, session_id):
+        return await read_artwork(await read_media_properties(self.sessions[session_id]))